@@ -0,0 +1,138 @@
+"""Сериализация моделей в словари для JSON API.
+
+Поля описываются вместе с тем, что им нужно от базы: колонками для
+only() и связями для select_related(). Поэтому при выборке части полей
+(?fields=) запрос читает только нужные колонки, а связанные авторы и
+группы приходят тем же запросом.
+"""
+from collections import namedtuple
+
+Field = namedtuple('Field', 'get columns related')
+
+
+def field(get, columns=(), related=()):
+    return Field(get, tuple(columns), tuple(related))
+
+
+def user_data(user):
+    return {'username': user.username, 'name': user.get_full_name()}
+
+
+def group_data(group):
+    if group is None:
+        return None
+    return {'slug': group.slug, 'title': group.title}
+
+
+class InvalidFields(ValueError):
+    pass
+
+
+class Serializer:
+    fields = {}
+    # Колонки, которые нужны всегда: ключ и поля курсора.
+    required = ('id',)
+
+    def __init__(self, fields=None):
+        if not fields:
+            self.selected = list(self.fields)
+            return
+        names = [name for name in fields.split(',') if name]
+        unknown = [name for name in names if name not in self.fields]
+        if unknown:
+            raise InvalidFields(', '.join(unknown))
+        self.selected = names
+
+    def prepare(self, queryset):
+        """Ограничивает выборку колонками и связями выбранных полей."""
+        columns = list(self.required)
+        related = []
+        for name in self.selected:
+            columns.extend(self.fields[name].columns)
+            related.extend(self.fields[name].related)
+        if related:
+            queryset = queryset.select_related(*related)
+        return queryset.only(*columns)
+
+    def to_dict(self, obj):
+        return {name: self.fields[name].get(obj) for name in self.selected}
+
+    def many(self, objects):
+        return [self.to_dict(obj) for obj in objects]
+
+
+USER_COLUMNS = ('username', 'first_name', 'last_name')
+
+
+def related_columns(relation, columns):
+    return [f'{relation}__{column}' for column in columns]
+
+
+class PostSerializer(Serializer):
+    required = ('id', 'pub_date')
+    fields = {
+        'id': field(lambda post: post.pk),
+        'text': field(lambda post: post.text, ['text']),
+        'pub_date': field(lambda post: post.pub_date),
+        'author': field(
+            lambda post: user_data(post.author),
+            ['author', *related_columns('author', USER_COLUMNS)],
+            ['author'],
+        ),
+        'group': field(
+            lambda post: group_data(post.group),
+            ['group', *related_columns('group', ('slug', 'title'))],
+            ['group'],
+        ),
+        'image': field(
+            lambda post: post.image.url if post.image else None, ['image']
+        ),
+        'comments_count': field(
+            lambda post: post.comments_count, ['comments_count']
+        ),
+    }
+
+
+class GroupSerializer(Serializer):
+    fields = {
+        'id': field(lambda group: group.pk),
+        'slug': field(lambda group: group.slug, ['slug']),
+        'title': field(lambda group: group.title, ['title']),
+        'description': field(
+            lambda group: group.description, ['description']
+        ),
+        'posts_count': field(
+            lambda group: group.posts_count, ['posts_count']
+        ),
+    }
+
+
+class CommentSerializer(Serializer):
+    required = ('id', 'created')
+    fields = {
+        'id': field(lambda comment: comment.pk),
+        'post': field(lambda comment: comment.post_id, ['post']),
+        'text': field(lambda comment: comment.text, ['text']),
+        'created': field(lambda comment: comment.created),
+        'author': field(
+            lambda comment: user_data(comment.author),
+            ['author', *related_columns('author', USER_COLUMNS)],
+            ['author'],
+        ),
+    }
+
+
+class FollowSerializer(Serializer):
+    fields = {
+        'id': field(lambda follow: follow.pk),
+        'user': field(
+            lambda follow: user_data(follow.user),
+            ['user', *related_columns('user', USER_COLUMNS)],
+            ['user'],
+        ),
+        'author': field(
+            lambda follow: user_data(follow.author),
+            ['author', *related_columns('author', USER_COLUMNS)],
+            ['author'],
+        ),
+    }
@@ -0,0 +1,227 @@
+import datetime
+from io import StringIO
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import DatabaseError
+from django.test import Client, TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.encoding import force_bytes
+from django.utils.http import urlsafe_base64_encode
+
+from posts.models import Change, Comment, Follow, Group, Post
+
+User = get_user_model()
+
+ALL_POSTS = 25
+
+
+@override_settings(QUERY_BUDGET_MODE='raise')
+class ApiTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(
+            username='auth', first_name='Лев', last_name='Толстой'
+        )
+        cls.reader = User.objects.create_user(username='reader')
+        cls.group = Group.objects.create(
+            title='test',
+            slug='test',
+            description='test',
+        )
+        for i in range(ALL_POSTS):
+            Post.objects.create(
+                author=cls.user,
+                text=f'post {i}',
+                group=None if i % 2 else cls.group,
+            )
+        cls.post = Post.objects.latest('pk')
+        Comment.objects.create(post=cls.post, author=cls.reader, text='c')
+        Follow.objects.create(user=cls.reader, author=cls.user)
+
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+
+    def get(self, name, **params):
+        kwargs = params.pop('kwargs', {})
+        return self.client.get(reverse(f'api:v1:{name}', kwargs=kwargs),
+                               params)
+
+    def test_posts_cursor_pages(self):
+        """Лента листается курсорами без повторов и пропусков."""
+        response = self.get('posts')
+        data = response.json()
+        self.assertEqual(len(data['results']), 20)
+        self.assertEqual(data['results'][0]['text'], f'post {ALL_POSTS - 1}')
+        self.assertIsNone(data['previous'])
+        data = self.get('posts', before=data['next']).json()
+        self.assertEqual(len(data['results']), ALL_POSTS - 20)
+        self.assertIsNone(data['next'])
+        self.assertEqual(data['results'][-1]['text'], 'post 0')
+
+    def test_sparse_fields(self):
+        """fields= оставляет только запрошенные поля."""
+        data = self.get('posts', fields='id,author', limit=1).json()
+        self.assertEqual(data['results'], [{
+            'id': self.post.pk,
+            'author': {'username': 'auth', 'name': 'Лев Толстой'},
+        }])
+        response = self.get('posts', fields='id,password')
+        self.assertEqual(response.status_code, 400)
+
+    def test_fixed_number_of_queries(self):
+        """Авторы и группы приходят тем же запросом, что и посты."""
+        with self.assertNumQueries(1):
+            self.get('posts', limit=100)
+        # Плюс поиск группы по slug для ETag и для самой ленты.
+        with self.assertNumQueries(3):
+            self.get('group_posts', kwargs={'slug': self.group.slug},
+                     limit=100)
+
+    def test_sparse_fields_queries(self):
+        """Часть полей читается тем же одним запросом."""
+        for fields in ('text', 'id,group', 'author,image'):
+            with self.subTest(fields=fields), self.assertNumQueries(1):
+                self.get('posts', fields=fields, limit=100)
+        self.client.force_login(self.reader)
+        for fields in ('id', 'text,author'):
+            with self.subTest(fields=fields):
+                response = self.get('follow_posts', fields=fields, limit=100)
+                self.assertEqual(len(response.json()['results']), ALL_POSTS)
+
+    def test_ids_out_of_range(self):
+        """Огромные id в курсорах — битые курсоры, а не ошибка 500."""
+        huge = '9' * 30
+        cursor = urlsafe_base64_encode(
+            force_bytes(f'2022-01-01T00:00:00+00:00|{huge}')
+        )
+        response = self.get('posts', before=cursor)
+        self.assertEqual(len(response.json()['results']), 20)
+        response = self.get('post_comments', after=cursor,
+                            kwargs={'post_id': self.post.pk})
+        self.assertEqual(len(response.json()['results']), 1)
+        response = self.get('groups', after=huge)
+        self.assertEqual(len(response.json()['results']), 1)
+        response = self.client.get(reverse('api:v1:changes'),
+                                   {'since': huge})
+        self.assertEqual(response.status_code, 400)
+
+    def test_detail_and_related_lists(self):
+        """Пост, комментарии, группы и подписки."""
+        data = self.get('post', kwargs={'post_id': self.post.pk}).json()
+        self.assertEqual(data['group'], {'slug': 'test', 'title': 'test'})
+        self.assertEqual(data['comments_count'], 1)
+        data = self.get('post_comments',
+                        kwargs={'post_id': self.post.pk}).json()
+        self.assertEqual(data['results'][0]['author']['username'], 'reader')
+        data = self.get('groups').json()
+        self.assertEqual(data['results'][0]['posts_count'], 13)
+        data = self.get('user_follows', kwargs={'username': 'reader'}).json()
+        self.assertEqual(data['results'][0]['author']['username'], 'auth')
+        response = self.get('post', kwargs={'post_id': 0})
+        self.assertEqual(response.json(), {'error': 'Не найдено'})
+
+    def test_follow_posts(self):
+        """Лента подписок только для вошедших."""
+        self.assertEqual(self.get('follow_posts').status_code, 401)
+        self.client.force_login(self.reader)
+        data = self.get('follow_posts', fields='id').json()
+        self.assertEqual(data['results'][0], {'id': self.post.pk})
+
+    @override_settings(FEED_FANOUT_LIMIT=0)
+    def test_follow_posts_pull_author(self):
+        """Посты pull-автора читаются в пределах бюджета ленты."""
+        self.client.force_login(self.reader)
+        data = self.get('follow_posts', fields='id', limit=100).json()
+        self.assertEqual(len(data['results']), ALL_POSTS)
+
+
+@override_settings(CHANGES_SETTLE_SECONDS=0)
+class ChangesTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='auth')
+        cls.reader = User.objects.create_user(username='reader')
+        cls.group = Group.objects.create(title='g', slug='g', description='g')
+        cls.group_2 = Group.objects.create(
+            title='g2', slug='g2', description='g2'
+        )
+        Follow.objects.create(user=cls.reader, author=cls.user)
+
+    def setUp(self):
+        self.client = Client()
+        self.client.force_login(self.reader)
+
+    def changes(self, **params):
+        return self.client.get(reverse('api:v1:changes'), params).json()
+
+    def test_changes_since(self):
+        """Отдаются только изменения после номера клиента."""
+        post = Post.objects.create(author=self.user, text='a',
+                                   group=self.group)
+        since = self.changes()['since']
+        post.text = 'b'
+        post.group = self.group_2
+        post.save()
+        Comment.objects.create(post=post, author=self.reader, text='c')
+        data = self.changes(since=since)
+        self.assertEqual(
+            [change['kind'] for change in data['changes']],
+            ['post_removed', 'post_updated', 'comment_created']
+        )
+        self.assertFalse(data['has_more'])
+        data = self.changes(since=data['since'])
+        self.assertEqual(data['changes'], [])
+        post_id = post.pk
+        post.delete()
+        data = self.changes(since=data['since'])
+        self.assertEqual(data['changes'][0]['kind'], 'post_deleted')
+        self.assertEqual(data['changes'][0]['post'], post_id)
+
+    def test_feed_filters(self):
+        """Изменения группы и ленты подписок выбираются отдельно."""
+        Post.objects.create(author=self.user, text='a', group=self.group)
+        Post.objects.create(author=self.reader, text='b', group=self.group_2)
+        group = self.changes(feed='group', group='g2')['changes']
+        self.assertEqual(len(group), 1)
+        follow = self.changes(feed='follow')['changes']
+        self.assertEqual(len(follow), 1)
+        self.assertNotEqual(group[0]['post'], follow[0]['post'])
+        self.assertEqual(len(self.changes(limit=1)['changes']), 1)
+        self.assertTrue(self.changes(limit=1)['has_more'])
+
+    @override_settings(CHANGES_RETENTION_DAYS=0)
+    def test_pruned_changes_reset(self):
+        """После очистки журнала отставший клиент получает reset."""
+        Post.objects.create(author=self.user, text='a')
+        since = self.changes()['since']
+        Post.objects.create(author=self.user, text='b')
+        Post.objects.create(author=self.user, text='c')
+        self.assertFalse(self.changes(since=since)['reset'])
+        Change.objects.update(
+            created=timezone.now() - datetime.timedelta(days=1)
+        )
+        out = StringIO()
+        call_command('prune_changes', stdout=out)
+        self.assertIn('удалено: 3', out.getvalue())
+        Post.objects.create(author=self.user, text='d')
+        self.assertTrue(self.changes(since=since)['reset'])
+
+    def test_change_rolled_back_with_write(self):
+        """Запись и её строка в журнале фиксируются вместе."""
+        with mock.patch('posts.changes.record', side_effect=DatabaseError):
+            with self.assertRaises(DatabaseError):
+                Post.objects.create(author=self.user, text='a')
+        self.assertFalse(Post.objects.filter(text='a').exists())
+
+    @override_settings(CHANGES_SETTLE_SECONDS=60)
+    def test_fresh_changes_held_back(self):
+        """Ещё не устоявшиеся изменения не отдаются."""
+        Post.objects.create(author=self.user, text='a')
+        self.assertEqual(self.changes()['changes'], [])
@@ -0,0 +1,204 @@
+from functools import partial, wraps
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.http import Http404, JsonResponse
+from django.shortcuts import get_object_or_404
+from django.views.decorators.http import require_GET
+
+from core.queries import query_budget
+from posts import changes as feed_changes, feed_cache
+from posts.feeds import FollowPaginator, follow_feed, pulled_authors
+from posts.models import Comment, Follow, Group, Post
+from posts.paginators import CursorPaginator, next_batch, parse_id
+from posts.views import group_feeds, profile_feeds
+
+from .serializers import (CommentSerializer, FollowSerializer,
+                          GroupSerializer, InvalidFields, PostSerializer)
+
+User = get_user_model()
+
+
+def error(message, status):
+    return JsonResponse({'error': message}, status=status)
+
+
+def api_view(view):
+    """Только GET, ошибки — в JSON, а не HTML-страницами."""
+    @require_GET
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        try:
+            return view(request, *args, **kwargs)
+        except InvalidFields as exc:
+            return error(f'Неизвестные поля: {exc}', 400)
+        except Http404:
+            return error('Не найдено', 404)
+    return wrapper
+
+
+def page_size(request):
+    try:
+        limit = int(request.GET.get('limit', settings.API_PAGE_SIZE))
+    except ValueError:
+        limit = settings.API_PAGE_SIZE
+    return max(1, min(limit, settings.API_MAX_PAGE_SIZE))
+
+
+def post_page(request, posts, paginator_class=CursorPaginator):
+    """Страница ленты с курсорами, как у HTML-лент."""
+    serializer = PostSerializer(request.GET.get('fields'))
+    paginator = paginator_class(serializer.prepare(posts), page_size(request))
+    page = paginator.get_page(
+        before=request.GET.get('before'),
+        after=request.GET.get('after'),
+        date=request.GET.get('date'),
+    )
+    return JsonResponse({
+        'results': serializer.many(page),
+        'next': paginator.next_cursor,
+        'previous': paginator.previous_cursor,
+    })
+
+
+def id_page(request, queryset, serializer):
+    """Страница списка по возрастанию id после курсора ?after=<id>."""
+    limit = page_size(request)
+    queryset = serializer.prepare(queryset).order_by('pk')
+    after = parse_id(request.GET.get('after'))
+    if after is not None:
+        queryset = queryset.filter(pk__gt=after)
+    items = list(queryset[:limit + 1])
+    next_cursor = items[limit - 1].pk if len(items) > limit else None
+    return JsonResponse({
+        'results': serializer.many(items[:limit]),
+        'next': next_cursor,
+    })
+
+
+@api_view
+@query_budget(2)
+@feed_cache.conditional(lambda request: ['index'])
+def posts(request):
+    return post_page(request, Post.objects.all())
+
+
+@api_view
+@query_budget(1)
+def post(request, post_id):
+    serializer = PostSerializer(request.GET.get('fields'))
+    return JsonResponse(serializer.to_dict(
+        get_object_or_404(serializer.prepare(Post.objects), pk=post_id)
+    ))
+
+
+@api_view
+@query_budget(2)
+def post_comments(request, post_id):
+    get_object_or_404(Post.objects.only('pk'), pk=post_id)
+    serializer = CommentSerializer(request.GET.get('fields'))
+    comments, next_cursor = next_batch(
+        serializer.prepare(Comment.objects.filter(post=post_id)),
+        'created', request.GET.get('after'), page_size(request)
+    )
+    return JsonResponse({
+        'results': serializer.many(comments),
+        'next': next_cursor,
+    })
+
+
+@api_view
+@query_budget(1)
+def groups(request):
+    return id_page(
+        request, Group.objects.all(),
+        GroupSerializer(request.GET.get('fields'))
+    )
+
+
+@api_view
+@query_budget(1)
+def group(request, slug):
+    serializer = GroupSerializer(request.GET.get('fields'))
+    return JsonResponse(serializer.to_dict(
+        get_object_or_404(serializer.prepare(Group.objects), slug=slug)
+    ))
+
+
+@api_view
+@query_budget(3)
+@feed_cache.conditional(group_feeds)
+def group_posts(request, slug):
+    group = get_object_or_404(Group.objects.only('pk'), slug=slug)
+    return post_page(request, group.posts.all())
+
+
+@api_view
+@query_budget(5)
+@feed_cache.conditional(profile_feeds)
+def user_posts(request, username):
+    author = get_object_or_404(User.objects.only('pk'), username=username)
+    return post_page(request, author.posts.all())
+
+
+@api_view
+@query_budget(2)
+def user_follows(request, username):
+    """На кого подписан пользователь."""
+    user = get_object_or_404(User.objects.only('pk'), username=username)
+    return id_page(
+        request, Follow.objects.filter(user=user),
+        FollowSerializer(request.GET.get('fields'))
+    )
+
+
+@api_view
+@query_budget(7)
+def follow_posts(request):
+    if not request.user.is_authenticated:
+        return error('Нужно войти', 401)
+    pulled = pulled_authors(request.user)
+    return post_page(
+        request, follow_feed(request.user, pulled),
+        partial(FollowPaginator, user=request.user, pulled=pulled),
+    )
+
+
+@api_view
+@query_budget(4)
+def changes(request):
+    """Изменения ленты после номера ?since=: feed=index, group (вместе
+    с ?group=<slug>) или follow. reset: true — часть изменений после
+    since уже удалена из журнала, ленту нужно загрузить заново."""
+    feed = request.GET.get('feed', 'index')
+    if feed == 'group':
+        feed = get_object_or_404(
+            Group.objects.only('pk'), slug=request.GET.get('group')
+        ).pk
+    elif feed == 'follow':
+        if not request.user.is_authenticated:
+            return error('Нужно войти', 401)
+    elif feed != 'index':
+        return error('Неизвестная лента', 400)
+    since = parse_id(request.GET.get('since', '0'))
+    if since is None:
+        return error('since должен быть номером изменения', 400)
+    items, has_more = feed_changes.since(
+        feed_changes.for_feed(feed, request.user),
+        since, page_size(request)
+    )
+    return JsonResponse({
+        'changes': [
+            {
+                'seq': change.pk,
+                'kind': change.kind,
+                'post': change.post_id,
+                'comment': change.comment_id,
+                'created': change.created,
+            }
+            for change in items
+        ],
+        'since': items[-1].pk if items else since,
+        'has_more': has_more,
+        'reset': feed_changes.pruned_after(since),
+    })
@@ -0,0 +1,27 @@
+"""Пользователь из кеша вместо запроса к auth_user на каждый запрос.
+
+Кешированный пользователь сбрасывается при любом сохранении и удалении
+(смена пароля, правка профиля, вход), поэтому проверка хеша пароля в
+сессии видит новый пароль сразу.
+"""
+from django.conf import settings
+from django.contrib.auth.backends import ModelBackend
+from django.core.cache import cache
+
+USER_KEY = 'auth_user:{}'
+
+
+def forget_user(user_id):
+    cache.delete(USER_KEY.format(user_id))
+
+
+class CachedModelBackend(ModelBackend):
+    def get_user(self, user_id):
+        key = USER_KEY.format(user_id)
+        user = cache.get(key)
+        if user is None:
+            user = super().get_user(user_id)
+            if user is None:
+                return None
+            cache.set(key, user, settings.AUTH_USER_CACHE_TIMEOUT)
+        return user if self.user_can_authenticate(user) else None
@@ -0,0 +1,315 @@
+"""Двухуровневый кеш: LRU в памяти процесса поверх общего файлового кеша.
+
+L1 — небольшой LRU внутри процесса, L2 — FileBasedCache в общем
+каталоге, который видят все воркеры на машине. Чтобы запись в одном
+воркере сбрасывала L1 в остальных, у каждого ключа есть штамп версии в
+общей памяти (mmap-файл): запись в L2 меняет штамп, а значение из L1
+отдаётся только пока его штамп совпадает с текущим. Проверка штампа —
+чтение восьми байт из памяти, без обращения к диску.
+
+L2 ограничен MAX_ENTRIES живых ключей. FileBasedCache проверяет предел
+перед каждой записью, перечисляя весь каталог, — O(число ключей) на
+set(). Здесь проверка идёт раз в CULL_EVERY записей процесса: сначала
+удаляются истёкшие файлы, и только если живых ключей всё ещё не меньше
+MAX_ENTRIES, — случайная 1/CULL_FREQUENCY часть. Между проверками
+каталог может вырасти на CULL_EVERY ключей на процесс. Вытесненный ключ
+ещё до L1_TIMEOUT секунд может читаться из L1 других процессов.
+
+Ключи с префиксами из KEEP_PREFIXES — состояние, потеря которого
+заметна пользователям (сессии, корзины ограничения частоты), — лежат в
+подкаталоге keep. Они не входят в MAX_ENTRIES и не вытесняются: при
+проверке оттуда удаляются только истёкшие. clear() очищает и их.
+
+Пример настройки::
+
+    CACHES = {
+        'default': {
+            'BACKEND': 'core.cache.TieredCache',
+            'LOCATION': '/var/tmp/yatube_cache',
+            'OPTIONS': {
+                'L1_MAX_ENTRIES': 1000, 'L1_TIMEOUT': 60,
+                'MAX_ENTRIES': 200000, 'CULL_FREQUENCY': 10,
+                'CULL_EVERY': 1000, 'KEEP_PREFIXES': ['ratelimit:'],
+            },
+        }
+    }
+"""
+import glob
+import itertools
+import mmap
+import os
+import pickle
+import random
+import struct
+import threading
+import time
+import zlib
+from collections import Counter, OrderedDict
+
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+from django.core.cache.backends.filebased import FileBasedCache
+from django.core.files import locks
+
+STAMP = struct.Struct('<Q')
+
+# Как и у LocMemCache, L1 общий для всех потоков процесса.
+_l1_stores = {}
+_l1_locks = {}
+_stats = {}
+_stamp_tables = {}
+_writes = {}
+
+
+def new_stamp():
+    # os.urandom, а не random: после fork у воркеров одинаковое состояние
+    # генератора, и совпавшие штампы скрыли бы запись соседа.
+    return STAMP.unpack(os.urandom(STAMP.size))[0]
+
+
+class StampTable:
+    """Таблица штампов в общей памяти.
+
+    Ключи хешируются в фиксированное число слотов; совпадение слотов
+    приводит лишь к лишнему промаху L1. Слот 0 — эпоха, её меняет clear().
+    """
+
+    def __init__(self, path, slots):
+        self.slots = slots
+        size = (slots + 1) * STAMP.size
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            if os.fstat(fd).st_size < size:
+                os.ftruncate(fd, size)
+            self._map = mmap.mmap(fd, size)
+        finally:
+            os.close(fd)
+
+    def _offset(self, key):
+        return (zlib.crc32(key.encode()) % self.slots + 1) * STAMP.size
+
+    def read(self, key):
+        return (
+            STAMP.unpack_from(self._map, 0)[0],
+            STAMP.unpack_from(self._map, self._offset(key))[0],
+        )
+
+    def bump(self, key):
+        STAMP.pack_into(self._map, self._offset(key), new_stamp())
+
+    def bump_epoch(self):
+        STAMP.pack_into(self._map, 0, new_stamp())
+
+
+class _FileLock:
+    def __init__(self, path):
+        self._path = path
+
+    def __enter__(self):
+        self._file = open(self._path, 'ab')
+        locks.lock(self._file, locks.LOCK_EX)
+
+    def __exit__(self, *exc_info):
+        locks.unlock(self._file)
+        self._file.close()
+
+
+class FileCache(FileBasedCache):
+    """L2: файловый кеш, который проверяет MAX_ENTRIES не при каждой
+    записи, вытесняет сначала истёкшие ключи и не вытесняет ключи с
+    префиксами keep_prefixes."""
+
+    def __init__(self, location, params, cull_every, keep_prefixes=()):
+        # Каталог создаётся уже в FileBasedCache.__init__().
+        self._keep_dir = os.path.join(os.path.abspath(location), 'keep')
+        super().__init__(location, params)
+        self._cull_every = cull_every
+        self._writes = _writes.setdefault(location, itertools.count(1))
+        self._keep_prefixes = tuple(keep_prefixes)
+
+    def _createdir(self):
+        super()._createdir()
+        os.makedirs(self._keep_dir, 0o700, exist_ok=True)
+
+    def _key_to_file(self, key, version=None):
+        fname = super()._key_to_file(key, version)
+        if self._keep_prefixes and key.startswith(self._keep_prefixes):
+            return os.path.join(self._keep_dir, os.path.basename(fname))
+        return fname
+
+    def _list_kept_files(self):
+        return glob.glob(
+            os.path.join(self._keep_dir, '*' + self.cache_suffix)
+        )
+
+    def _live_files(self, fnames):
+        """Живые файлы из fnames; истёкшие удаляются по пути."""
+        live = []
+        for fname in fnames:
+            try:
+                with open(fname, 'rb') as f:
+                    if not self._is_expired(f):
+                        live.append(fname)
+            except FileNotFoundError:
+                pass
+        return live
+
+    def _cull(self):
+        if next(self._writes) % self._cull_every:
+            return
+        self._live_files(self._list_kept_files())
+        live = self._live_files(self._list_cache_files())
+        if len(live) < self._max_entries:
+            return
+        if self._cull_frequency == 0:
+            return super().clear()
+        for fname in random.sample(live, len(live) // self._cull_frequency):
+            self._delete(fname)
+
+    def clear(self):
+        super().clear()
+        for fname in self._list_kept_files():
+            self._delete(fname)
+
+
+class TieredCache(BaseCache):
+    pickle_protocol = pickle.HIGHEST_PROTOCOL
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = dict(params.get('OPTIONS', {}))
+        self._l1_max_entries = int(options.pop('L1_MAX_ENTRIES', 1000))
+        self._l1_timeout = int(options.pop('L1_TIMEOUT', 60))
+        slots = int(options.pop('STAMP_SLOTS', 65536))
+        cull_every = int(options.pop('CULL_EVERY', 1000))
+        keep_prefixes = options.pop('KEEP_PREFIXES', ())
+        self._l2 = FileCache(
+            location, {**params, 'OPTIONS': options}, cull_every,
+            keep_prefixes
+        )
+        self._dir = os.path.abspath(location)
+        self._l1 = _l1_stores.setdefault(location, OrderedDict())
+        self._lock = _l1_locks.setdefault(location, threading.Lock())
+        self.stats = _stats.setdefault(location, Counter())
+        if location not in _stamp_tables:
+            _stamp_tables[location] = StampTable(
+                os.path.join(self._dir, 'stamps.bin'), slots
+            )
+        self._stamps = _stamp_tables[location]
+
+    def _l1_get(self, key, stamp):
+        with self._lock:
+            entry = self._l1.get(key)
+            if entry is None:
+                return None
+            pickled, expires, entry_stamp = entry
+            if entry_stamp != stamp or expires <= time.time():
+                del self._l1[key]
+                return None
+            self._l1.move_to_end(key)
+        return pickled
+
+    def _l1_set(self, key, value, stamp, expires):
+        # Значение в L1 попадает только при чтении: штамп читается до
+        # значения из L2, поэтому запись соседа между ними лишь даст
+        # лишний промах, а не устаревшее значение.
+        l1_expires = time.time() + self._l1_timeout
+        if expires is None or expires > l1_expires:
+            expires = l1_expires
+        pickled = pickle.dumps(value, self.pickle_protocol)
+        with self._lock:
+            self._l1[key] = (pickled, expires, stamp)
+            self._l1.move_to_end(key)
+            while len(self._l1) > self._l1_max_entries:
+                self._l1.popitem(last=False)
+
+    def _l1_delete(self, key):
+        with self._lock:
+            self._l1.pop(key, None)
+
+    def _locked(self):
+        """Межпроцессная блокировка для add() и incr()."""
+        return _FileLock(os.path.join(self._dir, 'lock'))
+
+    def get(self, key, default=None, version=None):
+        full_key = self.make_key(key, version=version)
+        self.validate_key(full_key)
+        stamp = self._stamps.read(full_key)
+        pickled = self._l1_get(full_key, stamp)
+        if pickled is not None:
+            self.stats['l1_hits'] += 1
+            return pickle.loads(pickled)
+        found, value, expires = self._l2_get(key, version)
+        if not found:
+            self.stats['misses'] += 1
+            return default
+        self.stats['l2_hits'] += 1
+        self._l1_set(full_key, value, stamp, expires)
+        return value
+
+    def _l2_get(self, key, version):
+        """Значение из L2 вместе со сроком его жизни."""
+        fname = self._l2._key_to_file(key, version)
+        try:
+            with open(fname, 'rb') as f:
+                expires = pickle.load(f)
+                if expires is not None and expires < time.time():
+                    return False, None, None
+                return True, pickle.loads(zlib.decompress(f.read())), expires
+        except FileNotFoundError:
+            return False, None, None
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        full_key = self.make_key(key, version=version)
+        self.validate_key(full_key)
+        self._l2.set(key, value, timeout, version=version)
+        self._stamps.bump(full_key)
+        self._l1_delete(full_key)
+        self.stats['sets'] += 1
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        with self._locked():
+            if self._l2.has_key(key, version=version):
+                return False
+            self.set(key, value, timeout, version=version)
+        return True
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        return self._l2.touch(key, timeout, version=version)
+
+    def delete(self, key, version=None):
+        full_key = self.make_key(key, version=version)
+        self.validate_key(full_key)
+        self._l2.delete(key, version=version)
+        self._stamps.bump(full_key)
+        self._l1_delete(full_key)
+
+    def has_key(self, key, version=None):
+        full_key = self.make_key(key, version=version)
+        self.validate_key(full_key)
+        stamp = self._stamps.read(full_key)
+        if self._l1_get(full_key, stamp) is not None:
+            return True
+        return self._l2.has_key(key, version=version)
+
+    def incr(self, key, delta=1, version=None):
+        """Атомарно для всех процессов, которые делят каталог L2."""
+        with self._locked():
+            found, value, expires = self._l2_get(key, version)
+            if not found:
+                raise ValueError("Key '%s' not found" % key)
+            value += delta
+            # Оставшееся время жизни сохраняется: incr() ключ не продлевает.
+            timeout = None
+            if expires is not None:
+                timeout = max(expires - time.time(), 1)
+            full_key = self.make_key(key, version=version)
+            self._l2.set(key, value, timeout, version=version)
+            self._stamps.bump(full_key)
+            self._l1_delete(full_key)
+        return value
+
+    def clear(self):
+        self._l2.clear()
+        self._stamps.bump_epoch()
+        with self._lock:
+            self._l1.clear()
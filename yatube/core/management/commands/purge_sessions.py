@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+
+from core.sessions import purge_expired
+
+
+class Command(BaseCommand):
+    help = 'Удаляет истёкшие сессии из базы пачками.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=5000,
+            help='Сколько сессий удалять одним запросом.'
+        )
+        parser.add_argument(
+            '--pause', type=float, default=0,
+            help='Пауза между пачками в секундах.'
+        )
+
+    def handle(self, *args, **options):
+        total = 0
+        for count in purge_expired(options['batch_size'], options['pause']):
+            total += count
+            self.stdout.write(f'Удалено сессий: {total}')
+        self.stdout.write(self.style.SUCCESS(
+            f'Истёкшие сессии удалены: {total}.'
+        ))
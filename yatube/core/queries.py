@@ -0,0 +1,116 @@
+"""Учёт SQL-запросов: бюджеты запросов для view и поиск N+1."""
+import logging
+import re
+import time
+from collections import Counter
+from contextlib import ExitStack, contextmanager
+
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+IN_LIST = re.compile(r'\(\s*%s(?:\s*,\s*%s)*\s*\)')
+NUMBER = re.compile(r'\b\d+\b')
+
+
+class QueryBudgetExceeded(Exception):
+    pass
+
+
+def query_budget(limit):
+    """Объявляет, сколько SQL-запросов может сделать view.
+
+    Число не должно зависеть от размера страницы: если запросов больше,
+    скорее всего, связанные объекты подгружаются по одному.
+    """
+    def decorator(view_func):
+        view_func.query_budget = limit
+        return view_func
+    return decorator
+
+
+def query_shape(sql):
+    """SQL без конкретных значений: одинаковые формы — кандидаты в N+1."""
+    return NUMBER.sub('?', IN_LIST.sub('(...)', sql))
+
+
+class QueryRecorder:
+    """Запоминает SQL и время выполнения всех запросов во всех базах."""
+
+    def __init__(self):
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries.append((sql, time.perf_counter() - start))
+
+    @contextmanager
+    def record(self):
+        with ExitStack() as stack:
+            for alias in connections:
+                stack.enter_context(
+                    connections[alias].execute_wrapper(self)
+                )
+            yield self
+
+    @property
+    def count(self):
+        return len(self.queries)
+
+    @property
+    def duration(self):
+        return sum(duration for sql, duration in self.queries)
+
+    def repeated(self, threshold):
+        """Формы запросов, выполненные не меньше threshold раз."""
+        shapes = Counter(query_shape(sql) for sql, duration in self.queries)
+        return {
+            shape: count for shape, count in shapes.items()
+            if count >= threshold
+        }
+
+    def problems(self, budget):
+        problems = []
+        if budget is not None and self.count > budget:
+            problems.append(
+                f'{self.count} SQL-запросов при бюджете {budget}'
+            )
+        repeated = self.repeated(settings.QUERY_REPEAT_THRESHOLD)
+        for shape, count in repeated.items():
+            problems.append(f'N+1: {count} раз {shape}')
+        return problems
+
+
+class QueryBudgetMiddleware:
+    """Считает запросы каждого HTTP-запроса и проверяет бюджет view.
+
+    QUERY_BUDGET_MODE: 'off' — не считать, 'warn' — писать в лог,
+    'raise' — бросать QueryBudgetExceeded (для тестов).
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        mode = settings.QUERY_BUDGET_MODE
+        if mode == 'off':
+            return self.get_response(request)
+        request.queries = QueryRecorder()
+        with request.queries.record():
+            response = self.get_response(request)
+        problems = request.queries.problems(
+            getattr(request, 'query_budget', None)
+        )
+        if problems:
+            message = f'{request.path}: ' + '; '.join(problems)
+            if mode == 'raise':
+                raise QueryBudgetExceeded(message)
+            logger.warning(message)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request.query_budget = getattr(view_func, 'query_budget', None)
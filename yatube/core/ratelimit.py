@@ -0,0 +1,111 @@
+"""Ограничение частоты записей: корзины токенов в общем кеше.
+
+Префикс ключей корзин входит в KEEP_PREFIXES кеша (см. core/cache.py):
+иначе поток записей вытеснял бы корзины и обнулял лимиты.
+
+Корзина хранится одним числом — моментом (в миллисекундах), когда она
+снова наполнится (GCRA). Каждый запрос атомарно прибавляет к нему
+интервал одного токена через cache.incr(); если момент ушёл дальше
+ёмкости корзины от текущего времени, запрос отклоняется, а токен
+возвращается. Отклонение стоит нескольких обращений к кешу и не трогает
+базу.
+
+Лимиты задаются в settings.RATE_LIMITS по имени view::
+
+    RATE_LIMITS = {
+        'add_comment': {'user': (20, 600), 'ip': (60, 600)},
+    }
+
+(20, 600) — не больше 20 запросов подряд, корзина целиком наполняется
+за 600 секунд.
+
+IP клиента — REMOTE_ADDR. За прокси, где REMOTE_ADDR у всех клиентов
+один, в RATE_LIMIT_IP_META указывается заголовок, который выставляет
+прокси. Без прокси заголовку доверять нельзя: клиент прислал бы новый
+адрес в каждом запросе и получал бы новую корзину.
+
+Корзина пользователя проверяется первой: отклонённый по ней запрос
+не заводит корзину для своего IP.
+"""
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse
+
+BUCKET_KEY = 'ratelimit:{}:{}:{}'
+
+
+def now_ms():
+    return int(time.time() * 1000)
+
+
+def take(key, capacity, period):
+    """Берёт токен из корзины; возвращает 0 или через сколько секунд
+    токен появится."""
+    interval = period * 1000 // capacity
+    burst = interval * capacity
+    timeout = burst // 1000 + 1
+    now = now_ms()
+    if cache.add(key, now + interval, timeout):
+        return 0
+    try:
+        ready = cache.incr(key, interval)
+    except ValueError:
+        # Ключ истёк между add() и incr(): корзина полна.
+        cache.set(key, now + interval, timeout)
+        return 0
+    if ready < now + interval:
+        # Корзина простаивала и наполнилась: отсчёт идёт от текущего
+        # момента, а не от давнего.
+        cache.set(key, now + interval, timeout)
+        return 0
+    if ready - now > burst:
+        cache.decr(key, interval)
+        return (ready - now - burst) / 1000
+    cache.touch(key, timeout)
+    return 0
+
+
+def client_ip(request):
+    if settings.RATE_LIMIT_IP_META:
+        ip = request.META.get(settings.RATE_LIMIT_IP_META)
+        if ip:
+            return ip
+    return request.META.get('REMOTE_ADDR', '')
+
+
+def buckets(request, name):
+    """Корзины запроса: (ключ, ёмкость, период)."""
+    limits = settings.RATE_LIMITS.get(name, {})
+    if 'user' in limits and request.user.is_authenticated:
+        yield (BUCKET_KEY.format(name, 'user', request.user.pk),
+               *limits['user'])
+    if 'ip' in limits:
+        yield (BUCKET_KEY.format(name, 'ip', client_ip(request)),
+               *limits['ip'])
+
+
+def rate_limit(name, methods=('POST',)):
+    """Ограничивает запросы к view по лимитам RATE_LIMITS[name].
+
+    methods — какие методы считаются записью; None — все.
+    """
+    def decorator(view_func):
+        @wraps(view_func)
+        def wrapper(request, *args, **kwargs):
+            if methods is None or request.method in methods:
+                for key, capacity, period in buckets(request, name):
+                    wait = take(key, capacity, period)
+                    if wait:
+                        response = HttpResponse(
+                            'Слишком много запросов, попробуйте позже.',
+                            status=429,
+                            content_type='text/plain; charset=utf-8',
+                        )
+                        response['Retry-After'] = str(int(wait) + 1)
+                        return response
+            return view_func(request, *args, **kwargs)
+        return wrapper
+    return decorator
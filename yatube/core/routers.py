@@ -0,0 +1,125 @@
+"""Чтение с реплик, запись в основную базу.
+
+Реплики перечислены в settings.DATABASE_REPLICAS. На реплику уходят
+только чтения моделей из REPLICA_APPS в GET- и HEAD-запросах: ленты,
+страницы постов и профилей. Всё остальное (POST-запросы, команды,
+поток событий) работает с основной базой; метод запроса проверяет сам
+роутер, а не только middleware. View, которые пишут и в GET-запросе
+(подписка по ссылке), помечаются primary_reads: их чтения перед
+записью тоже идут в основную базу.
+
+Реплики отстают, поэтому пользователь, который что-то записал (пост,
+комментарий, подписка, вход), REPLICA_PIN_SECONDS секунд читает с
+основной базы: профиль после post_create уже показывает новый пост.
+Отметка хранится в общем кеше по id пользователя и действует во всех
+воркерах; префикс db_pin: входит в KEEP_PREFIXES кеша, поэтому
+отметки не вытесняются при чистке (см. core/cache.py). Внутри
+транзакции основной базы чтения тоже идут в неё: реплика не видит
+незафиксированных изменений.
+"""
+import random
+import threading
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, connections
+
+PIN_KEY = 'db_pin:{}'
+SAFE_METHODS = ('GET', 'HEAD')
+
+_local = threading.local()
+
+
+def pin(user_id):
+    """Направляет чтения пользователя в основную базу на время
+    REPLICA_PIN_SECONDS."""
+    cache.set(PIN_KEY.format(user_id), 1, settings.REPLICA_PIN_SECONDS)
+
+
+def is_pinned(user_id):
+    return cache.get(PIN_KEY.format(user_id)) is not None
+
+
+def primary_reads(view_func):
+    """Все чтения view идут в основную базу, даже в GET-запросе.
+
+    Для view, которые пишут на GET: объект, прочитанный с отстающей
+    реплики, мог уже исчезнуть или измениться в основной базе.
+    """
+    @wraps(view_func)
+    def wrapper(request, *args, **kwargs):
+        if hasattr(_local, 'replica'):
+            _local.replica = None
+        return view_func(request, *args, **kwargs)
+    return wrapper
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        replica = getattr(_local, 'replica', None)
+        if (
+            replica is None
+            or getattr(_local, 'method', None) not in SAFE_METHODS
+            or model._meta.app_label not in settings.REPLICA_APPS
+            or connections[DEFAULT_DB_ALIAS].in_atomic_block
+        ):
+            return DEFAULT_DB_ALIAS
+        return replica
+
+    def db_for_write(self, model, **hints):
+        if hasattr(_local, 'replica'):
+            # Дальше запрос читает свои записи с основной базы.
+            _local.replica = None
+            _local.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {DEFAULT_DB_ALIAS, *settings.DATABASE_REPLICAS}
+        if {obj1._state.db, obj2._state.db} <= databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, **hints):
+        # Схему на реплики приносит репликация.
+        if db in settings.DATABASE_REPLICAS:
+            return False
+        return None
+
+
+class ReplicaMiddleware:
+    """Выбирает реплику на время запроса и закрепляет за основной
+    базой пользователей, которые в нём что-то записали.
+
+    Стоит после AuthenticationMiddleware и ServerTimingMiddleware:
+    загрузка пользователя должна попасть в разбивку по фазам.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        replicas = settings.DATABASE_REPLICAS
+        if not replicas:
+            return self.get_response(request)
+        user = request.user
+        replica = None
+        if request.method in SAFE_METHODS and not (
+            user.is_authenticated and is_pinned(user.pk)
+        ):
+            # Одна реплика на весь запрос: разные реплики отстают
+            # по-разному, и страница могла бы собраться из разных версий.
+            replica = random.choice(replicas)
+        _local.replica = replica
+        _local.method = request.method
+        _local.wrote = False
+        try:
+            response = self.get_response(request)
+        finally:
+            wrote = _local.wrote
+            del _local.replica, _local.method, _local.wrote
+        # request.user мог смениться: после входа или регистрации
+        # закрепляется уже вошедший пользователь.
+        if wrote and request.user.is_authenticated:
+            pin(request.user.pk)
+        return response
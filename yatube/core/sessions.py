@@ -0,0 +1,122 @@
+"""Сессии в кеше с отложенной записью в базу.
+
+Сессия читается из кеша, база нужна только при промахе. Запись тоже
+идёт в кеш, а в базу — не чаще раза в SESSION_WRITE_BEHIND секунд на
+сессию. Отложенное изменение помечается в кеше и уходит в базу при
+следующем обращении к сессии после интервала: чтении или записи. Так
+база отстаёт не больше чем на интервал плюс время до следующего
+запроса пользователя. Создание сессии и любая смена входа (пользователь,
+бэкенд, хеш пароля) пишутся в базу сразу, чтобы потеря кеша не
+разлогинила и не вернула старый вход.
+
+Префиксы ключей сессий и пометок входят в KEEP_PREFIXES кеша (см.
+core/cache.py), и живые ключи не вытесняются: несохранённое изменение
+теряется, только если пропадёт сам кеш.
+
+Включается настройкой SESSION_ENGINE = 'core.sessions'.
+"""
+import time
+
+from django.conf import settings
+from django.contrib.auth import (BACKEND_SESSION_KEY, HASH_SESSION_KEY,
+                                 SESSION_KEY)
+from django.contrib.sessions.backends.cached_db import (
+    SessionStore as CachedDBStore
+)
+from django.contrib.sessions.models import Session
+from django.utils import timezone
+
+AUTH_KEYS = (SESSION_KEY, BACKEND_SESSION_KEY, HASH_SESSION_KEY)
+SYNCED_PREFIX = 'core.sessions.synced:'
+PENDING_PREFIX = 'core.sessions.pending:'
+
+
+def auth_fields(data):
+    return tuple(data.get(key) for key in AUTH_KEYS)
+
+
+class SessionStore(CachedDBStore):
+    def __init__(self, session_key=None):
+        super().__init__(session_key)
+        self._loaded_auth = None
+
+    def load(self):
+        data = super().load()
+        self._loaded_auth = auth_fields(data)
+        if (
+            self.session_key is not None
+            and self._cache.get(self.pending_key)
+            and self._window_passed()
+        ):
+            # Интервал прошёл, а в кеше есть не записанное в базу
+            # изменение: оно уходит в базу при этом обращении.
+            self._session_cache = data
+            self._persist()
+        return data
+
+    @property
+    def synced_key(self):
+        return SYNCED_PREFIX + self._get_or_create_session_key()
+
+    @property
+    def pending_key(self):
+        return PENDING_PREFIX + self._get_or_create_session_key()
+
+    def _window_passed(self):
+        # add() удаётся, только если с последней записи в базу прошло
+        # больше SESSION_WRITE_BEHIND секунд.
+        return self._cache.add(
+            self.synced_key, True, settings.SESSION_WRITE_BEHIND
+        )
+
+    def _must_persist(self):
+        if self.session_key is None:
+            return True
+        if auth_fields(self._get_session()) != self._loaded_auth:
+            return True
+        return self._window_passed()
+
+    def _persist(self, must_create=False):
+        super().save(must_create)
+        self._cache.set(
+            self.synced_key, True, settings.SESSION_WRITE_BEHIND
+        )
+        self._cache.delete(self.pending_key)
+        self._loaded_auth = auth_fields(self._get_session())
+
+    def save(self, must_create=False):
+        if must_create or self._must_persist():
+            self._persist(must_create)
+            return
+        expiry = self.get_expiry_age()
+        self._cache.set(self.cache_key, self._get_session(), expiry)
+        self._cache.set(self.pending_key, True, expiry)
+
+    def delete(self, session_key=None):
+        key = session_key or self.session_key
+        super().delete(session_key)
+        if key is not None:
+            self._cache.delete_many(
+                [SYNCED_PREFIX + key, PENDING_PREFIX + key]
+            )
+
+
+def purge_expired(batch_size, pause=0):
+    """Удаляет истёкшие сессии пачками по индексу expire_date.
+
+    Каждая пачка — короткий DELETE по первичным ключам, поэтому таблица
+    не блокируется надолго. Возвращает итератор по размерам пачек.
+    """
+    now = timezone.now()
+    while True:
+        keys = list(
+            Session.objects.filter(expire_date__lt=now)
+            .order_by('expire_date')
+            .values_list('session_key', flat=True)[:batch_size]
+        )
+        if not keys:
+            return
+        Session.objects.filter(session_key__in=keys).delete()
+        yield len(keys)
+        if pause:
+            time.sleep(pause)
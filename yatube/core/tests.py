@@ -1,4 +1,34 @@
-from django.test import TestCase, Client
+import datetime
+import shutil
+import tempfile
+import time
+from collections import OrderedDict
+from io import StringIO
+from unittest import mock, skipUnless
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import AnonymousUser
+from django.contrib.sessions.models import Session
+from django.core.cache import cache, caches
+from django.core.management import call_command
+from django.http import HttpResponse
+from django.db import connection, connections, router
+from django.test import (Client, RequestFactory, SimpleTestCase, TestCase,
+                         TransactionTestCase, override_settings)
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from core.cache import TieredCache
+from core.queries import QueryBudgetExceeded, QueryRecorder
+from core import ratelimit, routers
+from core.sessions import PENDING_PREFIX, SYNCED_PREFIX, SessionStore
+from core.timing import SlowestRequests, slowest
+
+User = get_user_model()
+
+TEMP_CACHE_DIR = tempfile.mkdtemp()
 
 
 class CoreViewTest(TestCase):
@@ -6,3 +36,502 @@ class CoreViewTest(TestCase):
         self.guest_client = Client()
         response = self.guest_client.get('/random-text/')
         self.assertTemplateUsed(response, 'core/404.html')
+
+
+@override_settings(CACHES={
+    'tiered': {
+        'BACKEND': 'core.cache.TieredCache',
+        'LOCATION': TEMP_CACHE_DIR,
+    }
+})
+class TieredCacheTest(TestCase):
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_CACHE_DIR, ignore_errors=True)
+
+    def setUp(self):
+        self.cache = caches['tiered']
+        self.cache.clear()
+
+    def other_worker(self):
+        """Копия бэкенда со своим L1, как в соседнем процессе."""
+        other = TieredCache(TEMP_CACHE_DIR, {})
+        other._l1 = OrderedDict()
+        return other
+
+    def test_l1_hit(self):
+        """Повторное чтение отдаётся из L1."""
+        self.cache.set('key', 'value')
+        self.cache.stats.clear()
+        self.assertEqual(self.cache.get('key'), 'value')
+        self.assertEqual(self.cache.get('key'), 'value')
+        self.assertEqual(self.cache.stats['l2_hits'], 1)
+        self.assertEqual(self.cache.stats['l1_hits'], 1)
+
+    def test_cross_worker_invalidation(self):
+        """Запись в одном воркере сбрасывает L1 в другом."""
+        other = self.other_worker()
+        self.cache.set('key', 'old')
+        self.assertEqual(other.get('key'), 'old')
+        self.cache.set('key', 'new')
+        self.assertEqual(other.get('key'), 'new')
+        self.cache.delete('key')
+        self.assertIsNone(other.get('key'))
+
+    def test_clear_resets_other_workers(self):
+        """clear() сбрасывает L1 во всех воркерах."""
+        other = self.other_worker()
+        self.cache.set('key', 'value')
+        other.get('key')
+        self.cache.clear()
+        self.assertIsNone(other.get('key'))
+
+    def test_incr_and_add(self):
+        """incr() и add() видны всем воркерам."""
+        other = self.other_worker()
+        self.assertTrue(self.cache.add('counter', 1))
+        self.assertFalse(other.add('counter', 5))
+        self.assertEqual(other.incr('counter'), 2)
+        self.assertEqual(self.cache.incr('counter', 3), 5)
+        self.assertEqual(other.get('counter'), 5)
+
+    def test_l2_keeps_max_entries(self):
+        """L2 не вытесняет ключи, пока их меньше MAX_ENTRIES."""
+        cache = TieredCache(TEMP_CACHE_DIR, {'OPTIONS': {
+            'MAX_ENTRIES': 1000, 'CULL_EVERY': 1,
+        }})
+        for i in range(400):
+            cache.set(f'key{i}', i)
+        self.assertEqual(len(cache._l2._list_cache_files()), 400)
+
+    def test_l2_culls_expired_first(self):
+        """При переполнении сначала удаляются истёкшие ключи."""
+        cache = TieredCache(TEMP_CACHE_DIR, {'OPTIONS': {
+            'MAX_ENTRIES': 10, 'CULL_FREQUENCY': 2, 'CULL_EVERY': 1,
+        }})
+        for i in range(10):
+            cache.set(f'old{i}', i, timeout=0.001)
+        time.sleep(0.01)
+        for i in range(10):
+            cache.set(f'live{i}', i)
+        self.assertEqual(
+            cache.get_many([f'live{i}' for i in range(9)]),
+            {f'live{i}': i for i in range(9)},
+        )
+        self.assertEqual(len(cache._l2._list_cache_files()), 10)
+
+    def test_kept_prefixes_not_culled(self):
+        """Ключи KEEP_PREFIXES не вытесняются, но очищаются clear()."""
+        cache = TieredCache(TEMP_CACHE_DIR, {'OPTIONS': {
+            'MAX_ENTRIES': 10, 'CULL_FREQUENCY': 1, 'CULL_EVERY': 1,
+            'KEEP_PREFIXES': ['ratelimit:'],
+        }})
+        for i in range(20):
+            cache.set(f'ratelimit:{i}', i)
+            cache.set(f'key{i}', i)
+        self.assertEqual(
+            cache.get_many([f'ratelimit:{i}' for i in range(20)]),
+            {f'ratelimit:{i}': i for i in range(20)},
+        )
+        self.assertLessEqual(len(cache._l2._list_cache_files()), 10)
+        cache.clear()
+        self.assertIsNone(cache.get('ratelimit:0'))
+
+
+class QueryRecorderTest(TestCase):
+    def test_repeated_shapes(self):
+        """Запросы, отличающиеся только значениями, считаются одной формой."""
+        recorder = QueryRecorder()
+        with recorder.record():
+            for pk in range(3):
+                list(User.objects.filter(pk=pk))
+            list(User.objects.filter(pk__in=[1, 2, 3]))
+            list(User.objects.filter(pk__in=[1]))
+        self.assertEqual(recorder.count, 5)
+        self.assertEqual(sorted(recorder.repeated(2).values()), [2, 3])
+        self.assertEqual(recorder.repeated(4), {})
+
+    @override_settings(QUERY_BUDGET_MODE='raise')
+    def test_raise_mode(self):
+        """В режиме raise найденный N+1 приводит к исключению."""
+        self.client.get('/')
+        with override_settings(QUERY_REPEAT_THRESHOLD=0):
+            with self.assertRaises(QueryBudgetExceeded):
+                self.client.get('/')
+
+
+class ServerTimingTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.staff = User.objects.create_user(username='staff', is_staff=True)
+        cls.user = User.objects.create_user(username='user')
+
+    def setUp(self):
+        slowest.clear()
+        self.staff_client = Client()
+        self.staff_client.force_login(self.staff)
+        self.authorized_client = Client()
+        self.authorized_client.force_login(self.user)
+
+    def test_header_for_staff_only(self):
+        """Разбивка по фазам видна только сотрудникам."""
+        response = self.staff_client.get(reverse('posts:index'))
+        metrics = [
+            metric.split(';')[0]
+            for metric in response['Server-Timing'].split(', ')
+        ]
+        for phase in ('sql', 'template', 'session', 'auth', 'total'):
+            self.assertIn(phase, metrics)
+        response = self.authorized_client.get(reverse('posts:index'))
+        self.assertFalse(response.has_header('Server-Timing'))
+
+    def test_slow_requests_page(self):
+        """Медленные запросы видны на странице только сотрудникам."""
+        self.authorized_client.get(reverse('posts:index'))
+        response = self.authorized_client.get(reverse('slow_requests'))
+        self.assertEqual(response.status_code, 302)
+        response = self.staff_client.get(reverse('slow_requests'))
+        paths = [entry['path'] for entry in response.context['entries']]
+        self.assertIn(reverse('posts:index'), paths)
+
+    @override_settings(SLOW_REQUESTS_SIZE=2)
+    def test_keeps_slowest(self):
+        """В буфере остаются только самые медленные запросы."""
+        buffer = SlowestRequests()
+        for duration in (0.3, 0.1, 0.5, 0.2):
+            buffer.add(duration, {'total': duration})
+        self.assertEqual(
+            [entry['total'] for entry in buffer.entries()], [0.5, 0.3]
+        )
+
+
+class CachedSessionTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='auth')
+        self.client = Client()
+        self.client.force_login(self.user)
+
+    def tables(self, queries):
+        return [
+            table for query in queries
+            for table in ('django_session', 'auth_user')
+            if table in query['sql']
+        ]
+
+    def test_request_without_session_and_user_queries(self):
+        """Сессия и пользователь читаются из кеша."""
+        self.client.get(reverse('about:author'))
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('about:author'))
+        self.assertEqual(response.context['user'], self.user)
+        self.assertEqual(self.tables(queries), [])
+
+    def test_login_written_to_database(self):
+        """Вход сразу попадает в базу: вытеснение кеша не разлогинит."""
+        key = self.client.cookies[settings.SESSION_COOKIE_NAME].value
+        data = Session.objects.get(session_key=key).get_decoded()
+        self.assertEqual(data['_auth_user_id'], str(self.user.pk))
+        cache.clear()
+        response = self.client.get(reverse('about:author'))
+        self.assertEqual(response.context['user'], self.user)
+
+    def test_writes_behind(self):
+        """Повторные записи в пределах интервала идут только в кеш."""
+        store = SessionStore()
+        store['step'] = 1
+        store.create()
+        with CaptureQueriesContext(connection) as queries:
+            for step in (2, 3):
+                store['step'] = step
+                store.save()
+        self.assertEqual(self.tables(queries), [])
+        self.assertEqual(SessionStore(store.session_key)['step'], 3)
+        saved = Session.objects.get(session_key=store.session_key)
+        self.assertEqual(saved.get_decoded()['step'], 1)
+        cache.delete(SYNCED_PREFIX + store.session_key)
+        store.save()
+        saved = Session.objects.get(session_key=store.session_key)
+        self.assertEqual(saved.get_decoded()['step'], 3)
+
+    def test_pending_change_flushed_on_next_access(self):
+        """Отложенное изменение уходит в базу при первом обращении после
+        интервала и переживает потерю записи в кеше."""
+        store = SessionStore()
+        store['step'] = 1
+        store.create()
+        store['step'] = 2
+        store.save()
+        self.assertTrue(cache.get(PENDING_PREFIX + store.session_key))
+        # Интервал прошёл: следующее чтение сессии пишет её в базу.
+        cache.delete(SYNCED_PREFIX + store.session_key)
+        self.assertEqual(SessionStore(store.session_key)['step'], 2)
+        self.assertIsNone(cache.get(PENDING_PREFIX + store.session_key))
+        cache.delete(store.cache_key)
+        self.assertEqual(SessionStore(store.session_key)['step'], 2)
+
+    def test_password_change_invalidates_user(self):
+        """Смена пароля сбрасывает кешированного пользователя и входы."""
+        self.client.get(reverse('about:author'))
+        self.user.set_password('new-password')
+        self.user.save()
+        response = self.client.get(reverse('about:author'))
+        self.assertFalse(response.context['user'].is_authenticated)
+
+    def test_profile_change_invalidates_user(self):
+        self.client.get(reverse('about:author'))
+        self.user.first_name = 'Новое'
+        self.user.save()
+        response = self.client.get(reverse('about:author'))
+        self.assertEqual(response.context['user'].first_name, 'Новое')
+
+    def test_purge_sessions(self):
+        """Истёкшие сессии удаляются пачками, живые остаются."""
+        past = timezone.now() - datetime.timedelta(days=1)
+        Session.objects.bulk_create([
+            Session(session_key=f'expired{i}', session_data='',
+                    expire_date=past)
+            for i in range(5)
+        ])
+        out = StringIO()
+        call_command('purge_sessions', batch_size=2, stdout=out)
+        self.assertFalse(Session.objects.filter(expire_date__lt=timezone.now())
+                         .exists())
+        self.assertTrue(Session.objects.exists())
+        self.assertIn('Удалено сессий: 4', out.getvalue())
+
+
+@override_settings(RATE_LIMITS={
+    'add_comment': {'user': (2, 60), 'ip': (3, 60)},
+    'profile_follow': {'user': (1, 60)},
+})
+class RateLimitTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        from posts.models import Post
+
+        cls.author = User.objects.create_user(username='author')
+        cls.post = Post.objects.create(author=cls.author, text='test')
+
+    def setUp(self):
+        cache.clear()
+        self.url = reverse('posts:add_comment', args=[self.post.pk])
+
+    def client_for(self, username):
+        user, created = User.objects.get_or_create(username=username)
+        client = Client()
+        client.force_login(user)
+        return client
+
+    def comment(self, client):
+        return client.post(self.url, {'text': 'c'})
+
+    def test_user_bucket(self):
+        """Сверх ёмкости корзины запросы отклоняются без базы."""
+        client = self.client_for('reader')
+        for _ in range(2):
+            self.assertEqual(self.comment(client).status_code, 302)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.comment(client)
+        self.assertEqual(response.status_code, 429)
+        self.assertIn('Retry-After', response)
+        self.assertEqual(queries.captured_queries, [])
+        self.assertEqual(self.post.comments.count(), 2)
+
+    def test_ip_bucket_shared_by_users(self):
+        statuses = [
+            self.comment(self.client_for(name)).status_code
+            for name in ('a', 'b', 'c', 'd')
+        ]
+        self.assertEqual(statuses, [302, 302, 302, 429])
+
+    def test_ip_header_ignored_by_default(self):
+        """Без прокси заголовок клиента не даёт новую корзину."""
+        statuses = [
+            self.client_for(name).post(
+                self.url, {'text': 'c'}, HTTP_X_REAL_IP=ip
+            ).status_code
+            for name, ip in (('a', '10.0.0.1'), ('b', '10.0.0.2'),
+                             ('c', '10.0.0.3'), ('d', '10.0.0.4'))
+        ]
+        self.assertEqual(statuses, [302, 302, 302, 429])
+
+    def test_rejected_user_takes_no_ip_bucket(self):
+        """Запрос сверх лимита пользователя не заводит корзину IP."""
+        client = self.client_for('reader')
+        for _ in range(3):
+            self.comment(client)
+        with mock.patch.object(ratelimit, 'take',
+                               wraps=ratelimit.take) as take:
+            self.assertEqual(self.comment(client).status_code, 429)
+        self.assertEqual(
+            [call[0][0].split(':')[2] for call in take.call_args_list],
+            ['user'],
+        )
+
+    @override_settings(RATE_LIMIT_IP_META='HTTP_X_REAL_IP')
+    def test_ip_from_proxy_header(self):
+        """За прокси корзины различаются по его заголовку, а не по общему
+        REMOTE_ADDR."""
+        statuses = [
+            self.client_for(name).post(
+                self.url, {'text': 'c'}, HTTP_X_REAL_IP=ip
+            ).status_code
+            for name, ip in (('a', '10.0.0.1'), ('b', '10.0.0.1'),
+                             ('c', '10.0.0.1'), ('d', '10.0.0.2'),
+                             ('e', '10.0.0.1'))
+        ]
+        self.assertEqual(statuses, [302, 302, 302, 302, 429])
+
+    def test_bucket_refills(self):
+        client = self.client_for('reader')
+        start = ratelimit.now_ms()
+        with mock.patch.object(ratelimit, 'now_ms', return_value=start):
+            self.comment(client)
+            self.comment(client)
+            self.assertEqual(self.comment(client).status_code, 429)
+        # Через 30 секунд наполняется один токен из двух.
+        later = start + 30 * 1000
+        with mock.patch.object(ratelimit, 'now_ms', return_value=later):
+            self.assertEqual(self.comment(client).status_code, 302)
+            self.assertEqual(self.comment(client).status_code, 429)
+
+    def test_follow_limited_on_get(self):
+        client = self.client_for('reader')
+        other = User.objects.create_user(username='other')
+        client.get(reverse('posts:profile_follow', args=[self.author]))
+        response = client.get(
+            reverse('posts:profile_follow', args=[other])
+        )
+        self.assertEqual(response.status_code, 429)
+
+    def test_reads_not_limited(self):
+        client = self.client_for('reader')
+        for _ in range(5):
+            response = client.get(reverse('posts:post_create'))
+            self.assertEqual(response.status_code, 200)
+
+
+@override_settings(DATABASE_REPLICAS=['replica1'])
+class ReplicaRouterTest(SimpleTestCase):
+    """Выбор базы без обращения к ней: реплики может и не быть."""
+
+    def setUp(self):
+        cache.clear()
+        self.factory = RequestFactory()
+        self.user = User(pk=1, username='reader')
+
+    def request(self, method='get', user=None, write=False):
+        """Базы, с которых читались пост и сессия в ходе запроса."""
+        from posts.models import Post
+
+        used = {}
+
+        def view(request):
+            if write:
+                router.db_for_write(Post)
+            used['post'] = router.db_for_read(Post)
+            used['session'] = router.db_for_read(Session)
+            return HttpResponse()
+
+        request = getattr(self.factory, method)('/')
+        request.user = user or AnonymousUser()
+        routers.ReplicaMiddleware(view)(request)
+        return used
+
+    def test_reads_from_replica(self):
+        self.assertEqual(
+            self.request(), {'post': 'replica1', 'session': 'default'}
+        )
+
+    def test_post_requests_use_primary(self):
+        self.assertEqual(self.request('post')['post'], 'default')
+
+    def test_router_checks_method(self):
+        """Реплика, выбранная не для GET, роутером не используется."""
+        from posts.models import Post
+
+        routers._local.replica, routers._local.method = 'replica1', 'POST'
+        try:
+            self.assertEqual(router.db_for_read(Post), 'default')
+        finally:
+            del routers._local.replica, routers._local.method
+
+    def test_primary_reads_view(self):
+        from posts.models import Post
+
+        used = {}
+
+        @routers.primary_reads
+        def view(request):
+            used['post'] = router.db_for_read(Post)
+            return HttpResponse()
+
+        request = self.factory.get('/')
+        request.user = AnonymousUser()
+        routers.ReplicaMiddleware(view)(request)
+        self.assertEqual(used['post'], 'default')
+
+    def test_outside_requests_use_primary(self):
+        from posts.models import Post
+
+        self.assertEqual(router.db_for_read(Post), 'default')
+
+    def test_pinned_after_write(self):
+        """После записи пользователь читает свои изменения."""
+        other = User(pk=2, username='other')
+        self.assertEqual(self.request(user=self.user, write=True)['post'],
+                         'default')
+        self.assertEqual(self.request(user=self.user)['post'], 'default')
+        self.assertEqual(self.request(user=other)['post'], 'replica1')
+        cache.delete(routers.PIN_KEY.format(self.user.pk))
+        self.assertEqual(self.request(user=self.user)['post'], 'replica1')
+
+    def test_no_migrations_on_replicas(self):
+        self.assertIs(router.allow_migrate('replica1', 'posts'), False)
+        self.assertIs(router.allow_migrate('default', 'posts'), True)
+
+
+@skipUnless(settings.DATABASE_REPLICAS, 'реплики не настроены (DB_REPLICAS)')
+class ReplicaReadYourWritesTest(TransactionTestCase):
+    """Основная база и реплика-зеркало: запускается с DB_REPLICAS."""
+    databases = '__all__'
+
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create_user(username='author')
+        self.client.force_login(self.author)
+        self.replica = connections[settings.DATABASE_REPLICAS[0]]
+
+    @override_settings(DATABASE_REPLICAS=settings.DATABASE_REPLICAS[:1])
+    def test_profile_after_post_create(self):
+        with CaptureQueriesContext(self.replica) as queries:
+            response = self.client.post(
+                reverse('posts:post_create'), {'text': 'новый пост'},
+                follow=True,
+            )
+        self.assertContains(response, 'новый пост')
+        self.assertEqual(queries.captured_queries, [])
+        with CaptureQueriesContext(self.replica) as queries:
+            response = Client().get(
+                reverse('posts:profile', args=[self.author])
+            )
+        self.assertContains(response, 'новый пост')
+        self.assertTrue(queries.captured_queries)
+
+    @override_settings(DATABASE_REPLICAS=settings.DATABASE_REPLICAS[:1])
+    def test_follow_by_link_reads_primary(self):
+        """Подписка GET-ссылкой ищет автора в основной базе."""
+        User.objects.create_user(username='other')
+        with CaptureQueriesContext(self.replica) as queries:
+            response = self.client.get(
+                reverse('posts:profile_follow', args=['other'])
+            )
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(queries.captured_queries, [])
+        self.assertTrue(
+            self.author.follower.filter(author__username='other').exists()
+        )
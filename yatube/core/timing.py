@@ -0,0 +1,179 @@
+"""Разбивка времени запроса по фазам: SQL, шаблоны, миниатюры,
+сессия и пользователь, кеш.
+
+Фазы собираются в Timings текущего потока: код, который хочет
+попасть в разбивку, оборачивает работу в measure('имя'). Сотрудникам
+разбивка отдаётся заголовком Server-Timing, а самые медленные запросы
+процесса хранятся в памяти и видны на странице для сотрудников.
+"""
+import heapq
+import itertools
+import threading
+import time
+from collections import Counter
+from contextlib import ExitStack, contextmanager
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections
+from django.utils import timezone
+from django.utils.functional import SimpleLazyObject, empty
+
+_local = threading.local()
+
+
+class Timings:
+    def __init__(self):
+        self.durations = Counter()
+        self.counts = Counter()
+
+    def add(self, name, duration):
+        self.durations[name] += duration
+        self.counts[name] += 1
+
+
+def current():
+    return getattr(_local, 'timings', None)
+
+
+@contextmanager
+def measure(name):
+    """Учитывает время блока в фазе name текущего запроса."""
+    timings = current()
+    if timings is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings.add(name, time.perf_counter() - start)
+
+
+def timed(name, func):
+    def wrapper(*args, **kwargs):
+        with measure(name):
+            return func(*args, **kwargs)
+    return wrapper
+
+
+def _sql_wrapper(execute, sql, params, many, context):
+    with measure('sql'):
+        return execute(sql, params, many, context)
+
+
+def install():
+    """Подключает замер рендеринга шаблонов; вызывается из ready()."""
+    from django.template.backends.django import Template
+
+    if not getattr(Template.render, 'timed', False):
+        Template.render = timed('template', Template.render)
+        Template.render.timed = True
+
+
+def cache_stats():
+    return Counter(getattr(cache, 'stats', {}))
+
+
+class SlowestRequests:
+    """N самых медленных запросов процесса (куча по длительности)."""
+
+    def __init__(self):
+        self._heap = []
+        self._lock = threading.Lock()
+        self._order = itertools.count()
+
+    def add(self, duration, entry):
+        item = (duration, next(self._order), entry)
+        with self._lock:
+            if len(self._heap) < settings.SLOW_REQUESTS_SIZE:
+                heapq.heappush(self._heap, item)
+            elif duration > self._heap[0][0]:
+                heapq.heapreplace(self._heap, item)
+
+    def entries(self):
+        with self._lock:
+            items = sorted(self._heap, reverse=True)
+        return [entry for duration, order, entry in items]
+
+    def clear(self):
+        with self._lock:
+            self._heap = []
+
+
+slowest = SlowestRequests()
+
+
+class ServerTimingMiddleware:
+    """Замеряет фазы запроса.
+
+    Стоит после AuthenticationMiddleware: ленивые сессия и пользователь
+    подменяются обёртками, которые замеряют их загрузку.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        _local.timings = timings = Timings()
+        self._wrap_lazy(request)
+        stats = cache_stats()
+        start = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                for alias in connections:
+                    stack.enter_context(
+                        connections[alias].execute_wrapper(_sql_wrapper)
+                    )
+                response = self.get_response(request)
+        finally:
+            _local.timings = None
+        total = time.perf_counter() - start
+        cache_delta = cache_stats() - stats
+        slowest.add(total, {
+            'path': request.get_full_path(),
+            'method': request.method,
+            'status': response.status_code,
+            'total': total,
+            'phases': sorted(
+                (name, duration, timings.counts[name])
+                for name, duration in timings.durations.items()
+            ),
+            'cache': dict(cache_delta),
+            'when': timezone.now(),
+        })
+        user = getattr(request, 'user', None)
+        if user is not None and user.is_staff:
+            response['Server-Timing'] = self.header(
+                total, timings, cache_delta
+            )
+        return response
+
+    def _wrap_lazy(self, request):
+        session = getattr(request, 'session', None)
+        if session is not None:
+            session.load = timed('session', session.load)
+        user = getattr(request, 'user', None)
+        if isinstance(user, SimpleLazyObject):
+            def load_user():
+                if user._wrapped is empty:
+                    with measure('auth'):
+                        user._setup()
+                return user._wrapped
+            request.user = SimpleLazyObject(load_user)
+
+    def header(self, total, timings, cache_delta):
+        metrics = [
+            f'{name};dur={duration * 1000:.1f};desc="{name} '
+            f'x{timings.counts[name]}"'
+            for name, duration in sorted(timings.durations.items())
+        ]
+        if cache_delta:
+            hits = cache_delta['l1_hits'] + cache_delta['l2_hits']
+            metrics.append(
+                f'cache;desc="hits {hits} '
+                f'(L1 {cache_delta["l1_hits"]}), '
+                f'misses {cache_delta["misses"]}"'
+            )
+        metrics.append(f'total;dur={total * 1000:.1f}')
+        return ', '.join(metrics)
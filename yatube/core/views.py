@@ -1,5 +1,8 @@
+from django.contrib.admin.views.decorators import staff_member_required
 from django.shortcuts import render
 
+from .timing import slowest
+
 
 def page_not_found(request, exception):
     return render(request, 'core/404.html', {'path': request.path}, status=404)
@@ -11,3 +14,10 @@ def csrf_failure(request, reason=''):
 
 def server_error(request):
     return render(request, 'core/500.html', {'path': request.path}, status=500)
+
+
+@staff_member_required
+def slow_requests(request):
+    return render(request, 'core/slow_requests.html', {
+        'entries': slowest.entries(),
+    })
@@ -1,12 +1,27 @@
 from django.contrib import admin
 
+from . import search
 from .models import Post, Group, Comment, Follow
 
 
-class PostAdmin(admin.ModelAdmin):
+class IndexSearchMixin:
+    """Поиск в админке по полнотекстовому индексу вместо LIKE."""
+    search_kind = None
+
+    def get_search_results(self, request, queryset, search_term):
+        if not search_term or search.get_backend() is None:
+            return super().get_search_results(
+                request, queryset, search_term
+            )
+        ids = search.matching_ids(search_term, self.search_kind)
+        return queryset.filter(pk__in=ids), False
+
+
+class PostAdmin(IndexSearchMixin, admin.ModelAdmin):
     list_display = ('pk', 'text', 'pub_date', 'author', 'group',)
     list_editable = ('group',)
     search_fields = ('text',)
+    search_kind = search.POST
     list_filter = ('pub_date',)
     empty_value_display = '-пусто-'
 
@@ -18,9 +33,10 @@ class GroupAdmin(admin.ModelAdmin):
     empty_value_display = '-пусто-'
 
 
-class CommentAdmin(admin.ModelAdmin):
+class CommentAdmin(IndexSearchMixin, admin.ModelAdmin):
     list_display = ('pk', 'post', 'author', 'text',)
     search_fields = ('text',)
+    search_kind = search.COMMENT
     list_filter = ('author',)
     empty_value_display = '-пусто-'
 
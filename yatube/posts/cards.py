@@ -0,0 +1,73 @@
+"""Кеш отрендеренных карточек постов.
+
+Карточка кешируется под ключом из id поста, его updated_at и числа
+комментариев: правка поста меняет updated_at, комментарии меняют
+счётчик без сохранения поста. Смена имени автора или названия группы
+сдвигает updated_at всех их постов одним UPDATE, так что старые
+карточки просто перестают читаться. Лента достаёт карточки страницы
+одним get_many и рендерит только недостающие.
+
+Фрагмент страницы ленты кешируется под ключом из ключей её карточек:
+новый комментарий или правка поста меняют ключ только страниц с этим
+постом, остальные страницы ленты остаются в кеше.
+"""
+import hashlib
+
+from django.conf import settings
+from django.core.cache import cache
+from django.template.loader import render_to_string
+from django.utils import timezone
+
+from . import feed_cache, thumbnails
+
+CARD_KEY = 'post_card:{}:{:.6f}:{}'
+TEMPLATE = 'includes/content.html'
+
+
+def card_key(post):
+    return CARD_KEY.format(
+        post.pk, post.updated_at.timestamp(), post.comments_count
+    )
+
+
+def fragment(name, page):
+    """Контекст для {% cache %}: время жизни и ключ фрагмента страницы
+    ленты name."""
+    stamp = '|'.join(card_key(post) for post in page)
+    return {
+        'timeout': settings.FEED_CACHE_TIMEOUT,
+        'key': f'{name}:{hashlib.md5(stamp.encode()).hexdigest()}',
+    }
+
+
+def render(posts):
+    """Пары (пост, html карточки) в порядке posts."""
+    posts = list(posts)
+    keys = [card_key(post) for post in posts]
+    cards = cache.get_many(keys)
+    thumbnails.prefetch(
+        post.image for post, key in zip(posts, keys) if key not in cards
+    )
+    missing = {}
+    for post, key in zip(posts, keys):
+        if key not in cards:
+            missing[key] = render_to_string(TEMPLATE, {'post': post})
+    if missing:
+        cache.set_many(missing, settings.POST_CARD_TIMEOUT)
+        cards.update(missing)
+    return [(post, cards[key]) for post, key in zip(posts, keys)]
+
+
+def touch(posts):
+    """Делает карточки постов устаревшими и сбрасывает их ленты."""
+    posts = posts.order_by()
+    authors = set(posts.values_list('author_id', flat=True).distinct())
+    if not authors:
+        return
+    groups = set(posts.values_list('group_id', flat=True).distinct())
+    posts.update(updated_at=timezone.now())
+    feed_cache.bump(
+        ['index']
+        + [f'profile:{author_id}' for author_id in authors]
+        + [f'group:{group_id}' for group_id in groups - {None}]
+    )
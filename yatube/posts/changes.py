@@ -0,0 +1,126 @@
+"""Журнал изменений лент для дельта-синхронизации.
+
+Каждая публикация, правка и удаление поста и каждый новый комментарий
+пишут строку Change в той же транзакции: save() постов и комментариев
+атомарен вместе с обработчиками post_save (AtomicSaveMixin), удаление
+атомарно у самого Django. Клиент запоминает номер последнего
+увиденного изменения и запрашивает только то, что случилось после него.
+
+Номера выдаёт автоинкремент, а на PostgreSQL транзакции могут
+зафиксироваться не в порядке номеров. Поэтому самые свежие
+CHANGES_SETTLE_SECONDS секунд журнала не отдаются: иначе клиент мог бы
+перескочить номер ещё не зафиксированного изменения. Время записи и
+граница окна берутся по часам базы, а не веб-воркеров, часы которых
+могут расходиться; окно должно быть больше времени от записи строки
+журнала до фиксации транзакции.
+
+Журнал хранится CHANGES_RETENTION_DAYS дней, старые записи удаляет
+команда prune_changes. Клиенту, отставшему сильнее, API сообщает, что
+ленту нужно загрузить заново.
+"""
+import datetime
+
+from django.conf import settings
+from django.db.models import DateTimeField, ExpressionWrapper, Func
+from django.db.models.functions import Now
+from django.utils import timezone
+
+from .models import Change, Follow
+
+
+class StatementTime(Func):
+    """Время выполнения запроса по часам базы. CURRENT_TIMESTAMP в
+    PostgreSQL — время начала транзакции, а не записи строки."""
+    template = 'CURRENT_TIMESTAMP'
+    output_field = DateTimeField()
+
+    def as_postgresql(self, compiler, connection, **extra_context):
+        return self.as_sql(
+            compiler, connection, template='STATEMENT_TIMESTAMP()',
+            **extra_context
+        )
+
+
+def record(kind, post, comment=None, group_id=None):
+    return Change.objects.create(
+        kind=kind,
+        post_id=post.pk,
+        comment_id=comment.pk if comment is not None else None,
+        author_id=post.author_id,
+        group_id=post.group_id if group_id is None else group_id,
+        created=StatementTime(),
+    )
+
+
+def post_saved(post, created, old_group_id=None):
+    if created:
+        record(Change.POST_CREATED, post)
+        return
+    if old_group_id is not None and old_group_id != post.group_id:
+        record(Change.POST_REMOVED, post, group_id=old_group_id)
+    record(Change.POST_UPDATED, post)
+
+
+def post_deleted(post):
+    record(Change.POST_DELETED, post)
+
+
+def comment_created(comment):
+    record(Change.COMMENT_CREATED, comment.post, comment)
+
+
+def for_feed(feed, user=None):
+    """Изменения ленты: 'index', группы по id или подписок user."""
+    changes = Change.objects.all()
+    if feed == 'follow':
+        authors = Follow.objects.filter(user=user).values('author')
+        changes = changes.filter(author_id__in=authors)
+    elif feed != 'index':
+        changes = changes.filter(group_id=feed)
+    return changes
+
+
+def settled(changes):
+    """Изменения, устоявшиеся к текущему моменту."""
+    cutoff = ExpressionWrapper(
+        Now() - datetime.timedelta(seconds=settings.CHANGES_SETTLE_SECONDS),
+        output_field=DateTimeField(),
+    )
+    return changes.filter(created__lte=cutoff)
+
+
+def since(changes, seq, limit):
+    """Изменения после номера seq, устоявшиеся к текущему моменту.
+
+    Возвращает список изменений и признак того, что есть ещё.
+    """
+    changes = settled(changes).filter(pk__gt=seq).order_by('pk')
+    items = list(changes[:limit + 1])
+    return items[:limit], len(items) > limit
+
+
+def pruned_after(seq):
+    """True, если записи журнала после seq уже удалены prune()."""
+    first = Change.objects.order_by('pk').values_list('pk', flat=True)
+    first = first.first()
+    return first is not None and 0 < seq < first - 1
+
+
+def prune(batch_size):
+    """Удаляет записи старше CHANGES_RETENTION_DAYS пачками по
+    batch_size и возвращает их число.
+
+    Старые записи лежат в начале журнала, поэтому пачки берутся с
+    начала по первичному ключу, без просмотра всей таблицы по created.
+    """
+    cutoff = timezone.now() - datetime.timedelta(
+        days=settings.CHANGES_RETENTION_DAYS
+    )
+    head = Change.objects.order_by('pk').values_list('pk', 'created')
+    removed = 0
+    while True:
+        ids = [pk for pk, created in head[:batch_size] if created < cutoff]
+        if ids:
+            removed += Change.objects.filter(pk__in=ids).delete()[0]
+        if len(ids) < batch_size:
+            return removed
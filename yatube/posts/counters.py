@@ -0,0 +1,121 @@
+"""Денормализованные счётчики Post.comments_count, Group.posts_count и
+AuthorStats.posts_count.
+
+Счётчики меняются атомарными F-выражениями при записи, а расхождения
+(bulk_create, правки в обход ORM) исправляет reconcile_counters. Пока
+расхождение не исправлено, счётчик может дойти до нуля раньше времени,
+поэтому уменьшение не опускает его ниже нуля.
+"""
+from django.contrib.auth import get_user_model
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce, Greatest
+
+from .models import AuthorStats, Comment, Group, Post
+
+User = get_user_model()
+
+
+def shifted(field, delta):
+    """Значение счётчика, сдвинутое на delta, но не меньше нуля."""
+    return Greatest(F(field) + delta, 0)
+
+
+def change_group(old_group_id, new_group_id):
+    """Переносит пост из группы old_group_id в new_group_id."""
+    if old_group_id == new_group_id:
+        return
+    if old_group_id is not None:
+        Group.objects.filter(pk=old_group_id).update(
+            posts_count=shifted('posts_count', -1)
+        )
+    if new_group_id is not None:
+        Group.objects.filter(pk=new_group_id).update(
+            posts_count=F('posts_count') + 1
+        )
+
+
+def change_comments(post_id, delta):
+    Post.objects.filter(pk=post_id).update(
+        comments_count=shifted('comments_count', delta)
+    )
+
+
+def change_author_posts(author_id, delta):
+    stats = AuthorStats.objects.filter(pk=author_id)
+    if stats.update(posts_count=shifted('posts_count', delta)) or delta < 0:
+        return
+    # Первый пост автора: строку создаёт первый из параллельных
+    # запросов, прибавляют все.
+    AuthorStats.objects.bulk_create(
+        [AuthorStats(author_id=author_id)], ignore_conflicts=True
+    )
+    stats.update(posts_count=shifted('posts_count', delta))
+
+
+def _reconcile(model, counter, related, actual_counts, batch_size):
+    """Пересчитывает counter пачками по batch_size объектов.
+
+    Возвращает количество исправленных объектов.
+    """
+    fixed = 0
+    last_pk = 0
+    while True:
+        batch = list(
+            model.objects.filter(pk__gt=last_pk).order_by('pk')
+            .values_list('pk', flat=True)[:batch_size]
+        )
+        if not batch:
+            return fixed
+        last_pk = batch[-1]
+        drifted = list(
+            model.objects.filter(pk__in=batch)
+            .annotate(actual=Count(related))
+            .exclude(**{counter: F('actual')})
+            .values_list('pk', flat=True)
+        )
+        if drifted:
+            fixed += model.objects.filter(pk__in=drifted).update(
+                **{counter: Coalesce(Subquery(actual_counts), 0)}
+            )
+
+
+def reconcile_posts(batch_size):
+    actual = (
+        Comment.objects.filter(post=OuterRef('pk'))
+        .order_by().values('post').annotate(count=Count('pk'))
+        .values('count')
+    )
+    return _reconcile(Post, 'comments_count', 'comments', actual, batch_size)
+
+
+def reconcile_groups(batch_size):
+    actual = (
+        Post.objects.filter(group=OuterRef('pk'))
+        .order_by().values('group').annotate(count=Count('pk'))
+        .values('count')
+    )
+    return _reconcile(Group, 'posts_count', 'posts', actual, batch_size)
+
+
+def reconcile_authors(batch_size):
+    """Создаёт недостающие строки AuthorStats и пересчитывает их."""
+    missing = (
+        User.objects.filter(posts__isnull=False, author_stats__isnull=True)
+        .distinct().values_list('pk', flat=True)
+    )
+    while True:
+        batch = list(missing[:batch_size])
+        if not batch:
+            break
+        AuthorStats.objects.bulk_create(
+            [AuthorStats(author_id=pk) for pk in batch],
+            ignore_conflicts=True,
+        )
+    actual = (
+        Post.objects.filter(author=OuterRef('pk'))
+        .order_by().values('author').annotate(count=Count('pk'))
+        .values('count')
+    )
+    return _reconcile(
+        AuthorStats, 'posts_count', 'author__posts', actual, batch_size
+    )
@@ -0,0 +1,321 @@
+"""Поток событий (Server-Sent Events) о новых постах и комментариях.
+
+Работает отдельным процессом рядом с yatube.wsgi (команда run_events),
+веб-сервер проксирует на него адреса /events/. Процесс на asyncio:
+открытое соединение — это корутина и небольшая очередь, поэтому тысячи
+ждущих клиентов почти ничего не стоят.
+
+Источник событий — журнал Change (см. posts/changes.py): один опросчик
+на процесс читает новые устоявшиеся изменения и раскладывает их по
+каналам подписчиков. Номер изменения уходит клиенту как id события;
+переподключившись с Last-Event-ID, клиент получает пропущенное из
+журнала.
+
+Адреса:
+    /events/index              новые посты всех авторов
+    /events/group/<slug>       новые посты группы
+    /events/follow             новые посты авторов из подписок (по сессии)
+    /events/post/<id>          новые комментарии поста
+"""
+import asyncio
+import json
+import logging
+import re
+from http.cookies import SimpleCookie
+from importlib import import_module
+from types import SimpleNamespace
+
+from django.conf import settings
+from django.contrib.auth import get_user
+from django.db import close_old_connections
+
+from . import changes, follow_graph
+from .models import Change, Group, Post
+from .paginators import parse_id
+
+logger = logging.getLogger(__name__)
+
+ROUTES = re.compile(
+    r'^/events/(?:(?P<index>index)|group/(?P<group>[-\w]+)|(?P<follow>follow)'
+    r'|post/(?P<post>\d+))/?$'
+)
+
+
+class NotFound(Exception):
+    status = '404 Not Found'
+
+
+class Unauthorized(Exception):
+    status = '401 Unauthorized'
+
+
+def change_channels(change):
+    """Каналы, подписчикам которых нужно изменение."""
+    if change.kind == Change.POST_CREATED:
+        channels = ['index', f'author:{change.author_id}']
+        if change.group_id is not None:
+            channels.append(f'group:{change.group_id}')
+        return channels
+    if change.kind == Change.COMMENT_CREATED:
+        return [f'post:{change.post_id}']
+    return []
+
+
+def format_event(change):
+    """Изменение в формате SSE."""
+    if change.kind == Change.COMMENT_CREATED:
+        name = 'comment'
+        data = {'post': change.post_id, 'comment': change.comment_id}
+    else:
+        name = 'post'
+        data = {'post': change.post_id, 'author': change.author_id,
+                'group': change.group_id}
+    data['seq'] = change.pk
+    return (f'id: {change.pk}\nevent: {name}\n'
+            f'data: {json.dumps(data)}\n\n').encode()
+
+
+def _session_user(headers):
+    cookie = SimpleCookie(headers.get('cookie', ''))
+    morsel = cookie.get(settings.SESSION_COOKIE_NAME)
+    if morsel is None:
+        return None
+    store = import_module(settings.SESSION_ENGINE).SessionStore
+    user = get_user(SimpleNamespace(session=store(morsel.value)))
+    return user if user.is_authenticated else None
+
+
+def subscribe(path, headers):
+    """Каналы и выборка журнала для адреса; выполняется в потоке.
+
+    Возвращает пару (каналы, изменения для досылки по Last-Event-ID).
+    """
+    close_old_connections()
+    match = ROUTES.match(path.split('?', 1)[0])
+    if match is None:
+        raise NotFound
+    if match['index']:
+        return ['index'], Change.objects.filter(kind=Change.POST_CREATED)
+    if match['group']:
+        group_id = Group.objects.filter(slug=match['group']).values_list(
+            'pk', flat=True
+        ).first()
+        if group_id is None:
+            raise NotFound
+        return [f'group:{group_id}'], Change.objects.filter(
+            kind=Change.POST_CREATED, group_id=group_id
+        )
+    if match['follow']:
+        user = _session_user(headers)
+        if user is None:
+            raise Unauthorized
+        authors = follow_graph.following(user.pk)
+        channels = [f'author:{author}' for author in authors]
+        return channels, Change.objects.filter(
+            kind=Change.POST_CREATED, author_id__in=list(authors)
+        )
+    post_id = int(match['post'])
+    if not Post.objects.filter(pk=post_id).exists():
+        raise NotFound
+    return [f'post:{post_id}'], Change.objects.filter(
+        kind=Change.COMMENT_CREATED, post_id=post_id
+    )
+
+
+def replay(log, seq):
+    """Пропущенные после seq изменения; None, если их больше, чем
+    EVENTS_REPLAY_LIMIT, и клиенту проще перезагрузить страницу."""
+    close_old_connections()
+    items, has_more = changes.since(log, seq, settings.EVENTS_REPLAY_LIMIT)
+    return None if has_more else items
+
+
+def latest_seq():
+    """Номер последнего устоявшегося изменения: с него начинает
+    опросчик, старые изменения досылаются только по Last-Event-ID."""
+    close_old_connections()
+    last = changes.settled(Change.objects.all()).order_by('-pk')
+    return last.values_list('pk', flat=True).first() or 0
+
+
+def poll(seq):
+    """Новые устоявшиеся изменения после seq и признак, что есть ещё."""
+    close_old_connections()
+    return changes.since(
+        Change.objects.all(), seq, settings.EVENTS_POLL_LIMIT
+    )
+
+
+class Subscriber:
+    def __init__(self):
+        self.queue = asyncio.Queue(settings.EVENTS_QUEUE_SIZE)
+        # Клиент не успевает читать: соединение закрывается, и он
+        # переподключается с Last-Event-ID.
+        self.lagging = False
+
+    def put(self, change):
+        try:
+            self.queue.put_nowait(change)
+        except asyncio.QueueFull:
+            self.lagging = True
+
+
+class Hub:
+    """Подписчики по каналам и опросчик журнала."""
+
+    def __init__(self):
+        self.channels = {}
+        self.seq = None
+
+    def add(self, channels, subscriber):
+        for channel in channels:
+            self.channels.setdefault(channel, set()).add(subscriber)
+
+    def remove(self, channels, subscriber):
+        for channel in channels:
+            subscribers = self.channels.get(channel)
+            if subscribers is not None:
+                subscribers.discard(subscriber)
+                if not subscribers:
+                    del self.channels[channel]
+
+    def publish(self, change):
+        for channel in change_channels(change):
+            for subscriber in self.channels.get(channel, ()):
+                subscriber.put(change)
+
+    async def poll_once(self):
+        loop = asyncio.get_running_loop()
+        if self.seq is None:
+            self.seq = await loop.run_in_executor(None, latest_seq)
+        items, has_more = await loop.run_in_executor(None, poll, self.seq)
+        for change in items:
+            self.publish(change)
+            self.seq = change.pk
+        return has_more
+
+    async def run_poller(self):
+        while True:
+            try:
+                if await self.poll_once():
+                    continue
+            except Exception:
+                logger.exception('Не удалось прочитать журнал изменений')
+            await asyncio.sleep(settings.EVENTS_POLL_INTERVAL)
+
+
+async def read_request(reader):
+    """Строка запроса и заголовки HTTP/1.1 (только GET без тела)."""
+    line = await reader.readline()
+    parts = line.decode('latin-1').split()
+    if len(parts) != 3:
+        raise ValueError('Плохая строка запроса')
+    method, path, version = parts
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b'\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        headers[name.strip().lower()] = value.strip()
+        if len(headers) > 100:
+            raise ValueError('Слишком много заголовков')
+    return method, path, headers
+
+
+async def stream(subscriber, reader, writer, sent):
+    """Пересылает клиенту изменения из очереди, пока он не отключится.
+
+    Клиент после запроса ничего не шлёт, поэтому конец чтения означает,
+    что соединение закрыто: подписка снимается сразу, а не при
+    следующей записи.
+    """
+    closed = asyncio.ensure_future(reader.read(1))
+    try:
+        while not subscriber.lagging:
+            getter = asyncio.ensure_future(subscriber.queue.get())
+            done, pending = await asyncio.wait(
+                {getter, closed}, timeout=settings.EVENTS_HEARTBEAT,
+                return_when=asyncio.FIRST_COMPLETED,
+            )
+            if closed in done:
+                getter.cancel()
+                return
+            if getter in done:
+                change = getter.result()
+                if change.pk <= sent:
+                    continue
+                writer.write(format_event(change))
+                sent = change.pk
+            else:
+                getter.cancel()
+                writer.write(b': ping\n\n')
+            await writer.drain()
+    finally:
+        closed.cancel()
+
+
+def _status(writer, status):
+    writer.write(
+        f'HTTP/1.1 {status}\r\nContent-Length: 0\r\n'
+        f'Connection: close\r\n\r\n'.encode()
+    )
+
+
+async def handle(hub, reader, writer):
+    loop = asyncio.get_running_loop()
+    subscriber = Subscriber()
+    channels = []
+    try:
+        method, path, headers = await asyncio.wait_for(
+            read_request(reader), settings.EVENTS_HEARTBEAT
+        )
+        if method != 'GET':
+            _status(writer, '405 Method Not Allowed')
+            return
+        try:
+            channels, log = await loop.run_in_executor(
+                None, subscribe, path, headers
+            )
+        except (NotFound, Unauthorized) as error:
+            _status(writer, error.status)
+            return
+        # Подписка раньше досылки: изменения, пришедшие во время неё,
+        # ждут в очереди, а повторы отсекаются по номеру.
+        hub.add(channels, subscriber)
+        writer.write(
+            b'HTTP/1.1 200 OK\r\n'
+            b'Content-Type: text/event-stream\r\n'
+            b'Cache-Control: no-cache\r\n'
+            b'X-Accel-Buffering: no\r\n'
+            b'Connection: keep-alive\r\n\r\n'
+            b'retry: 3000\n\n'
+        )
+        sent = parse_id(headers.get('last-event-id')) or 0
+        if sent:
+            missed = await loop.run_in_executor(None, replay, log, sent)
+            if missed is None:
+                writer.write(b'event: reset\ndata: {}\n\n')
+                return
+            for change in missed:
+                writer.write(format_event(change))
+                sent = change.pk
+        await writer.drain()
+        await stream(subscriber, reader, writer, sent)
+    except (ConnectionError, asyncio.TimeoutError, ValueError):
+        pass
+    finally:
+        hub.remove(channels, subscriber)
+        writer.close()
+
+
+async def serve(host, port, hub=None):
+    """Запускает опросчик и сервер; возвращает asyncio.Server."""
+    hub = hub or Hub()
+    server = await asyncio.start_server(
+        lambda reader, writer: handle(hub, reader, writer), host, port,
+        limit=8192,
+    )
+    server.poller = asyncio.ensure_future(hub.run_poller())
+    server.hub = hub
+    return server
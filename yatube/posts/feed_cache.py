@@ -0,0 +1,144 @@
+"""Версии лент для условных GET.
+
+Запись поста или комментария меняет версии лент, где он виден. Версии
+служат валидатором ETag: страница, ленты которой не менялись,
+отдаётся ответом 304 без запросов к базе и рендеринга.
+
+С репликами (core/routers.py) страница может быть собрана из данных,
+которые старше версии: реплика ещё не получила запись. Поэтому версия
+сменяется ещё раз через REPLICA_PIN_SECONDS после записи, когда реплики
+догнали основную базу, и такой ETag перестаёт совпадать.
+
+Фрагменты лент в шаблонах кешируются не по версиям, а по версиям
+карточек постов страницы (см. cards.fragment): комментарий меняет
+ключ только тех страниц, где виден его пост.
+"""
+import hashlib
+import time
+import uuid
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils.cache import patch_cache_control, patch_vary_headers
+from django.views.decorators.http import condition
+
+VERSION_KEY = 'feed_version:{}'
+# Имя общего поколения: оно входит во все версии лент.
+GENERATION = '*'
+
+
+def new_version():
+    return uuid.uuid4().hex
+
+
+def stamp():
+    """Значение для кеша: версия и, если есть реплики, время, после
+    которого она сменится ещё раз."""
+    if not settings.DATABASE_REPLICAS:
+        return new_version()
+    return new_version(), time.time() + settings.REPLICA_PIN_SECONDS
+
+
+def current(value):
+    """Версия из значения в кеше. После отметки времени она сменяется
+    одинаково во всех процессах, без записи в кеш."""
+    if isinstance(value, str):
+        return value
+    version, settle_at = value
+    return version if time.time() < settle_at else f'{version}.settled'
+
+
+def _stored_versions(feeds):
+    keys = {VERSION_KEY.format(feed): feed for feed in feeds}
+    versions = cache.get_many(keys)
+    missing = {key: stamp() for key in keys if key not in versions}
+    if missing:
+        for key, version in missing.items():
+            if not cache.add(key, version, None):
+                missing[key] = cache.get(key, version)
+        versions.update(missing)
+    return {keys[key]: current(value) for key, value in versions.items()}
+
+
+def get_versions(feeds):
+    """Текущие версии лент; вытесненные из кеша версии создаются заново,
+    чтобы не совпасть со значением, под которым лежит старый фрагмент.
+    Каждая версия включает общее поколение (см. bump_all)."""
+    versions = _stored_versions([*feeds, GENERATION])
+    generation = versions.pop(GENERATION)
+    return {
+        feed: f'{generation}.{version}' for feed, version in versions.items()
+    }
+
+
+def bump(feeds):
+    cache.set_many({VERSION_KEY.format(feed): stamp() for feed in feeds}, None)
+
+
+def bump_all():
+    """Сбрасывает версии всех лент после записей без сигналов (загрузка,
+    наполнение базы). Остальной кеш не трогается."""
+    bump([GENERATION])
+
+
+def bump_on_commit(feeds):
+    """Меняет версии сейчас и ещё раз после фиксации: процесс,
+    прочитавший базу до фиксации, мог успеть взять уже новую версию
+    и сохранить её вместе со старыми данными."""
+    bump(feeds)
+    transaction.on_commit(lambda: bump(feeds))
+
+
+def post_feeds(post, old_group_id=None):
+    """Ленты, в которых показывается пост."""
+    feeds = ['index', f'profile:{post.author_id}', f'post:{post.pk}']
+    for group_id in {post.group_id, old_group_id} - {None}:
+        feeds.append(f'group:{group_id}')
+    return feeds
+
+
+def touch_post(post, old_group_id=None):
+    """Сбрасывает кеш всех лент, где виден пост. Лента подписок
+    зависит от версий профилей авторов и сбрасывается вместе с ними."""
+    bump_on_commit(post_feeds(post, old_group_id))
+
+
+def etag(request, feeds):
+    """Валидатор страницы: адрес с параметрами, пользователь и версии
+    лент, из которых она собрана."""
+    versions = get_versions(feeds)
+    user = request.user.pk if request.user.is_authenticated else 'anon'
+    stamp = '|'.join([
+        request.get_full_path(), str(user),
+        *(f'{feed}={versions[feed]}' for feed in sorted(feeds)),
+    ])
+    return hashlib.md5(stamp.encode()).hexdigest()
+
+
+def conditional(feeds):
+    """Условный GET для страницы, собранной из лент feeds(request, ...).
+
+    Страница зависит от пользователя, поэтому ответ помечается
+    Vary: Cookie, а страницы вошедших пользователей — ещё и private,
+    чтобы общие кеши не отдали их другим.
+    """
+    def decorator(view):
+        conditional_view = condition(
+            etag_func=lambda request, *args, **kwargs: etag(
+                request, feeds(request, *args, **kwargs)
+            )
+        )(view)
+
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            response = conditional_view(request, *args, **kwargs)
+            patch_vary_headers(response, ('Cookie',))
+            patch_cache_control(
+                response, no_cache=True,
+                private=request.user.is_authenticated,
+            )
+            return response
+        return wrapper
+    return decorator
@@ -0,0 +1,212 @@
+"""Материализованная лента подписок (fan-out on write).
+
+При публикации пост раскладывается в FeedItem каждого подписчика
+автора. Авторы с огромным числом подписчиков обрабатываются гибридно:
+их посты не раскладываются, а подмешиваются в ленту при чтении.
+
+Лента листается по FeedItem: диапазон индекса (user, -pub_date,
+-post_id) читается без сортировки и без соединения с постами, посты
+страницы загружаются потом одним запросом по id.
+"""
+from itertools import groupby
+from operator import itemgetter
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, Q
+
+from .models import FeedItem, Follow, Post
+from .paginators import CursorPaginator, newer_than, older_than
+
+PULL_AUTHORS_KEY = 'feeds:pull_authors'
+PULL_AUTHORS_TIMEOUT = 60 * 10
+BATCH_SIZE = 500
+
+
+def pull_authors():
+    """id авторов, чьи посты подмешиваются в ленты при чтении."""
+    authors = cache.get(PULL_AUTHORS_KEY)
+    if authors is None:
+        authors = set(
+            Follow.objects.values('author')
+            .annotate(followers=Count('user'))
+            .filter(followers__gt=settings.FEED_FANOUT_LIMIT)
+            .values_list('author', flat=True)
+        )
+        cache.set(PULL_AUTHORS_KEY, authors, PULL_AUTHORS_TIMEOUT)
+    return authors
+
+
+def is_pull_author(author_id):
+    followers = Follow.objects.filter(author=author_id).order_by('pk')
+    return followers[settings.FEED_FANOUT_LIMIT:].exists()
+
+
+def fan_out(post):
+    """Раскладывает новый пост по лентам подписчиков автора."""
+    limit = settings.FEED_FANOUT_LIMIT
+    followers = list(
+        Follow.objects.filter(author=post.author_id)
+        .values_list('user', flat=True)[:limit + 1]
+    )
+    if len(followers) > limit:
+        cache.delete(PULL_AUTHORS_KEY)
+        return
+    FeedItem.objects.bulk_create(
+        [
+            FeedItem(
+                user_id=user_id,
+                post=post,
+                author_id=post.author_id,
+                pub_date=post.pub_date,
+            )
+            for user_id in followers
+        ],
+        batch_size=BATCH_SIZE,
+        ignore_conflicts=True,
+    )
+
+
+def _add_items(user_ids, author_id):
+    """Раскладывает последние посты автора в ленты пользователей."""
+    posts = list(
+        Post.objects.filter(author=author_id)
+        .order_by('-pub_date', '-id')
+        .values_list('id', 'pub_date')[:settings.FEED_BACKFILL_SIZE]
+    )
+    FeedItem.objects.bulk_create(
+        [
+            FeedItem(
+                user_id=user_id,
+                post_id=post_id,
+                author_id=author_id,
+                pub_date=pub_date,
+            )
+            for user_id in user_ids
+            for post_id, pub_date in posts
+        ],
+        batch_size=BATCH_SIZE,
+        ignore_conflicts=True,
+    )
+
+
+def backfill(follow):
+    """Добавляет в ленту подписчика последние посты нового автора."""
+    if is_pull_author(follow.author_id):
+        cache.delete(PULL_AUTHORS_KEY)
+        return
+    _add_items([follow.user_id], follow.author_id)
+
+
+def rebuild(chunk_size=BATCH_SIZE):
+    """Раскладывает последние посты авторов по лентам всех подписчиков.
+
+    Подписки читаются по авторам, и посты автора загружаются один раз
+    на всех его подписчиков. Отдаёт число обработанных подписок после
+    каждого автора.
+    """
+    follows = (
+        Follow.objects.order_by('author', 'user')
+        .values_list('author', 'user').iterator(chunk_size=chunk_size)
+    )
+    done = 0
+    for author_id, rows in groupby(follows, key=itemgetter(0)):
+        user_ids = [user_id for _, user_id in rows]
+        if len(user_ids) <= settings.FEED_FANOUT_LIMIT:
+            _add_items(user_ids, author_id)
+        done += len(user_ids)
+        yield done
+    cache.delete(PULL_AUTHORS_KEY)
+
+
+def cleanup(follow):
+    """Убирает из ленты посты автора, от которого отписались.
+
+    Если после отписки у автора ровно FEED_FANOUT_LIMIT подписчиков,
+    он только что перестал быть pull-автором: посты, которые при нём
+    не раскладывались, раскладываются в ленты оставшихся подписчиков.
+    """
+    FeedItem.objects.filter(
+        user=follow.user_id, author=follow.author_id
+    ).delete()
+    limit = settings.FEED_FANOUT_LIMIT
+    followers = Follow.objects.filter(author=follow.author_id).order_by('pk')
+    if limit and len(followers[limit - 1:limit + 1]) == 1:
+        cache.delete(PULL_AUTHORS_KEY)
+        _add_items(
+            followers.values_list('user', flat=True).iterator(),
+            follow.author_id,
+        )
+
+
+def pulled_authors(user):
+    """Pull-авторы из подписок пользователя."""
+    pulled = pull_authors()
+    if not pulled:
+        return []
+    return list(
+        Follow.objects.filter(user=user, author__in=pulled)
+        .values_list('author', flat=True)
+    )
+
+
+def follow_feed(user, pulled=None):
+    """Посты ленты подписок пользователя (для нумерованных страниц).
+
+    pulled — уже прочитанные pull-авторы пользователя, чтобы лента и
+    FollowPaginator не читали их дважды.
+    """
+    if pulled is None:
+        pulled = pulled_authors(user)
+    if not pulled:
+        return Post.objects.filter(feed_items__user=user)
+    feed = FeedItem.objects.filter(user=user).values('post')
+    return Post.objects.filter(Q(pk__in=feed) | Q(author__in=pulled))
+
+
+class FollowPaginator(CursorPaginator):
+    """Курсорные страницы ленты подписок.
+
+    object_list — выборка постов, из которой загружаются посты страницы
+    (с нужными select_related и only). Ключи страницы берутся из
+    FeedItem, посты pull-авторов — отдельным диапазоном по индексу
+    (author, -pub_date, -id); обе выборки сливаются по ключу.
+    """
+
+    def __init__(self, object_list, per_page, user, pulled=None):
+        super().__init__(object_list, per_page)
+        self.pulled = pulled_authors(user) if pulled is None else pulled
+        # Посты, разложенные до того, как автор стал pull-автором,
+        # уже есть среди его постов.
+        self.items = FeedItem.objects.filter(user=user).exclude(
+            author__in=self.pulled
+        )
+
+    def _keys(self, key, older, limit):
+        """(pub_date, id) ближайших к ключу постов ленты."""
+        compare = older_than if older else newer_than
+        direction = '-' if older else ''
+        items = self.items
+        if key is not None:
+            items = items.filter(compare(key, id_field='post_id'))
+        keys = list(
+            items.order_by(f'{direction}pub_date', f'{direction}post_id')
+            .values_list('pub_date', 'post_id')[:limit]
+        )
+        if self.pulled:
+            posts = Post.objects.filter(author__in=self.pulled)
+            if key is not None:
+                posts = posts.filter(compare(key))
+            keys += posts.order_by(
+                f'{direction}pub_date', f'{direction}id'
+            ).values_list('pub_date', 'id')[:limit]
+            keys = sorted(keys, reverse=older)[:limit]
+        return keys
+
+    def _slice(self, key, older, limit):
+        keys = self._keys(key, older, limit)
+        posts = self.object_list.in_bulk([pk for date, pk in keys])
+        return [posts[pk] for date, pk in keys if pk in posts]
+
+    def _exists(self, key, older):
+        return bool(self._keys(key, older, 1))
@@ -0,0 +1,176 @@
+"""Граф подписок в кеше.
+
+Для каждого пользователя в кеше лежат два отсортированных массива id:
+на кого он подписан и кто подписан на него, и отдельно пара счётчиков.
+Массив — упакованные восьмибайтовые числа, так что даже у популярного
+автора запись компактна, а проверка «подписан ли A на B» — двоичный
+поиск в памяти. Профилю хватает счётчиков автора, и массив его
+подписчиков при этом не читается. Через L1 кеша всё это читается без
+обращений к диску и базе.
+
+Записи лежат под версиями лент follows:<id> и followers:<id> (см.
+feed_cache), которые подписка и отписка меняют после фиксации
+транзакции. Версии читаются до запроса к базе, поэтому процесс,
+прочитавший граф до подписки, кладёт его под старую версию, и свежую
+запись он не затирает. Записи старых версий никто не читает, их
+вытесняет кеш или срок жизни.
+"""
+from array import array
+from bisect import bisect_left
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Q
+
+from . import feed_cache
+from .models import Follow
+
+FOLLOWING = 'following'
+FOLLOWERS = 'followers'
+GRAPH_KEY = 'follow_graph:{}:{}:{}'
+COUNTS_KEY = 'follow_counts:{}:{}:{}'
+
+
+def _contains(ids, value):
+    index = bisect_left(ids, value)
+    return index < len(ids) and ids[index] == value
+
+
+def _versions(user_ids):
+    """Версии обеих сторон графа пользователей."""
+    feeds = {}
+    for user_id in user_ids:
+        feeds[user_id, FOLLOWING] = f'follows:{user_id}'
+        feeds[user_id, FOLLOWERS] = f'followers:{user_id}'
+    versions = feed_cache.get_versions(feeds.values())
+    return {side: versions[feed] for side, feed in feeds.items()}
+
+
+def _keys(user_id, versions):
+    sides = {
+        side: GRAPH_KEY.format(side, user_id, versions[user_id, side])
+        for side in (FOLLOWING, FOLLOWERS)
+    }
+    counts = COUNTS_KEY.format(
+        user_id, versions[user_id, FOLLOWERS], versions[user_id, FOLLOWING]
+    )
+    return sides, counts
+
+
+def _load(user_ids, versions):
+    """Обе стороны графа пользователей из базы одним запросом; сразу
+    кладутся в кеш под версиями, прочитанными до запроса."""
+    graph = {
+        user_id: {FOLLOWING: [], FOLLOWERS: []} for user_id in user_ids
+    }
+    rows = Follow.objects.filter(
+        Q(user__in=user_ids) | Q(author__in=user_ids)
+    ).values_list('user_id', 'author_id')
+    for user_id, author_id in rows:
+        if user_id in graph:
+            graph[user_id][FOLLOWING].append(author_id)
+        if author_id in graph:
+            graph[author_id][FOLLOWERS].append(user_id)
+    result = {}
+    values = {}
+    for user_id, sides in graph.items():
+        result[user_id] = {
+            side: array('q', sorted(ids)) for side, ids in sides.items()
+        }
+        keys, counts_key = _keys(user_id, versions)
+        for side, key in keys.items():
+            values[key] = result[user_id][side].tobytes()
+        values[counts_key] = (
+            len(sides[FOLLOWERS]), len(sides[FOLLOWING])
+        )
+    cache.set_many(values, settings.FOLLOW_GRAPH_TIMEOUT)
+    return result
+
+
+class Graph:
+    """Часть графа вокруг нескольких пользователей."""
+
+    def __init__(self, sides, counts):
+        self.sides = sides
+        self._counts = counts
+
+    @classmethod
+    def load(cls, user_ids, sides=(FOLLOWING, FOLLOWERS), counts=()):
+        """Граф пользователей: стороны sides для user_ids и счётчики
+        для counts. Два get_many (версии и записи) и не больше одного
+        запроса к базе для тех, кого нет в кеше."""
+        user_ids = {user_id for user_id in user_ids if user_id is not None}
+        counts = {user_id for user_id in counts if user_id is not None}
+        versions = _versions(user_ids | counts)
+        keys = {}
+        for user_id in user_ids:
+            side_keys, _ = _keys(user_id, versions)
+            for side in sides:
+                keys[side_keys[side]] = (user_id, side)
+        for user_id in counts:
+            _, counts_key = _keys(user_id, versions)
+            keys[counts_key] = (user_id, None)
+        found = cache.get_many(keys)
+        graph = {user_id: {} for user_id in user_ids}
+        numbers = {}
+        for key, value in found.items():
+            user_id, side = keys[key]
+            if side is None:
+                numbers[user_id] = value
+                continue
+            ids = array('q')
+            ids.frombytes(value)
+            graph[user_id][side] = ids
+        missing = {
+            user_id for user_id, got in graph.items() if len(got) < len(sides)
+        } | (counts - set(numbers))
+        if missing:
+            loaded = _load(missing, versions)
+            for user_id, user_sides in loaded.items():
+                if user_id in graph:
+                    graph[user_id] = user_sides
+                numbers[user_id] = (
+                    len(user_sides[FOLLOWERS]), len(user_sides[FOLLOWING])
+                )
+        return cls(graph, numbers)
+
+    def following(self, user_id):
+        return self.sides[user_id][FOLLOWING]
+
+    def followers(self, user_id):
+        return self.sides[user_id][FOLLOWERS]
+
+    def follows(self, user_id, author_id):
+        """True, если user_id подписан на author_id."""
+        if user_id not in self.sides:
+            return False
+        return _contains(self.following(user_id), author_id)
+
+    def mutual(self, user_id, other_id):
+        """True, если пользователи подписаны друг на друга."""
+        return (self.follows(user_id, other_id)
+                and self.follows(other_id, user_id))
+
+    def counts(self, user_id):
+        """Пара (число подписчиков, число подписок)."""
+        return self._counts[user_id]
+
+
+def following(user_id):
+    return Graph.load([user_id], sides=(FOLLOWING,)).following(user_id)
+
+
+def follows(user_id, author_id):
+    return Graph.load([user_id], sides=(FOLLOWING,)).follows(
+        user_id, author_id
+    )
+
+
+def mutual(user_id, other_id):
+    return Graph.load([user_id, other_id], sides=(FOLLOWING,)).mutual(
+        user_id, other_id
+    )
+
+
+def counts(user_id):
+    return Graph.load([], counts=[user_id]).counts(user_id)
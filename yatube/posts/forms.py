@@ -1,5 +1,11 @@
+from concurrent.futures import TimeoutError
+from concurrent.futures.process import BrokenProcessPool
+
 from django import forms
+from django.core.files.uploadedfile import UploadedFile
+from PIL import Image
 
+from . import images
 from .models import Post, Comment
 
 
@@ -12,6 +18,25 @@ class PostForm(forms.ModelForm):
             'group': 'Группа, к которой будет относиться пост'
         }
 
+    def clean_image(self):
+        image = self.cleaned_data.get('image')
+        # Нормализуется только новая загрузка, а не уже сохранённый файл.
+        if not isinstance(image, UploadedFile):
+            return image
+        try:
+            return images.normalize_upload(image)
+        except TimeoutError:
+            raise forms.ValidationError(
+                'Изображение обрабатывается слишком долго.'
+            )
+        # Обрезанный или битый файл проходит проверку ImageField, которая
+        # читает только заголовок, и ломается при декодировании в пуле.
+        except (OSError, SyntaxError, ValueError,
+                Image.DecompressionBombError, BrokenProcessPool):
+            raise forms.ValidationError(
+                'Не удалось обработать изображение. Загрузите другой файл.'
+            )
+
 
 class CommentForm(forms.ModelForm):
     class Meta:
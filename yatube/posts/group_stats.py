@@ -0,0 +1,126 @@
+"""Сводка групп для каталога и шапки группы.
+
+Время последнего поста обновляется сразу при публикации одним UPDATE.
+Самых активных авторов дёшево поддерживать на лету не получается,
+поэтому публикация, удаление и перенос поста только помечают сводку
+группы устаревшей, а refresh_group_stats периодически пересчитывает
+помеченные группы пачками. Каталог читает готовые строки одним
+запросом, сколько бы постов ни было в группах.
+"""
+import json
+from collections import defaultdict
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db.models import Case, Count, F, Max, Q, Value, When
+from django.utils import timezone
+
+from . import feed_cache
+from .models import Group, GroupStats, Post
+
+User = get_user_model()
+
+
+def post_saved(post, created, old_group_id=None):
+    """Новый пост сдвигает время последнего поста; новый или
+    перенесённый — меняет состав авторов."""
+    if not created and old_group_id == post.group_id:
+        return
+    if post.group_id is not None:
+        GroupStats.objects.filter(group_id=post.group_id).update(
+            dirty=True,
+            last_post_at=Case(
+                When(last_post_at__gte=post.pub_date,
+                     then=F('last_post_at')),
+                default=Value(post.pub_date),
+            ),
+        )
+    if old_group_id is not None and old_group_id != post.group_id:
+        mark_dirty([old_group_id])
+
+
+def mark_dirty(group_ids):
+    GroupStats.objects.filter(group_id__in=group_ids).update(dirty=True)
+
+
+def _top_authors(group_ids):
+    """Время последнего поста и самые активные авторы групп."""
+    rows = (
+        Post.objects.filter(group_id__in=group_ids).order_by()
+        .values('group_id', 'author_id')
+        .annotate(posts=Count('pk'), last=Max('pub_date'))
+    )
+    last = {}
+    authors = defaultdict(list)
+    for row in rows:
+        group_id = row['group_id']
+        if group_id not in last or row['last'] > last[group_id]:
+            last[group_id] = row['last']
+        authors[group_id].append((-row['posts'], row['author_id']))
+    top = {
+        group_id: sorted(counts)[:settings.GROUP_TOP_AUTHORS]
+        for group_id, counts in authors.items()
+    }
+    user_ids = {author_id for counts in top.values()
+                for posts, author_id in counts}
+    users = User.objects.in_bulk(user_ids)
+    return last, {
+        group_id: [
+            {
+                'username': users[author_id].username,
+                'name': users[author_id].get_full_name(),
+                'posts': -posts,
+            }
+            for posts, author_id in counts
+        ]
+        for group_id, counts in top.items()
+    }
+
+
+def refresh(group_ids):
+    """Пересчитывает сводки групп и сбрасывает кеш их страниц.
+
+    Пометка снимается до подсчёта: пост, опубликованный во время
+    пересчёта, снова пометит группу, и она не потеряется.
+    """
+    GroupStats.objects.bulk_create(
+        [GroupStats(group_id=group_id) for group_id in group_ids],
+        ignore_conflicts=True,
+    )
+    GroupStats.objects.filter(group_id__in=group_ids).update(dirty=False)
+    last, top = _top_authors(group_ids)
+    now = timezone.now()
+    GroupStats.objects.bulk_update(
+        [
+            GroupStats(
+                group_id=group_id,
+                last_post_at=last.get(group_id),
+                top_authors_data=json.dumps(
+                    top.get(group_id, []), ensure_ascii=False
+                ),
+                refreshed=now,
+            )
+            for group_id in group_ids
+        ],
+        ['last_post_at', 'top_authors_data', 'refreshed'],
+    )
+    feed_cache.bump([f'group:{group_id}' for group_id in group_ids])
+
+
+def refresh_all(batch_size, dirty_only=True):
+    """Пересчитывает группы пачками; возвращает их число."""
+    groups = Group.objects.order_by('pk')
+    if dirty_only:
+        groups = groups.filter(Q(stats__dirty=True) | Q(stats=None))
+    total = 0
+    last_pk = 0
+    while True:
+        batch = list(
+            groups.filter(pk__gt=last_pk).values_list('pk', flat=True)
+            [:batch_size]
+        )
+        if not batch:
+            return total
+        refresh(batch)
+        total += len(batch)
+        last_pk = batch[-1]
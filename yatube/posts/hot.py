@@ -0,0 +1,118 @@
+"""Рейтинг популярных постов по недавним комментариям.
+
+Счёт поста — сумма exp(-(now - t) / HOT_DECAY_SECONDS) по временам t
+его комментариев: свежий комментарий весит единицу, и вес затухает
+экспоненциально. В таблице HotPost хранится не сам счёт, а
+rank = ln(счёт) + now / HOT_DECAY_SECONDS. Он от now не зависит:
+комментарий в момент t превращает rank в logaddexp(rank, t / τ), а
+текущий счёт равен exp(rank - now / τ). Поэтому add_comment меняет
+одну строку, порядок ленты — индекс по rank, а периодическое задание
+decay_hot_posts пачками удаляет строки, счёт которых затух ниже
+HOT_MIN_SCORE, и держит в таблице не больше HOT_TABLE_SIZE строк.
+"""
+import datetime
+import math
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .models import Comment, HotPost, Post
+
+
+def point(moment):
+    """Момент времени в единицах HOT_DECAY_SECONDS."""
+    return moment.timestamp() / settings.HOT_DECAY_SECONDS
+
+
+def logaddexp(a, b):
+    """ln(e^a + e^b) без переполнения."""
+    high, low = max(a, b), min(a, b)
+    return high + math.log1p(math.exp(low - high))
+
+
+def score(rank, now=None):
+    """Текущий счёт строки рейтинга."""
+    return math.exp(rank - point(now or timezone.now()))
+
+
+def comment_added(comment):
+    value = point(comment.created)
+    with transaction.atomic():
+        hot, created = HotPost.objects.select_for_update().get_or_create(
+            post_id=comment.post_id, defaults={'rank': value}
+        )
+        if not created:
+            HotPost.objects.filter(pk=hot.pk).update(
+                rank=logaddexp(hot.rank, value)
+            )
+
+
+def top(limit=None):
+    """Первые посты рейтинга одним запросом."""
+    return (
+        Post.objects.filter(hot__isnull=False)
+        .select_related('author', 'group', 'hot')
+        .order_by('-hot__rank', '-pk')[:limit or settings.HOT_FEED_SIZE]
+    )
+
+
+def _floor(now):
+    """rank, ниже которого счёт меньше HOT_MIN_SCORE."""
+    return point(now) + math.log(settings.HOT_MIN_SCORE)
+
+
+def _delete_below(rank, batch_size):
+    removed = 0
+    while True:
+        batch = list(
+            HotPost.objects.filter(rank__lt=rank).order_by('rank')
+            .values_list('pk', flat=True)[:batch_size]
+        )
+        if not batch:
+            return removed
+        removed += HotPost.objects.filter(pk__in=batch).delete()[0]
+
+
+def decay(batch_size, now=None):
+    """Удаляет затухшие строки и обрезает таблицу до HOT_TABLE_SIZE.
+
+    Возвращает число удалённых строк.
+    """
+    removed = _delete_below(_floor(now or timezone.now()), batch_size)
+    cutoff = list(
+        HotPost.objects.order_by('-rank').values_list('rank', flat=True)
+        [settings.HOT_TABLE_SIZE - 1:settings.HOT_TABLE_SIZE]
+    )
+    if cutoff:
+        removed += _delete_below(cutoff[0], batch_size)
+    return removed
+
+
+def rebuild(batch_size, now=None):
+    """Собирает рейтинг заново по комментариям, которые ещё не
+    затухли; нужно после загрузки данных в обход сигналов.
+
+    Возвращает число постов в рейтинге.
+    """
+    now = now or timezone.now()
+    window = settings.HOT_DECAY_SECONDS * -math.log(settings.HOT_MIN_SCORE)
+    since = now - datetime.timedelta(seconds=window)
+    ranks = {}
+    comments = (
+        Comment.objects.filter(created__gte=since).order_by()
+        .values_list('post_id', 'created').iterator(chunk_size=batch_size)
+    )
+    for post_id, created in comments:
+        value = point(created)
+        rank = ranks.get(post_id)
+        ranks[post_id] = value if rank is None else logaddexp(rank, value)
+    best = sorted(ranks.items(), key=lambda item: -item[1])
+    best = best[:settings.HOT_TABLE_SIZE]
+    with transaction.atomic():
+        HotPost.objects.all().delete()
+        HotPost.objects.bulk_create(
+            [HotPost(post_id=post_id, rank=rank) for post_id, rank in best],
+            batch_size=batch_size,
+        )
+    return len(best)
@@ -0,0 +1,101 @@
+"""Обработка картинок постов при загрузке.
+
+Загруженная картинка поворачивается по EXIF, уменьшается до
+IMAGE_MAX_SIZE по большей стороне и перекодируется без метаданных.
+Декодирование выполняется в пуле процессов, общем с генерацией
+миниатюр, поэтому веб-воркер только ждёт результат.
+"""
+import io
+import os
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+
+import django
+from django.conf import settings
+from django.core.files.uploadedfile import SimpleUploadedFile
+from PIL import Image, ImageOps
+
+# Форматы, которые сохраняются как есть; остальные (BMP, TIFF, MPO с
+# телефонов) перекодируются в JPEG, а с прозрачностью — в PNG.
+KEEP_FORMATS = {'JPEG': 'jpg', 'PNG': 'png', 'GIF': 'gif', 'WEBP': 'webp'}
+CONTENT_TYPES = {
+    'JPEG': 'image/jpeg', 'PNG': 'image/png',
+    'GIF': 'image/gif', 'WEBP': 'image/webp',
+}
+
+_executor = None
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(
+            max_workers=settings.IMAGE_WORKERS,
+            mp_context=get_context('spawn'),
+            initializer=django.setup,
+        )
+    return _executor
+
+
+def run(func, *args, timeout=None):
+    """Выполняет func в пуле и ждёт результат.
+
+    При IMAGE_WORKERS = 0 вызывает её в текущем процессе.
+    """
+    if not settings.IMAGE_WORKERS:
+        return func(*args)
+    return get_executor().submit(func, *args).result(timeout)
+
+
+def has_alpha(image):
+    return image.mode in ('RGBA', 'LA', 'PA') or (
+        image.mode == 'P' and 'transparency' in image.info
+    )
+
+
+def normalize(data):
+    """Нормализованная картинка: пара (байты, формат).
+
+    Выполняется в процессе пула. Анимированные картинки не трогаются:
+    перекодирование оставило бы от них один кадр, тогда возвращается None.
+    """
+    image = Image.open(io.BytesIO(data))
+    if getattr(image, 'is_animated', False):
+        return None
+    source_format = image.format
+    image = ImageOps.exif_transpose(image)
+    max_size = settings.IMAGE_MAX_SIZE
+    image.thumbnail((max_size, max_size), Image.LANCZOS)
+    if source_format in KEEP_FORMATS:
+        image_format = source_format
+    elif has_alpha(image):
+        image_format = 'PNG'
+    else:
+        image_format = 'JPEG'
+    options = {}
+    if image_format in ('JPEG', 'WEBP'):
+        options = {'quality': settings.IMAGE_QUALITY, 'optimize': True}
+        if image_format == 'JPEG':
+            options['progressive'] = True
+            if image.mode != 'RGB':
+                image = image.convert('RGB')
+    elif image_format == 'PNG':
+        options = {'optimize': True}
+    output = io.BytesIO()
+    # Метаданные (EXIF, ICC, XMP) не передаются и в файл не попадают.
+    image.save(output, image_format, **options)
+    return output.getvalue(), image_format
+
+
+def normalize_upload(upload):
+    """Загруженный файл после нормализации в пуле процессов."""
+    upload.seek(0)
+    result = run(
+        normalize, upload.read(), timeout=settings.IMAGE_PROCESS_TIMEOUT
+    )
+    upload.seek(0)
+    if result is None:
+        return upload
+    data, image_format = result
+    name = f'{os.path.splitext(upload.name)[0]}.{KEEP_FORMATS[image_format]}'
+    return SimpleUploadedFile(name, data, CONTENT_TYPES[image_format])
@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+
+from posts import hot
+
+
+class Command(BaseCommand):
+    help = ('Удаляет из рейтинга популярного затухшие посты; с --rebuild '
+            'собирает рейтинг заново по комментариям.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--rebuild', action='store_true',
+            help='Пересобрать рейтинг по комментариям.'
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Сколько строк удалять или вставлять за раз.'
+        )
+
+    def handle(self, *args, **options):
+        if options['rebuild']:
+            total = hot.rebuild(options['batch_size'])
+            self.stdout.write(self.style.SUCCESS(
+                f'Рейтинг пересобран, постов: {total}.'
+            ))
+            return
+        removed = hot.decay(options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Затухших постов удалено: {removed}.'
+        ))
@@ -0,0 +1,42 @@
+import sys
+
+from django.core.management.base import BaseCommand
+
+from posts import transfer
+
+
+class Command(BaseCommand):
+    help = 'Выгружает группы, посты, комментарии и подписки в NDJSON.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'path', help='Файл для выгрузки; «-» — стандартный вывод.'
+        )
+        parser.add_argument(
+            '--models', default=','.join(transfer.MODELS),
+            help='Какие модели выгружать, через запятую.'
+        )
+        parser.add_argument(
+            '--chunk-size', type=int, default=2000,
+            help='Сколько строк читать из базы за раз.'
+        )
+
+    def handle(self, *args, **options):
+        models = options['models'].split(',')
+        # Прогресс пишется в stderr, чтобы не смешиваться с выгрузкой.
+        progress = transfer.Progress(
+            self.stderr.write, options['chunk_size'] * 10
+        )
+        if options['path'] == '-':
+            transfer.export(
+                sys.stdout, models, options['chunk_size'], progress
+            )
+        else:
+            with open(options['path'], 'w', encoding='utf-8') as out:
+                transfer.export(out, models, options['chunk_size'], progress)
+        self.stderr.write(self.style.SUCCESS(
+            'Выгружено: ' + ', '.join(
+                f'{model} {count}'
+                for model, count in progress.counts.items()
+            )
+        ))
@@ -0,0 +1,48 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from posts import thumbnails
+from posts.models import Post
+
+
+class Command(BaseCommand):
+    help = 'Создаёт недостающие миниатюры картинок постов.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--chunk-size', type=int, default=100,
+            help='Сколько картинок отдавать пулу за раз.'
+        )
+
+    def handle(self, *args, **options):
+        chunk_size = options['chunk_size']
+        images = (
+            Post.objects.exclude(image='').exclude(image__isnull=True)
+            .order_by('image')
+            .values_list('image', flat=True).distinct()
+        )
+        started = time.monotonic()
+        checked = created = failed = 0
+        chunk = []
+        for name in images.iterator(chunk_size=chunk_size):
+            checked += 1
+            if thumbnails.missing(name):
+                chunk.append(name)
+            if len(chunk) < chunk_size:
+                continue
+            errors = thumbnails.generate(chunk)
+            created += len(chunk) - errors
+            failed += errors
+            chunk = []
+            self.stdout.write(
+                f'Проверено: {checked}, создано: {created}, '
+                f'ошибок: {failed}, {time.monotonic() - started:.1f} с'
+            )
+        errors = thumbnails.generate(chunk)
+        created += len(chunk) - errors
+        failed += errors
+        self.stdout.write(self.style.SUCCESS(
+            f'Проверено картинок: {checked}, созданы миниатюры: {created}, '
+            f'ошибок: {failed}.'
+        ))
@@ -0,0 +1,52 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from posts import transfer
+
+
+class Command(BaseCommand):
+    help = 'Загружает группы, посты, комментарии и подписки из NDJSON.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'path', help='Файл с выгрузкой; «-» — стандартный ввод.'
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Сколько объектов создавать одним запросом.'
+        )
+        parser.add_argument(
+            '--no-rebuild', action='store_true',
+            help='Не пересчитывать счётчики, ленты и поисковый индекс.'
+        )
+
+    def handle(self, *args, **options):
+        progress = transfer.Progress(
+            self.stdout.write, options['batch_size'] * 10
+        )
+        try:
+            if options['path'] == '-':
+                importer = transfer.load(
+                    sys.stdin, options['batch_size'], progress
+                )
+            else:
+                with open(options['path'], encoding='utf-8') as lines:
+                    importer = transfer.load(
+                        lines, options['batch_size'], progress
+                    )
+        except transfer.ImportConflict as error:
+            raise CommandError(
+                f'{error}. Загрузка остановлена: выгрузка рассчитана на '
+                f'пустую базу или повтор той же выгрузки.'
+            )
+        for model in progress.counts:
+            progress.report(model)
+        if importer.skipped:
+            self.stdout.write(
+                f'Пропущено комментариев к отсутствующим постам: '
+                f'{importer.skipped}'
+            )
+        if not options['no_rebuild']:
+            transfer.rebuild_derived(self.stdout)
+        self.stdout.write(self.style.SUCCESS('Загрузка завершена.'))
@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from posts import changes
+
+
+class Command(BaseCommand):
+    help = ('Удаляет из журнала изменений лент записи старше '
+            'CHANGES_RETENTION_DAYS дней.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Сколько записей удалять за раз.'
+        )
+
+    def handle(self, *args, **options):
+        removed = changes.prune(options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Старых записей журнала удалено: {removed}.'
+        ))
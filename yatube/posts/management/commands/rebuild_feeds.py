@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from posts import feeds
+from posts.models import FeedItem
+
+
+class Command(BaseCommand):
+    help = 'Пересобирает материализованные ленты подписок.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--chunk-size', type=int, default=feeds.BATCH_SIZE,
+            help='Сколько подписок читать из базы за раз.'
+        )
+
+    def handle(self, *args, **options):
+        # Одной транзакцией: читатели видят старые ленты, пока новые
+        # не собраны, а сбой посередине не оставляет их пустыми.
+        with transaction.atomic():
+            FeedItem.objects.all().delete()
+            reported = 0
+            for done in feeds.rebuild(options['chunk_size']):
+                if done - reported >= options['chunk_size']:
+                    self.stdout.write(f'Обработано подписок: {done}')
+                    reported = done
+        self.stdout.write(self.style.SUCCESS('Ленты подписок пересобраны.'))
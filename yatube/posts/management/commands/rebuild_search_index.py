@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from posts import search
+from posts.models import Comment, Post
+
+
+class Command(BaseCommand):
+    help = 'Пересоздаёт полнотекстовый индекс постов и комментариев.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--chunk-size', type=int, default=1000,
+            help='Сколько объектов индексировать за один запрос.'
+        )
+
+    def handle(self, *args, **options):
+        backend = search.get_backend()
+        if backend is None:
+            self.stderr.write(
+                f'Поиск не поддерживается для {connection.vendor}.'
+            )
+            return
+        chunk_size = options['chunk_size']
+        with transaction.atomic(), connection.cursor() as cursor:
+            backend.drop(cursor)
+            backend.create(cursor)
+            total = search.fill(
+                backend, cursor,
+                Post.objects.only('text'),
+                Comment.objects.only('post', 'text'),
+                chunk_size,
+            )
+        self.stdout.write(self.style.SUCCESS(
+            f'Проиндексировано записей: {total}.'
+        ))
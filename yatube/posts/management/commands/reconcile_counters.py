@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from posts import counters
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает денормализованные счётчики постов, групп и авторов.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Сколько объектов проверять за один запрос.'
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        posts = counters.reconcile_posts(batch_size)
+        groups = counters.reconcile_groups(batch_size)
+        authors = counters.reconcile_authors(batch_size)
+        self.stdout.write(self.style.SUCCESS(
+            f'Исправлено постов: {posts}, групп: {groups}, '
+            f'авторов: {authors}.'
+        ))
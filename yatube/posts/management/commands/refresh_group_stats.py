@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+
+from posts import group_stats
+
+
+class Command(BaseCommand):
+    help = ('Пересчитывает сводки групп для каталога: по умолчанию только '
+            'помеченные устаревшими.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--all', action='store_true',
+            help='Пересчитать все группы.'
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=100,
+            help='Сколько групп пересчитывать за раз.'
+        )
+
+    def handle(self, *args, **options):
+        total = group_stats.refresh_all(
+            options['batch_size'], dirty_only=not options['all']
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f'Сводки групп пересчитаны: {total}.'
+        ))
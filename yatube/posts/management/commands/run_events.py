@@ -0,0 +1,33 @@
+import asyncio
+
+from django.core.management.base import BaseCommand
+
+from posts import events
+
+
+class Command(BaseCommand):
+    help = ('Запускает поток событий (SSE) о новых постах и комментариях '
+            'рядом с yatube.wsgi.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1')
+        parser.add_argument('--port', type=int, default=8001)
+
+    def handle(self, *args, **options):
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        server = loop.run_until_complete(
+            events.serve(options['host'], options['port'])
+        )
+        self.stdout.write(
+            f'Поток событий на {options["host"]}:{options["port"]}'
+        )
+        try:
+            loop.run_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.poller.cancel()
+            server.close()
+            loop.run_until_complete(server.wait_closed())
+            loop.close()
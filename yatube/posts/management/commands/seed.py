@@ -0,0 +1,72 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from posts import seeding, transfer
+
+
+class Command(BaseCommand):
+    help = 'Заполняет базу синтетическими данными для замеров.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--groups', type=int, default=50)
+        parser.add_argument('--posts', type=int, default=100000)
+        parser.add_argument('--comments', type=int, default=200000)
+        parser.add_argument(
+            '--follows', type=int, default=20000,
+            help='Сколько подписок сгенерировать (повторы отбрасываются).'
+        )
+        parser.add_argument(
+            '--days', type=int, default=365,
+            help='За сколько последних дней распределить посты.'
+        )
+        parser.add_argument(
+            '--skew', type=float, default=1.1,
+            help='Показатель степенного закона для авторов и подписок.'
+        )
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--locale', default='ru_RU')
+        parser.add_argument(
+            '--seed', type=int, default=None,
+            help='Зерно генератора для воспроизводимых данных.'
+        )
+        parser.add_argument(
+            '--no-rebuild', action='store_true',
+            help='Не пересчитывать счётчики, ленты и поисковый индекс.'
+        )
+
+    def check_options(self, options):
+        for name in ('users', 'groups', 'posts', 'comments', 'follows',
+                     'days'):
+            if options[name] < 0:
+                raise CommandError(f'--{name} не может быть меньше нуля.')
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size должен быть больше нуля.')
+        if options['skew'] <= 0:
+            raise CommandError('--skew должен быть больше нуля.')
+        if options['posts'] and not options['users']:
+            raise CommandError(
+                'Постам нужны авторы: задайте --users больше нуля.'
+            )
+
+    def handle(self, *args, **options):
+        self.check_options(options)
+        progress = transfer.Progress(
+            self.stdout.write, options['batch_size'] * 10
+        )
+        seeder = seeding.Seeder(
+            options['batch_size'], progress,
+            locale=options['locale'], seed=options['seed'],
+            days=options['days'], exponent=options['skew'],
+        )
+        seeder.users(options['users'])
+        seeder.groups(options['groups'])
+        posts_since = seeder.posts(options['posts'])
+        seeder.comments(options['comments'], posts_since)
+        seeder.follows(options['follows'])
+        for model in progress.counts:
+            progress.report(model)
+        if not options['no_rebuild']:
+            transfer.rebuild_derived(self.stdout)
+        self.stdout.write(self.style.SUCCESS(
+            f'Готово. Пароль всех пользователей: {seeding.PASSWORD}'
+        ))
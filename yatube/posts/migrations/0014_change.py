@@ -0,0 +1,33 @@
+# Generated by Django 2.2.19 on 2026-10-18 02:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0013_search_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Change',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('post_created', 'Пост опубликован'), ('post_updated', 'Пост изменён'), ('post_removed', 'Пост ушёл из группы'), ('post_deleted', 'Пост удалён'), ('comment_created', 'Новый комментарий')], max_length=16)),
+                ('post_id', models.PositiveIntegerField()),
+                ('comment_id', models.PositiveIntegerField(blank=True, null=True)),
+                ('author_id', models.PositiveIntegerField()),
+                ('group_id', models.PositiveIntegerField(blank=True, null=True)),
+                ('created', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='change',
+            index=models.Index(fields=['group_id', 'id'], name='change_group_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='change',
+            index=models.Index(fields=['author_id', 'id'], name='change_author_idx'),
+        ),
+    ]
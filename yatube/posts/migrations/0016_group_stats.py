@@ -0,0 +1,36 @@
+# Generated by Django 2.2.19 on 2026-10-18 02:23
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def create_stats(apps, schema_editor):
+    """Строки для существующих групп; цифры посчитает
+    refresh_group_stats."""
+    Group = apps.get_model('posts', 'Group')
+    GroupStats = apps.get_model('posts', 'GroupStats')
+    GroupStats.objects.bulk_create([
+        GroupStats(group_id=pk)
+        for pk in Group.objects.values_list('pk', flat=True)
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0015_post_updated_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GroupStats',
+            fields=[
+                ('group', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to='posts.Group')),
+                ('last_post_at', models.DateTimeField(blank=True, null=True, verbose_name='Последний пост')),
+                ('top_authors_data', models.TextField(default='[]', editable=False)),
+                ('dirty', models.BooleanField(db_index=True, default=True)),
+                ('refreshed', models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+        migrations.RunPython(create_stats, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 2.2.19 on 2026-10-18 02:54
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0020_author_stats'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='change',
+            name='created',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+    ]
@@ -0,0 +1,51 @@
+from itertools import groupby
+from operator import itemgetter
+
+from django.conf import settings
+from django.db import migrations
+
+
+def backfill_feeds(apps, schema_editor):
+    """Раскладывает последние посты авторов по лентам подписчиков, как
+    rebuild_feeds: без этого ленты подписок пусты до первой пересборки."""
+    Follow = apps.get_model('posts', 'Follow')
+    Post = apps.get_model('posts', 'Post')
+    FeedItem = apps.get_model('posts', 'FeedItem')
+    follows = (
+        Follow.objects.order_by('author', 'user')
+        .values_list('author', 'user').iterator()
+    )
+    for author_id, rows in groupby(follows, key=itemgetter(0)):
+        user_ids = [user_id for _, user_id in rows]
+        if len(user_ids) > settings.FEED_FANOUT_LIMIT:
+            continue
+        posts = list(
+            Post.objects.filter(author=author_id)
+            .order_by('-pub_date', '-id')
+            .values_list('id', 'pub_date')[:settings.FEED_BACKFILL_SIZE]
+        )
+        FeedItem.objects.bulk_create(
+            [
+                FeedItem(
+                    user_id=user_id,
+                    post_id=post_id,
+                    author_id=author_id,
+                    pub_date=pub_date,
+                )
+                for user_id in user_ids
+                for post_id, pub_date in posts
+            ],
+            batch_size=500,
+            ignore_conflicts=True,
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0021_change_created_db_clock'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_feeds, migrations.RunPython.noop),
+    ]
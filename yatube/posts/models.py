@@ -1,23 +1,72 @@
-from django.db import models
+import json
+
+from django.db import models, router, transaction
 from django.contrib.auth import get_user_model
+from django.utils import timezone
 
 User = get_user_model()
 
 
-class Post(models.Model):
+class CountersMixin:
+    """Счётчики меняются только атомарными UPDATE ... SET n = n + 1,
+    поэтому save() существующего объекта их не перезаписывает.
+
+    Для этого save() уже сохранённого объекта без update_fields
+    обновляет все поля, кроме счётчиков. Как у любого save() с
+    update_fields, строка не создаётся заново: если её удалили, save()
+    бросает DatabaseError. Восстановить строку можно через
+    save(force_insert=True).
+    """
+    counter_fields = ()
+
+    def save(self, *args, **kwargs):
+        if (
+            not self._state.adding
+            and not kwargs.get('force_insert')
+            and kwargs.get('update_fields') is None
+        ):
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key
+                and field.name not in self.counter_fields
+            ]
+        super().save(*args, **kwargs)
+
+
+class AtomicSaveMixin:
+    """save() выполняется в транзакции вместе с обработчиками post_save:
+    запись и её строка в журнале Change (posts/changes.py) фиксируются
+    или откатываются вместе."""
+
+    def save(self, *args, **kwargs):
+        using = kwargs.get('using') or router.db_for_write(
+            type(self), instance=self
+        )
+        with transaction.atomic(using=using):
+            super().save(*args, **kwargs)
+
+
+class Post(AtomicSaveMixin, CountersMixin, models.Model):
     text = models.TextField(
         verbose_name='Текст поста',
         help_text='Введите текст поста'
     )
-    pub_date = models.DateTimeField(auto_now_add=True, db_index=True)
+    pub_date = models.DateTimeField(auto_now_add=True)
+    # Версия поста для кеша карточек: меняется при правке, а также при
+    # смене имени автора, группы и готовности миниатюр.
+    updated_at = models.DateTimeField(auto_now=True)
+    # Отдельные индексы внешних ключей не нужны: их покрывают
+    # составные индексы лент в Meta.
     author = models.ForeignKey(
         User,
         on_delete=models.CASCADE,
-        related_name='posts'
+        related_name='posts',
+        db_index=False,
     )
     group = models.ForeignKey(
         'Group',
         on_delete=models.SET_NULL,
+        db_index=False,
         verbose_name='Группа',
         blank=True, null=True,
         related_name='posts',
@@ -29,28 +78,114 @@ class Post(models.Model):
         blank=True,
         null=True,
     )
+    comments_count = models.PositiveIntegerField(
+        'Количество комментариев',
+        default=0,
+        editable=False,
+    )
+
+    counter_fields = ('comments_count',)
 
     def __str__(self):
         return self.text[:15]
 
     class Meta:
-        ordering = ['-pub_date']
+        # id разрешает совпадения дат: без него границы страниц
+        # зависели бы от плана запроса.
+        ordering = ['-pub_date', '-id']
+        indexes = [
+            models.Index(
+                fields=['-pub_date', '-id'], name='post_pub_date_idx'
+            ),
+            models.Index(
+                fields=['author', '-pub_date', '-id'],
+                name='post_author_pub_date_idx'
+            ),
+            models.Index(
+                fields=['group', '-pub_date', '-id'],
+                name='post_group_pub_date_idx'
+            ),
+        ]
 
 
-class Group(models.Model):
+class Group(CountersMixin, models.Model):
     title = models.CharField(max_length=200)
     slug = models.SlugField(unique=True)
     description = models.TextField()
+    posts_count = models.PositiveIntegerField(
+        'Количество постов',
+        default=0,
+        editable=False,
+    )
+
+    counter_fields = ('posts_count',)
 
     def __str__(self) -> str:
         return f'{self.title}'
 
 
-class Comment(models.Model):
+class GroupStats(models.Model):
+    """Сводка группы для каталога: время последнего поста и самые
+    активные авторы. Обновляется сигналами и refresh_group_stats,
+    см. posts/group_stats.py; число постов — Group.posts_count."""
+    group = models.OneToOneField(
+        Group,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='stats',
+    )
+    last_post_at = models.DateTimeField(
+        'Последний пост', blank=True, null=True
+    )
+    # Список {"username", "name", "posts"}, готовый для шаблона.
+    top_authors_data = models.TextField(default='[]', editable=False)
+    # Состав авторов устарел и ждёт пересчёта.
+    dirty = models.BooleanField(default=True, db_index=True)
+    refreshed = models.DateTimeField(blank=True, null=True)
+
+    @property
+    def top_authors(self):
+        return json.loads(self.top_authors_data)
+
+
+class AuthorStats(models.Model):
+    """Число постов автора для профиля и страницы поста; меняется
+    сигналами постов (см. posts/counters.py)."""
+    author = models.OneToOneField(
+        User,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='author_stats',
+    )
+    posts_count = models.PositiveIntegerField(
+        'Количество постов',
+        default=0,
+        editable=False,
+    )
+
+
+class HotPost(models.Model):
+    """Пост в рейтинге популярного, см. posts/hot.py.
+
+    rank — логарифм затухающего счёта комментариев плюс время в единицах
+    HOT_DECAY_SECONDS: порядок по нему не меняется со временем, поэтому
+    строки не нужно пересчитывать при каждом запросе.
+    """
+    post = models.OneToOneField(
+        Post,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='hot',
+    )
+    rank = models.FloatField(db_index=True)
+
+
+class Comment(AtomicSaveMixin, models.Model):
     post = models.ForeignKey(
         Post,
         on_delete=models.CASCADE,
-        related_name='comments'
+        related_name='comments',
+        db_index=False,
     )
     author = models.ForeignKey(
         User,
@@ -60,6 +195,15 @@ class Comment(models.Model):
     text = models.TextField('Текст', help_text='Текст нового комментария')
     created = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        ordering = ['created', 'id']
+        indexes = [
+            models.Index(
+                fields=['post', 'created', 'id'],
+                name='comment_post_created_idx'
+            ),
+        ]
+
 
 class Follow(models.Model):
     author = models.ForeignKey(
@@ -79,3 +223,79 @@ class Follow(models.Model):
                 fields=['author', 'user'], name='unique_following'
             )
         ]
+
+
+class FeedItem(models.Model):
+    """Пост в материализованной ленте подписок пользователя.
+
+    Строки раскладываются при публикации поста (fan-out on write),
+    поэтому лента подписок читается одним диапазоном по индексу.
+    """
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='feed_items'
+    )
+    post = models.ForeignKey(
+        Post,
+        on_delete=models.CASCADE,
+        related_name='feed_items'
+    )
+    author = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='+'
+    )
+    pub_date = models.DateTimeField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'post'], name='unique_feed_item'
+            )
+        ]
+        indexes = [
+            # post_id разрешает совпадения дат, как id в индексах Post.
+            models.Index(
+                fields=['user', '-pub_date', '-post'],
+                name='feed_user_pub_date_idx'
+            ),
+            models.Index(
+                fields=['user', 'author'], name='feed_user_author_idx'
+            ),
+        ]
+
+
+class Change(models.Model):
+    """Запись журнала изменений лент; id — номер в последовательности.
+
+    Ссылки хранятся числами, а не внешними ключами: запись об удалении
+    поста должна пережить сам пост. Автор и группа запоминаются на
+    момент изменения, чтобы выбирать изменения ленты по индексу.
+    """
+    POST_CREATED = 'post_created'
+    POST_UPDATED = 'post_updated'
+    POST_REMOVED = 'post_removed'
+    POST_DELETED = 'post_deleted'
+    COMMENT_CREATED = 'comment_created'
+    KINDS = (
+        (POST_CREATED, 'Пост опубликован'),
+        (POST_UPDATED, 'Пост изменён'),
+        (POST_REMOVED, 'Пост ушёл из группы'),
+        (POST_DELETED, 'Пост удалён'),
+        (COMMENT_CREATED, 'Новый комментарий'),
+    )
+
+    kind = models.CharField(max_length=16, choices=KINDS)
+    post_id = models.PositiveIntegerField()
+    comment_id = models.PositiveIntegerField(blank=True, null=True)
+    author_id = models.PositiveIntegerField()
+    group_id = models.PositiveIntegerField(blank=True, null=True)
+    # Заполняется по часам базы, см. changes.record().
+    created = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['group_id', 'id'], name='change_group_idx'),
+            models.Index(fields=['author_id', 'id'], name='change_author_idx'),
+        ]
@@ -0,0 +1,177 @@
+"""Курсорная (keyset) пагинация по паре (дата, id).
+
+Ленты постов листаются по (pub_date, id) от новых к старым,
+комментарии — по (created, id) от старых к новым.
+"""
+import datetime
+
+from django.core.paginator import Page, Paginator
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from django.utils.encoding import force_bytes, force_str
+from django.utils.http import urlsafe_base64_decode, urlsafe_base64_encode
+
+ORDERING = ('-pub_date', '-id')
+# Наибольший id в AutoField: числа больше не влезают в колонку, и
+# запрос с ними падает (OverflowError в SQLite, DataError в PostgreSQL).
+MAX_ID = 2 ** 31 - 1
+
+
+def parse_id(value):
+    """id из параметра запроса или None, если это не id."""
+    try:
+        pk = int(value)
+    except (TypeError, ValueError):
+        return None
+    if not 0 <= pk <= MAX_ID:
+        return None
+    return pk
+
+
+def encode_cursor(obj, field='pub_date'):
+    """Кодирует позицию объекта в ленте в строку для URL."""
+    value = f'{getattr(obj, field).isoformat()}|{obj.pk}'
+    return urlsafe_base64_encode(force_bytes(value))
+
+
+def decode_cursor(token):
+    """Возвращает пару (pub_date, id) или None, если курсор битый."""
+    try:
+        pub_date, pk = force_str(urlsafe_base64_decode(token)).split('|')
+        pub_date = parse_datetime(pub_date)
+    except (TypeError, ValueError):
+        return None
+    pk = parse_id(pk)
+    if pub_date is None or pk is None:
+        return None
+    return pub_date, pk
+
+
+def date_to_key(value):
+    """Ключ для перехода к дате: все посты, опубликованные не позже неё."""
+    try:
+        day = parse_date(value)
+    except (TypeError, ValueError):
+        return None
+    if day is None:
+        return None
+    try:
+        next_day = datetime.datetime.combine(
+            day + datetime.timedelta(days=1), datetime.time.min
+        )
+        return timezone.make_aware(next_day), 0
+    except OverflowError:
+        # После последнего дня календаря постов нет: самая свежая страница.
+        return None
+
+
+def older_than(key, field='pub_date', id_field='pk'):
+    date, pk = key
+    return (Q(**{f'{field}__lt': date})
+            | Q(**{field: date, f'{id_field}__lt': pk}))
+
+
+def newer_than(key, field='pub_date', id_field='pk'):
+    date, pk = key
+    return (Q(**{f'{field}__gt': date})
+            | Q(**{field: date, f'{id_field}__gt': pk}))
+
+
+def next_batch(queryset, field, cursor, limit):
+    """Следующие limit объектов по возрастанию (field, id) после курсора.
+
+    Возвращает список объектов и курсор следующей пачки (None, если
+    пачка последняя).
+    """
+    queryset = queryset.order_by(field, 'pk')
+    key = decode_cursor(cursor) if cursor else None
+    if key is not None:
+        queryset = queryset.filter(newer_than(key, field))
+    items = list(queryset[:limit + 1])
+    if len(items) <= limit:
+        return items, None
+    items = items[:limit]
+    return items, encode_cursor(items[-1], field)
+
+
+class CursorPaginator(Paginator):
+    """Пагинатор без COUNT(*) и OFFSET.
+
+    Страница выбирается условием по индексу (pub_date, id), поэтому
+    глубокие страницы открываются так же быстро, как первая, а новые
+    посты не сдвигают границы уже открытых страниц.
+
+    get_page() возвращает обычный Page, чтобы шаблоны и код, ожидающие
+    Page, работали без изменений. Номер страницы и их количество
+    условные: они лишь отражают наличие соседних страниц, а курсоры
+    для переходов хранятся в самом пагинаторе.
+    """
+    is_cursor = True
+
+    def __init__(self, object_list, per_page):
+        super().__init__(object_list.order_by(*ORDERING), per_page)
+        self.next_cursor = None
+        self.previous_cursor = None
+
+    def get_page(self, before=None, after=None, date=None):
+        """Страница старше курсора `before`, новее курсора `after`
+        или начиная с даты `date`.
+
+        Без параметров, с битым курсором или при выходе за край ленты
+        отдаётся самая свежая страница, как Paginator.get_page().
+        """
+        if after:
+            key = decode_cursor(after)
+            if key is not None:
+                return self._page_after(key)
+        if before:
+            key = decode_cursor(before)
+        elif date:
+            key = date_to_key(date)
+        else:
+            key = None
+        return self._page_before(key)
+
+    def _slice(self, key, older, limit):
+        """Не больше limit объектов старше (older) или новее ключа,
+        от ближних к ключу к дальним."""
+        items = self.object_list
+        if key is not None:
+            items = items.filter(
+                older_than(key) if older else newer_than(key)
+            )
+        if not older:
+            items = items.reverse()
+        return list(items[:limit])
+
+    def _exists(self, key, older):
+        condition = older_than(key) if older else newer_than(key)
+        return self.object_list.filter(condition).exists()
+
+    def _page_before(self, key):
+        items = self._slice(key, True, self.per_page + 1)
+        if not items and key is not None:
+            return self._page_before(None)
+        has_next = len(items) > self.per_page
+        has_previous = key is not None and self._exists(key, False)
+        return self._page(items[:self.per_page], has_next, has_previous)
+
+    def _page_after(self, key):
+        items = self._slice(key, False, self.per_page + 1)
+        if not items:
+            return self._page_before(None)
+        has_previous = len(items) > self.per_page
+        items = items[:self.per_page]
+        items.reverse()
+        has_next = self._exists(key, True)
+        return self._page(items, has_next, has_previous)
+
+    def _page(self, items, has_next, has_previous):
+        number = 2 if has_previous else 1
+        self.num_pages = number + 1 if has_next else number
+        if has_next:
+            self.next_cursor = encode_cursor(items[-1])
+        if has_previous:
+            self.previous_cursor = encode_cursor(items[0])
+        return Page(items, number, self)
@@ -0,0 +1,267 @@
+"""Полнотекстовый поиск по постам и комментариям.
+
+Тексты лежат в отдельном индексе posts_search: на PostgreSQL это
+таблица с колонкой tsvector и GIN-индексом, на SQLite — виртуальная
+таблица FTS5. Индекс обновляется сигналами при сохранении и удалении
+постов и комментариев, поиск возвращает ранжированные совпадения с
+подсвеченными фрагментами.
+"""
+import re
+from collections import namedtuple
+
+from django.conf import settings
+from django.db import connection
+from django.utils.html import escape
+from django.utils.safestring import mark_safe
+
+POST = 'post'
+COMMENT = 'comment'
+KINDS = (POST, COMMENT)
+
+# Границы подсветки: служебные символы, которых не бывает в тексте,
+# чтобы сначала экранировать фрагмент, а потом заменить их на <mark>.
+START, STOP = '\x02', '\x03'
+
+Hit = namedtuple('Hit', 'kind object_id post_id snippet')
+
+
+def highlight(snippet):
+    return mark_safe(
+        escape(snippet).replace(START, '<mark>').replace(STOP, '</mark>')
+    )
+
+
+class PostgresBackend:
+    def create(self, cursor):
+        cursor.execute(
+            'CREATE TABLE posts_search ('
+            ' kind varchar(7) NOT NULL,'
+            ' object_id integer NOT NULL,'
+            ' post_id integer NOT NULL,'
+            ' body text NOT NULL,'
+            ' document tsvector NOT NULL,'
+            ' PRIMARY KEY (kind, object_id))'
+        )
+        cursor.execute(
+            'CREATE INDEX posts_search_document_idx'
+            ' ON posts_search USING gin (document)'
+        )
+
+    def drop(self, cursor):
+        cursor.execute('DROP TABLE IF EXISTS posts_search')
+
+    def index(self, cursor, rows):
+        cursor.executemany(
+            'INSERT INTO posts_search'
+            ' (kind, object_id, post_id, body, document)'
+            ' VALUES (%s, %s, %s, %s, to_tsvector(%s::regconfig, %s))'
+            ' ON CONFLICT (kind, object_id) DO UPDATE'
+            ' SET post_id = EXCLUDED.post_id, body = EXCLUDED.body,'
+            ' document = EXCLUDED.document',
+            [
+                (kind, object_id, post_id, text, settings.SEARCH_CONFIG, text)
+                for kind, object_id, post_id, text in rows
+            ]
+        )
+
+    def remove(self, cursor, kind, object_id):
+        cursor.execute(
+            'DELETE FROM posts_search WHERE kind = %s AND object_id = %s',
+            [kind, object_id]
+        )
+
+    def _where(self, query, kind):
+        where = 'document @@ q'
+        params = [settings.SEARCH_CONFIG, query]
+        if kind:
+            where += ' AND kind = %s'
+            params.append(kind)
+        return where, params
+
+    def count(self, cursor, query, kind=None):
+        where, params = self._where(query, kind)
+        cursor.execute(
+            'SELECT count(*) FROM posts_search,'
+            ' plainto_tsquery(%s::regconfig, %s) q WHERE ' + where,
+            params
+        )
+        return cursor.fetchone()[0]
+
+    def search(self, cursor, query, kind, offset, limit):
+        where, params = self._where(query, kind)
+        cursor.execute(
+            'SELECT kind, object_id, post_id,'
+            ' ts_headline(%s::regconfig, body, q, %s)'
+            ' FROM posts_search, plainto_tsquery(%s::regconfig, %s) q'
+            ' WHERE ' + where
+            + ' ORDER BY ts_rank(document, q) DESC, object_id DESC'
+            ' LIMIT %s OFFSET %s',
+            [
+                settings.SEARCH_CONFIG,
+                f'StartSel={START}, StopSel={STOP}, MaxWords=30, MinWords=10',
+                *params, limit, offset,
+            ]
+        )
+        return cursor.fetchall()
+
+
+class SqliteBackend:
+    # У FTS5 нет уникальных ключей, поэтому пара (вид, id) кодируется
+    # в rowid: так обновление и удаление идут по первичному ключу.
+    def _rowid(self, kind, object_id):
+        return object_id * len(KINDS) + KINDS.index(kind)
+
+    def create(self, cursor):
+        cursor.execute(
+            'CREATE VIRTUAL TABLE posts_search USING fts5('
+            'body, kind UNINDEXED, object_id UNINDEXED, post_id UNINDEXED,'
+            " tokenize='unicode61')"
+        )
+
+    def drop(self, cursor):
+        cursor.execute('DROP TABLE IF EXISTS posts_search')
+
+    def index(self, cursor, rows):
+        rows = [
+            (self._rowid(kind, object_id), text, kind, object_id, post_id)
+            for kind, object_id, post_id, text in rows
+        ]
+        cursor.executemany(
+            'DELETE FROM posts_search WHERE rowid = %s',
+            [(row[0],) for row in rows]
+        )
+        cursor.executemany(
+            'INSERT INTO posts_search (rowid, body, kind, object_id, post_id)'
+            ' VALUES (%s, %s, %s, %s, %s)',
+            rows
+        )
+
+    def remove(self, cursor, kind, object_id):
+        cursor.execute(
+            'DELETE FROM posts_search WHERE rowid = %s',
+            [self._rowid(kind, object_id)]
+        )
+
+    def _match(self, query):
+        # Слова запроса берутся в кавычки, чтобы операторы FTS5 из
+        # пользовательского ввода не ломали запрос.
+        return ' '.join(f'"{word}"' for word in re.findall(r'\w+', query))
+
+    def _where(self, query, kind):
+        where = 'posts_search MATCH %s'
+        params = [self._match(query)]
+        if kind:
+            where += ' AND kind = %s'
+            params.append(kind)
+        return where, params
+
+    def count(self, cursor, query, kind=None):
+        if not self._match(query):
+            return 0
+        where, params = self._where(query, kind)
+        cursor.execute('SELECT count(*) FROM posts_search WHERE ' + where,
+                       params)
+        return cursor.fetchone()[0]
+
+    def search(self, cursor, query, kind, offset, limit):
+        if not self._match(query):
+            return []
+        where, params = self._where(query, kind)
+        cursor.execute(
+            'SELECT kind, object_id, post_id,'
+            " snippet(posts_search, 0, %s, %s, '…', 30)"
+            ' FROM posts_search WHERE ' + where
+            + ' ORDER BY rank, rowid DESC LIMIT %s OFFSET %s',
+            [START, STOP, *params, limit, offset]
+        )
+        return cursor.fetchall()
+
+
+BACKENDS = {
+    'postgresql': PostgresBackend(),
+    'sqlite': SqliteBackend(),
+}
+
+
+def get_backend(conn=connection):
+    """Бэкенд поиска для соединения или None, если СУБД не поддержана."""
+    return BACKENDS.get(conn.vendor)
+
+
+def post_row(post):
+    return POST, post.pk, post.pk, post.text
+
+
+def comment_row(comment):
+    return COMMENT, comment.pk, comment.post_id, comment.text
+
+
+def fill(backend, cursor, posts, comments, chunk_size=1000):
+    """Заполняет индекс пачками; возвращает число записей."""
+    total = 0
+    sources = ((posts, post_row), (comments, comment_row))
+    for queryset, to_row in sources:
+        rows = []
+        for obj in queryset.iterator(chunk_size):
+            rows.append(to_row(obj))
+            if len(rows) >= chunk_size:
+                backend.index(cursor, rows)
+                total += len(rows)
+                rows = []
+        backend.index(cursor, rows)
+        total += len(rows)
+    return total
+
+
+def index(rows):
+    backend = get_backend()
+    if backend is not None:
+        with connection.cursor() as cursor:
+            backend.index(cursor, rows)
+
+
+def remove(kind, object_id):
+    backend = get_backend()
+    if backend is not None:
+        with connection.cursor() as cursor:
+            backend.remove(cursor, kind, object_id)
+
+
+class Results:
+    """Результаты поиска для Paginator: считает совпадения и достаёт
+    страницу одним запросом к индексу."""
+
+    def __init__(self, query, kind=None):
+        self.query = query
+        self.kind = kind
+        self.backend = get_backend()
+
+    def count(self):
+        if self.backend is None or not self.query.strip():
+            return 0
+        with connection.cursor() as cursor:
+            return self.backend.count(cursor, self.query, self.kind)
+
+    def __len__(self):
+        return self.count()
+
+    def __getitem__(self, page):
+        if self.backend is None or not self.query.strip():
+            return []
+        with connection.cursor() as cursor:
+            rows = self.backend.search(
+                cursor, self.query, self.kind,
+                page.start, page.stop - page.start
+            )
+        return [
+            Hit(kind, object_id, post_id, highlight(snippet))
+            for kind, object_id, post_id, snippet in rows
+        ]
+
+
+def matching_ids(query, kind, limit=None):
+    """id объектов вида kind, подходящих под запрос, по убыванию
+    релевантности."""
+    results = Results(query, kind)
+    limit = limit or settings.SEARCH_ADMIN_LIMIT
+    return [hit.object_id for hit in results[0:limit]]
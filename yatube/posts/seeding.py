@@ -0,0 +1,209 @@
+"""Синтетические данные в объёмах продакшена для замеров.
+
+Распределения близки к настоящим: у немногих авторов большая часть
+постов, на немногих авторов подписана большая часть пользователей
+(степенной закон, как у Ципфа), комментарии приходятся в основном на
+популярные посты. Всё вставляется пачками (bulk_create, а посты и
+комментарии с заданными датами — transfer.insert), поэтому работает и
+на PostgreSQL, и на SQLite.
+"""
+import datetime
+import itertools
+import random
+from array import array
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.utils import timezone
+from faker import Faker
+
+from .models import Comment, Follow, Group, Post
+from .transfer import insert
+
+User = get_user_model()
+
+PASSWORD = 'password'
+# Тексты собираются из заранее созданных предложений: Faker на
+# миллионах строк был бы медленнее самой вставки.
+SENTENCES = 2000
+
+
+def zipf_weights(count, exponent):
+    """Накопленные веса рангов 1..count: вес ранга r — 1 / r^exponent."""
+    return list(itertools.accumulate(
+        1 / rank ** exponent for rank in range(1, count + 1)
+    ))
+
+
+class Seeder:
+    def __init__(self, batch_size, progress, locale='ru_RU', seed=None,
+                 days=365, exponent=1.1):
+        self.batch_size = batch_size
+        self.progress = progress
+        self.random = random.Random(seed)
+        self.fake = Faker(locale)
+        if seed is not None:
+            self.fake.seed_instance(seed)
+        self.days = days
+        self.exponent = exponent
+        self.sentences = [self.fake.sentence() for _ in range(SENTENCES)]
+        self.user_ids = array('q')
+        self.group_ids = array('q')
+
+    def text(self, low, high):
+        count = self.random.randint(low, high)
+        return ' '.join(self.random.choices(self.sentences, k=count))
+
+    def batches(self, total):
+        """Размеры пачек, на которые делится total."""
+        for start in range(0, total, self.batch_size):
+            yield min(self.batch_size, total - start)
+
+    def _new_ids(self, model, since):
+        return array('q', model.objects.filter(pk__gt=since).order_by('pk')
+                     .values_list('pk', flat=True).iterator())
+
+    def _last_id(self, model):
+        last = model.objects.order_by('-pk').values_list('pk', flat=True)
+        return last.first() or 0
+
+    def users(self, total):
+        since = self._last_id(User)
+        # Хеш пароля один на всех: PBKDF2 для каждого занял бы часы.
+        password = make_password(PASSWORD)
+        number = itertools.count(since + 1)
+        for size in self.batches(total):
+            User.objects.bulk_create([
+                User(
+                    username=f'{self.fake.user_name()}{next(number)}',
+                    first_name=self.fake.first_name(),
+                    last_name=self.fake.last_name(),
+                    password=password,
+                )
+                for _ in range(size)
+            ])
+            self.progress.add('users', size)
+        self.user_ids = self._new_ids(User, since)
+
+    def groups(self, total):
+        since = self._last_id(Group)
+        number = itertools.count(since + 1)
+        for size in self.batches(total):
+            Group.objects.bulk_create([
+                Group(
+                    title=self.fake.catch_phrase()[:200],
+                    slug=f'group-{next(number)}',
+                    description=self.text(1, 3),
+                )
+                for _ in range(size)
+            ])
+            self.progress.add('groups', size)
+        self.group_ids = self._new_ids(Group, since)
+
+    def posts(self, total, grouped=0.6):
+        """Посты с перекосом по авторам; даты растут вместе с id."""
+        since = self._last_id(Post)
+        authors = list(self.user_ids)
+        self.random.shuffle(authors)
+        weights = zipf_weights(len(authors), self.exponent)
+        end = timezone.now()
+        step = datetime.timedelta(days=self.days) / max(total, 1)
+        start = end - step * total
+        made = 0
+        for size in self.batches(total):
+            chosen = self.random.choices(
+                authors, cum_weights=weights, k=size
+            )
+            posts = []
+            for author_id in chosen:
+                group_id = None
+                if self.group_ids and self.random.random() < grouped:
+                    group_id = self.random.choice(self.group_ids)
+                pub_date = start + step * made
+                posts.append(Post(
+                    author_id=author_id,
+                    group_id=group_id,
+                    text=self.text(1, 6),
+                    pub_date=pub_date,
+                    updated_at=pub_date,
+                ))
+                made += 1
+            insert(Post, posts)
+            self.progress.add('posts', size)
+        return since
+
+    def comments(self, total, posts_since):
+        """Комментарии, в основном к популярным постам.
+
+        Популярность поста — вес из распределения Парето с хвостом
+        1 / exponent: веса в порядке убывания подчиняются тому же
+        степенному закону, что и авторы. Веса не хранятся: первый проход
+        по тому же зерну считает их сумму, второй идёт по постам пачками
+        и раздаёт каждой пачке её долю комментариев. В памяти только
+        текущая пачка постов.
+        """
+        posts = Post.objects.filter(pk__gt=posts_since)
+        count = posts.count()
+        if not count:
+            return
+        alpha = 1 / self.exponent
+        seed = self.random.random()
+        weights = random.Random(seed)
+        weight_sum = sum(weights.paretovariate(alpha) for _ in range(count))
+        weights = random.Random(seed)
+        rows = itertools.islice(
+            posts.order_by('pk').values_list('pk', 'pub_date')
+            .iterator(chunk_size=self.batch_size),
+            count
+        )
+        now = timezone.now()
+        seen = made = 0
+        cumulative = 0.0
+        while seen < count:
+            chunk = list(itertools.islice(rows, self.batch_size))
+            if not chunk:
+                return
+            seen += len(chunk)
+            chunk_weights = [weights.paretovariate(alpha) for _ in chunk]
+            cumulative += sum(chunk_weights)
+            if seen < count:
+                share = round(total * cumulative / weight_sum) - made
+            else:
+                share = total - made
+            made += share
+            chosen = self.random.choices(chunk, weights=chunk_weights,
+                                         k=share)
+            for start in range(0, share, self.batch_size):
+                comments = []
+                for post_id, pub_date in chosen[start:start + self.batch_size]:
+                    delay = (now - pub_date) * self.random.random() ** 4
+                    comments.append(Comment(
+                        post_id=post_id,
+                        author_id=self.random.choice(self.user_ids),
+                        text=self.text(1, 2),
+                        created=pub_date + delay,
+                    ))
+                insert(Comment, comments)
+                self.progress.add('comments', len(comments))
+
+    def follows(self, total):
+        """Подписки: входящие степени авторов — степенной закон."""
+        authors = list(self.user_ids)
+        if len(authors) < 2:
+            return
+        self.random.shuffle(authors)
+        weights = zipf_weights(len(authors), self.exponent)
+        for size in self.batches(total):
+            pairs = set()
+            chosen = self.random.choices(authors, cum_weights=weights,
+                                         k=size)
+            for author_id in chosen:
+                user_id = self.random.choice(self.user_ids)
+                if user_id != author_id:
+                    pairs.add((user_id, author_id))
+            Follow.objects.bulk_create(
+                [Follow(user_id=user, author_id=author)
+                 for user, author in pairs],
+                ignore_conflicts=True,
+            )
+            self.progress.add('follows', size)
@@ -0,0 +1,148 @@
+from django.contrib.auth import get_user_model
+from django.core.signals import request_started
+from django.db import transaction
+from django.db.models.signals import (post_delete, post_init, post_save,
+                                      pre_save)
+from django.dispatch import receiver
+
+from . import (cards, changes, counters, feed_cache, feeds, group_stats,
+               hot, search, thumbnails)
+from .models import Comment, Follow, Group, GroupStats, Post
+
+User = get_user_model()
+
+# Поля, которые показываются в карточках постов автора и группы.
+AUTHOR_CARD_FIELDS = ('username', 'first_name', 'last_name')
+GROUP_CARD_FIELDS = ('title', 'slug')
+# Группа поста, загруженного без group_id (.only(), .defer()).
+UNKNOWN = object()
+
+
+def card_fields(instance, fields):
+    # Через __dict__, чтобы не загружать отложенные поля.
+    return tuple(instance.__dict__.get(field) for field in fields)
+
+
+@receiver(post_init, sender=Post)
+def post_remember_group(sender, instance, **kwargs):
+    # Через __dict__, чтобы не загружать отложенные поля: иначе каждый
+    # пост из .only() стоил бы отдельного запроса.
+    instance._loaded_group_id = instance.__dict__.get('group_id', UNKNOWN)
+    image = instance.__dict__.get('image')
+    instance._loaded_image = getattr(image, 'name', image)
+
+
+@receiver(pre_save, sender=Post)
+def post_load_group(sender, instance, **kwargs):
+    """Прежняя группа поста, загруженного без неё, читается из базы
+    перед сохранением — только для таких постов и только при записи."""
+    if instance._loaded_group_id is UNKNOWN and instance.pk is not None:
+        instance._loaded_group_id = Post.objects.filter(
+            pk=instance.pk
+        ).values_list('group_id', flat=True).first()
+
+
+@receiver(post_save, sender=Post)
+def post_saved(sender, instance, created, **kwargs):
+    old_group_id = None if created else instance._loaded_group_id
+    if created:
+        feeds.fan_out(instance)
+        counters.change_author_posts(instance.author_id, 1)
+    counters.change_group(old_group_id, instance.group_id)
+    feed_cache.touch_post(instance, old_group_id)
+    search.index([search.post_row(instance)])
+    changes.post_saved(instance, created, old_group_id)
+    group_stats.post_saved(instance, created, old_group_id)
+    image = instance.image.name
+    if image and (created or image != instance._loaded_image):
+        transaction.on_commit(lambda: thumbnails.schedule(image))
+    instance._loaded_group_id = instance.group_id
+    instance._loaded_image = image
+
+
+@receiver(post_delete, sender=Post)
+def post_deleted(sender, instance, **kwargs):
+    counters.change_group(instance.group_id, None)
+    counters.change_author_posts(instance.author_id, -1)
+    feed_cache.touch_post(instance)
+    search.remove(search.POST, instance.pk)
+    changes.post_deleted(instance)
+    if instance.group_id is not None:
+        group_stats.mark_dirty([instance.group_id])
+
+
+@receiver(post_save, sender=Comment)
+def comment_saved(sender, instance, created, **kwargs):
+    if created:
+        counters.change_comments(instance.post_id, 1)
+        feed_cache.touch_post(instance.post)
+        changes.comment_created(instance)
+        hot.comment_added(instance)
+    search.index([search.comment_row(instance)])
+
+
+@receiver(post_delete, sender=Comment)
+def comment_deleted(sender, instance, **kwargs):
+    counters.change_comments(instance.post_id, -1)
+    search.remove(search.COMMENT, instance.pk)
+    post = Post.objects.filter(pk=instance.post_id).first()
+    if post is not None:
+        feed_cache.touch_post(post)
+
+
+@receiver(post_save, sender=Follow)
+def follow_backfill(sender, instance, created, **kwargs):
+    if created:
+        feeds.backfill(instance)
+        follow_changed(instance)
+
+
+@receiver(post_delete, sender=Follow)
+def follow_cleanup(sender, instance, **kwargs):
+    feeds.cleanup(instance)
+    follow_changed(instance)
+
+
+def follow_changed(follow):
+    """Меняет версии подписок и подписчиков, под которыми лежат граф
+    подписок и ETag профилей."""
+    feed_cache.bump_on_commit([
+        f'follows:{follow.user_id}', f'followers:{follow.author_id}'
+    ])
+
+
+@receiver(post_init, sender=User)
+def author_remember_name(sender, instance, **kwargs):
+    instance._loaded_card_fields = card_fields(instance, AUTHOR_CARD_FIELDS)
+
+
+@receiver(post_save, sender=User)
+def author_saved(sender, instance, created, **kwargs):
+    fields = card_fields(instance, AUTHOR_CARD_FIELDS)
+    if not created and fields != instance._loaded_card_fields:
+        cards.touch(Post.objects.filter(author=instance))
+    instance._loaded_card_fields = fields
+
+
+@receiver(post_init, sender=Group)
+def group_remember_title(sender, instance, **kwargs):
+    instance._loaded_card_fields = card_fields(instance, GROUP_CARD_FIELDS)
+
+
+@receiver(post_save, sender=Group)
+def group_saved(sender, instance, created, **kwargs):
+    if created:
+        GroupStats.objects.create(group=instance)
+    fields = card_fields(instance, GROUP_CARD_FIELDS)
+    if not created and fields != instance._loaded_card_fields:
+        cards.touch(Post.objects.filter(group=instance))
+    instance._loaded_card_fields = fields
+    # Шапка страницы группы (описание и прочие поля) входит в её
+    # валидатор, поэтому версия меняется при любом сохранении.
+    if not created:
+        feed_cache.bump([f'group:{instance.pk}'])
+
+
+@receiver(request_started)
+def thumbnails_finished(sender, **kwargs):
+    thumbnails.register_finished()
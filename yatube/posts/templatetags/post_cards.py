@@ -0,0 +1,12 @@
+from django import template
+from django.utils.safestring import mark_safe
+
+from posts import cards
+
+register = template.Library()
+
+
+@register.simple_tag
+def post_cards(posts):
+    """Пары (пост, карточка) страницы ленты из кеша карточек."""
+    return [(post, mark_safe(card)) for post, card in cards.render(posts)]
@@ -0,0 +1,32 @@
+from django import template
+
+from core.timing import measure
+from posts import thumbnails
+
+register = template.Library()
+
+
+@register.simple_tag
+def thumbnail_or_original(image, preset):
+    """Миниатюра картинки, если она уже готова, иначе сама картинка.
+
+    Недостающие миниатюры ставятся в очередь, а не рисуются во время
+    рендеринга страницы.
+    """
+    if not image:
+        return None
+    with measure('thumbnail'):
+        thumbnail = thumbnails.ready_thumbnail(image, preset)
+        if thumbnail is None:
+            thumbnails.schedule(image.name)
+            return image
+    return thumbnail
+
+
+@register.simple_tag
+def ready_thumbnail(image, preset):
+    """Готовая миниатюра картинки или None."""
+    if not image:
+        return None
+    with measure('thumbnail'):
+        return thumbnails.ready_thumbnail(image, preset)
@@ -0,0 +1,114 @@
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection
+from django.test import Client, TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from posts import cards
+from posts.models import Comment, Group, Post
+
+User = get_user_model()
+
+
+class PostCardsTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(
+            username='auth', first_name='Лев', last_name='Толстой'
+        )
+        cls.group = Group.objects.create(
+            title='test', slug='test', description='test'
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+        self.post = Post.objects.create(
+            author=self.user, text='test', group=self.group
+        )
+
+    def card_key(self):
+        return cards.card_key(Post.objects.get(pk=self.post.pk))
+
+    def test_feed_reuses_cached_cards(self):
+        """Лента берёт карточки из кеша, не рендеря их заново."""
+        self.client.get(reverse('posts:index'))
+        key = self.card_key()
+        self.assertIn('Лев Толстой', cache.get(key))
+        cache.set(key, '<p>из кеша</p>')
+        posts = Post.objects.select_related('author', 'group')
+        [(post, card)] = cards.render(posts)
+        self.assertEqual(card, '<p>из кеша</p>')
+
+    def test_one_multi_get_per_page(self):
+        """Карточки страницы достаются одним get_many."""
+        Post.objects.create(author=self.user, text='second')
+        posts = list(Post.objects.select_related('author', 'group'))
+        cards.render(posts)
+        calls = []
+        get_many = cache.get_many
+        cache.get_many = lambda keys: calls.append(keys) or get_many(keys)
+        try:
+            with CaptureQueriesContext(connection) as queries:
+                rendered = cards.render(posts)
+        finally:
+            del cache.get_many
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(len(queries), 0)
+        self.assertEqual([post for post, card in rendered], posts)
+
+    def test_edit_and_comment_change_key(self):
+        """Правка поста и новый комментарий меняют ключ карточки."""
+        key = self.card_key()
+        self.post.text = 'edited'
+        self.post.save()
+        edited = self.card_key()
+        self.assertNotEqual(edited, key)
+        Comment.objects.create(post=self.post, author=self.user, text='c')
+        self.assertNotEqual(self.card_key(), edited)
+
+    def test_author_rename_invalidates_cards(self):
+        """Смена имени автора обновляет его карточки и ленты."""
+        response = self.client.get(reverse('posts:index'))
+        self.assertContains(response, 'Лев Толстой')
+        key = self.card_key()
+        self.user.first_name = 'Алексей'
+        self.user.save()
+        self.assertNotEqual(self.card_key(), key)
+        response = self.client.get(reverse('posts:index'))
+        self.assertContains(response, 'Алексей Толстой')
+        self.user.first_name = 'Лев'
+        self.user.save()
+
+    def test_group_rename_invalidates_cards(self):
+        """Смена названия группы обновляет карточки её постов."""
+        key = self.card_key()
+        self.group.title = 'renamed'
+        self.group.save()
+        self.assertNotEqual(self.card_key(), key)
+
+    def test_unrelated_saves_keep_cards(self):
+        """Сохранения, не меняющие карточку, её не сбрасывают."""
+        key = self.card_key()
+        self.group.description = 'new'
+        self.group.save()
+        user = User.objects.get(pk=self.user.pk)
+        user.save(update_fields=['last_login'])
+        self.assertEqual(self.card_key(), key)
+
+    def test_comment_changes_only_its_pages(self):
+        """Комментарий меняет ключ фрагмента только тех страниц ленты,
+        где виден его пост."""
+        other = Post.objects.create(author=self.user, text='other')
+
+        def key(post):
+            page = Post.objects.filter(pk=post.pk)
+            return cards.fragment('index', page)['key']
+
+        before = key(self.post), key(other)
+        Comment.objects.create(post=self.post, author=self.user, text='c')
+        after = key(self.post), key(other)
+        self.assertNotEqual(before[0], after[0])
+        self.assertEqual(before[1], after[1])
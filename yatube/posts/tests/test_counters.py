@@ -0,0 +1,151 @@
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.db import DatabaseError, transaction
+from django.test import TestCase, Client
+from django.urls import reverse
+
+from posts.models import AuthorStats, Comment, Group, Post
+
+User = get_user_model()
+
+
+class CountersTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='auth')
+        cls.group = Group.objects.create(
+            title='test',
+            slug='test',
+            description='test',
+        )
+        cls.group_2 = Group.objects.create(
+            title='test2',
+            slug='test2',
+            description='test2',
+        )
+
+    def setUp(self):
+        self.authorized_client = Client()
+        self.authorized_client.force_login(self.user)
+
+    def assertCounter(self, obj, field, expected):
+        obj.refresh_from_db()
+        self.assertEqual(getattr(obj, field), expected)
+
+    def test_group_posts_count(self):
+        """Счётчик постов группы следует за созданием, правкой и
+        удалением постов."""
+        self.authorized_client.post(
+            reverse('posts:post_create'),
+            data={'text': 'test', 'group': self.group.id},
+        )
+        self.assertCounter(self.group, 'posts_count', 1)
+        post = Post.objects.get(group=self.group)
+        self.authorized_client.post(
+            reverse('posts:post_edit', kwargs={'post_id': post.id}),
+            data={'text': 'new test', 'group': self.group_2.id},
+        )
+        self.assertCounter(self.group, 'posts_count', 0)
+        self.assertCounter(self.group_2, 'posts_count', 1)
+        post.refresh_from_db()
+        post.delete()
+        self.assertCounter(self.group_2, 'posts_count', 0)
+
+    def test_post_comments_count(self):
+        """Счётчик комментариев не затирается при правке поста."""
+        post = Post.objects.create(author=self.user, text='test')
+        self.authorized_client.post(
+            reverse('posts:add_comment', kwargs={'post_id': post.id}),
+            data={'text': 'test'},
+        )
+        self.assertCounter(post, 'comments_count', 1)
+        stale_post = Post.objects.get(pk=post.pk)
+        Comment.objects.create(post=post, author=self.user, text='test')
+        stale_post.text = 'new test'
+        stale_post.save()
+        self.assertCounter(post, 'comments_count', 2)
+        Comment.objects.filter(post=post).first().delete()
+        self.assertCounter(post, 'comments_count', 1)
+
+    def test_deferred_group_not_loaded(self):
+        """Посты из .only() не догружают group_id, а их сохранение
+        всё равно переносит счётчики."""
+        for _ in range(3):
+            Post.objects.create(
+                author=self.user, text='test', group=self.group
+            )
+        with self.assertNumQueries(1):
+            list(Post.objects.only('text'))
+        post = Post.objects.only('text').first()
+        post.group = self.group_2
+        post.save()
+        self.assertCounter(self.group, 'posts_count', 2)
+        self.assertCounter(self.group_2, 'posts_count', 1)
+
+    def test_reconcile_counters(self):
+        """reconcile_counters исправляет рассинхронизацию счётчиков."""
+        post = Post.objects.create(
+            author=self.user, text='test', group=self.group
+        )
+        Comment.objects.create(post=post, author=self.user, text='test')
+        Post.objects.update(comments_count=5)
+        Group.objects.update(posts_count=5)
+        call_command('reconcile_counters', batch_size=1, stdout=StringIO())
+        self.assertCounter(post, 'comments_count', 1)
+        self.assertCounter(self.group, 'posts_count', 1)
+        self.assertCounter(self.group_2, 'posts_count', 0)
+
+    def test_counters_not_negative(self):
+        """Уменьшение счётчика, ушедшего в ноль, не нарушает CHECK."""
+        post = Post.objects.create(
+            author=self.user, text='test', group=self.group
+        )
+        comment = Comment.objects.create(
+            post=post, author=self.user, text='test'
+        )
+        Post.objects.update(comments_count=0)
+        Group.objects.update(posts_count=0)
+        AuthorStats.objects.update(posts_count=0)
+        comment.delete()
+        post.delete()
+        self.assertCounter(self.group, 'posts_count', 0)
+        self.assertEqual(
+            AuthorStats.objects.get(pk=self.user.pk).posts_count, 0
+        )
+
+    def test_author_posts_count(self):
+        """Число постов автора на профиле и странице поста берётся из
+        счётчика, без COUNT по постам."""
+        post = Post.objects.create(author=self.user, text='test')
+        other = Post.objects.create(author=self.user, text='test')
+        stats = AuthorStats.objects.get(pk=self.user.pk)
+        self.assertEqual(stats.posts_count, 2)
+        response = self.authorized_client.get(
+            reverse('posts:profile', args=[self.user.username])
+        )
+        self.assertContains(response, 'Всего постов: 2')
+        self.assertNotIn('COUNT', str(response.wsgi_request.queries.queries))
+        post.delete()
+        response = self.authorized_client.get(
+            reverse('posts:post_detail', args=[other.pk])
+        )
+        self.assertContains(response, 'Всего постов автора: 1')
+
+    def test_reconcile_author_stats(self):
+        Post.objects.bulk_create([Post(author=self.user, text='test')])
+        call_command('reconcile_counters', batch_size=1, stdout=StringIO())
+        self.assertEqual(
+            AuthorStats.objects.get(pk=self.user.pk).posts_count, 1
+        )
+
+    def test_save_of_deleted_row(self):
+        """save() без update_fields не воскрешает удалённую строку."""
+        post = Post.objects.create(author=self.user, text='test')
+        Post.objects.filter(pk=post.pk).delete()
+        with self.assertRaises(DatabaseError), transaction.atomic():
+            post.save()
+        post.save(force_insert=True)
+        self.assertTrue(Post.objects.filter(pk=post.pk).exists())
@@ -0,0 +1,156 @@
+import asyncio
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.test import (Client, TestCase, TransactionTestCase,
+                         override_settings)
+
+from posts import events
+from posts.models import Change, Comment, Follow, Group, Post
+
+User = get_user_model()
+
+
+class SubscribeTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='author')
+        cls.reader = User.objects.create_user(username='reader')
+        cls.group = Group.objects.create(
+            title='test', slug='test', description='test'
+        )
+        cls.post = Post.objects.create(
+            author=cls.author, text='test', group=cls.group
+        )
+
+    def test_channels(self):
+        """Адреса потока соответствуют каналам журнала."""
+        cases = {
+            '/events/index': ['index'],
+            f'/events/group/{self.group.slug}': [f'group:{self.group.pk}'],
+            f'/events/post/{self.post.pk}/': [f'post:{self.post.pk}'],
+        }
+        for path, expected in cases.items():
+            with self.subTest(path=path):
+                channels, log = events.subscribe(path, {})
+                self.assertEqual(channels, expected)
+
+    def test_unknown_paths(self):
+        for path in ('/events/group/missing', '/events/post/0', '/other'):
+            with self.subTest(path=path):
+                with self.assertRaises(events.NotFound):
+                    events.subscribe(path, {})
+
+    def test_follow_uses_session(self):
+        """Поток подписок берёт пользователя из сессии."""
+        with self.assertRaises(events.Unauthorized):
+            events.subscribe('/events/follow', {})
+        Follow.objects.create(user=self.reader, author=self.author)
+        client = Client()
+        client.force_login(self.reader)
+        session = client.cookies[settings.SESSION_COOKIE_NAME].value
+        channels, log = events.subscribe('/events/follow', {
+            'cookie': f'{settings.SESSION_COOKIE_NAME}={session}'
+        })
+        self.assertEqual(channels, [f'author:{self.author.pk}'])
+        self.assertEqual(list(log), list(Change.objects.filter(
+            kind=Change.POST_CREATED, author_id=self.author.pk
+        )))
+
+    def test_change_channels(self):
+        post = Change(kind=Change.POST_CREATED, post_id=1, author_id=2,
+                      group_id=3)
+        comment = Change(kind=Change.COMMENT_CREATED, post_id=1,
+                         comment_id=4, author_id=2)
+        self.assertEqual(events.change_channels(post),
+                         ['index', 'author:2', 'group:3'])
+        self.assertEqual(events.change_channels(comment), ['post:1'])
+        self.assertEqual(events.change_channels(
+            Change(kind=Change.POST_DELETED, post_id=1, author_id=2)
+        ), [])
+
+
+@override_settings(CHANGES_SETTLE_SECONDS=0)
+class StreamTest(TransactionTestCase):
+    def setUp(self):
+        self.author = User.objects.create_user(username='author')
+        self.post = Post.objects.create(author=self.author, text='test')
+
+    async def read_event(self, reader):
+        lines = []
+        while True:
+            line = await asyncio.wait_for(reader.readline(), 5)
+            if line == b'\n':
+                if lines and not lines[0].startswith(b'retry'):
+                    return b''.join(lines).decode()
+                lines = []
+            else:
+                lines.append(line)
+
+    async def stream(self, headers=''):
+        server = await events.serve('127.0.0.1', 0)
+        server.poller.cancel()
+        port = server.sockets[0].getsockname()[1]
+        await server.hub.poll_once()
+        reader, writer = await asyncio.open_connection('127.0.0.1', port)
+        writer.write(
+            f'GET /events/post/{self.post.pk} HTTP/1.1\r\n'
+            f'Host: localhost\r\n{headers}\r\n'.encode()
+        )
+        status = await reader.readline()
+        self.assertIn(b'200', status)
+        while await reader.readline() != b'\r\n':
+            pass
+        return server, reader, writer
+
+    async def close(self, server, writer):
+        writer.close()
+        for _ in range(50):
+            if not server.hub.channels:
+                break
+            await asyncio.sleep(0.01)
+        self.assertEqual(server.hub.channels, {})
+        server.close()
+        await server.wait_closed()
+
+    def test_new_comment_is_pushed(self):
+        """Новый комментарий приходит подписчикам поста."""
+        async def scenario():
+            server, reader, writer = await self.stream()
+            await asyncio.sleep(0.1)
+            loop = asyncio.get_running_loop()
+            comment = await loop.run_in_executor(
+                None, lambda: Comment.objects.create(
+                    post=self.post, author=self.author, text='c'
+                )
+            )
+            await server.hub.poll_once()
+            event = await self.read_event(reader)
+            await self.close(server, writer)
+            return comment, event
+
+        comment, event = asyncio.run(scenario())
+        self.assertIn('event: comment', event)
+        self.assertIn(f'"comment": {comment.pk}', event)
+
+    def test_replay_after_reconnect(self):
+        """По Last-Event-ID досылаются пропущенные комментарии."""
+        first = Comment.objects.create(
+            post=self.post, author=self.author, text='first'
+        )
+        second = Comment.objects.create(
+            post=self.post, author=self.author, text='second'
+        )
+        seen = Change.objects.get(comment_id=first.pk).pk
+
+        async def scenario():
+            server, reader, writer = await self.stream(
+                f'Last-Event-ID: {seen}\r\n'
+            )
+            event = await self.read_event(reader)
+            await self.close(server, writer)
+            return event
+
+        event = asyncio.run(scenario())
+        self.assertIn(f'"comment": {second.pk}', event)
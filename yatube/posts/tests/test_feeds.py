@@ -0,0 +1,147 @@
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from posts.models import FeedItem, Follow, Post
+
+User = get_user_model()
+
+PAGE_OBJ = 'page_obj'
+
+
+class FollowFeedTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='author')
+        cls.reader = User.objects.create_user(username='reader')
+        cls.old_post = Post.objects.create(author=cls.author, text='old')
+
+    def setUp(self):
+        cache.clear()
+        self.reader_client = Client()
+        self.reader_client.force_login(self.reader)
+        self.FOLLOW_INDEX = reverse('posts:follow_index')
+
+    def feed(self):
+        response = self.reader_client.get(self.FOLLOW_INDEX)
+        return list(response.context[PAGE_OBJ])
+
+    def test_follow_backfills_feed(self):
+        """Подписка добавляет в ленту уже опубликованные посты автора."""
+        self.reader_client.get(
+            reverse('posts:profile_follow', args=[self.author.username])
+        )
+        self.assertEqual(self.feed(), [self.old_post])
+
+    def test_new_post_fanned_out(self):
+        """Новый пост раскладывается в ленты подписчиков."""
+        Follow.objects.create(user=self.reader, author=self.author)
+        post = Post.objects.create(author=self.author, text='new')
+        self.assertTrue(
+            FeedItem.objects.filter(user=self.reader, post=post).exists()
+        )
+        self.assertEqual(self.feed(), [post, self.old_post])
+
+    def test_unfollow_cleans_feed(self):
+        """Отписка убирает посты автора из ленты."""
+        Follow.objects.create(user=self.reader, author=self.author)
+        self.reader_client.get(
+            reverse('posts:profile_unfollow', args=[self.author.username])
+        )
+        self.assertFalse(FeedItem.objects.filter(user=self.reader).exists())
+        self.assertEqual(self.feed(), [])
+
+    @override_settings(FEED_FANOUT_LIMIT=0)
+    def test_pull_author(self):
+        """Посты популярного автора подмешиваются в ленту при чтении."""
+        Follow.objects.create(user=self.reader, author=self.author)
+        post = Post.objects.create(author=self.author, text='new')
+        self.assertFalse(FeedItem.objects.filter(user=self.reader).exists())
+        self.assertEqual(self.feed(), [post, self.old_post])
+
+    def test_rebuild_feeds(self):
+        """Команда rebuild_feeds восстанавливает ленты по подпискам."""
+        Follow.objects.create(user=self.reader, author=self.author)
+        FeedItem.objects.all().delete()
+        call_command('rebuild_feeds', stdout=StringIO())
+        self.assertEqual(self.feed(), [self.old_post])
+
+    def test_rebuild_reads_posts_per_author(self):
+        """Посты автора читаются один раз на всех его подписчиков."""
+        Follow.objects.create(user=self.reader, author=self.author)
+
+        def rebuild_queries():
+            with CaptureQueriesContext(connection) as queries:
+                call_command('rebuild_feeds', stdout=StringIO())
+            return len(queries)
+
+        one = rebuild_queries()
+        for i in range(5):
+            Follow.objects.create(
+                user=User.objects.create_user(username=f'r{i}'),
+                author=self.author,
+            )
+        self.assertEqual(rebuild_queries(), one)
+        self.assertEqual(
+            FeedItem.objects.filter(post=self.old_post).count(), 6
+        )
+
+    def test_cursor_pages(self):
+        """Курсоры листают ленту без пропусков и повторов даже при
+        одинаковых датах постов."""
+        Follow.objects.create(user=self.reader, author=self.author)
+        for i in range(14):
+            Post.objects.create(author=self.author, text=str(i))
+        now = timezone.now()
+        Post.objects.update(pub_date=now)
+        FeedItem.objects.update(pub_date=now)
+        first = self.reader_client.get(self.FOLLOW_INDEX).context[PAGE_OBJ]
+        cursor = first.paginator.next_cursor
+        second = self.reader_client.get(
+            self.FOLLOW_INDEX, {'before': cursor}
+        ).context[PAGE_OBJ]
+        self.assertTrue(second.has_previous())
+        self.assertFalse(second.has_next())
+        back = self.reader_client.get(
+            self.FOLLOW_INDEX, {'after': second.paginator.previous_cursor}
+        ).context[PAGE_OBJ]
+        self.assertEqual(list(back), list(first))
+        seen = [post.pk for post in first] + [post.pk for post in second]
+        self.assertEqual(
+            seen, list(Post.objects.values_list('pk', flat=True))
+        )
+
+    @override_settings(FEED_FANOUT_LIMIT=1)
+    def test_pull_author_mixed_with_fanned_out(self):
+        """Посты pull-авторов сливаются с разложенными по дате."""
+        other = User.objects.create_user(username='other')
+        Follow.objects.create(user=self.reader, author=other)
+        Follow.objects.create(user=self.reader, author=self.author)
+        Follow.objects.create(user=other, author=self.author)
+        pulled = Post.objects.create(author=self.author, text='pulled')
+        pushed = Post.objects.create(author=other, text='pushed')
+        self.assertFalse(FeedItem.objects.filter(post=pulled).exists())
+        self.assertEqual(self.feed(), [pushed, pulled, self.old_post])
+
+    @override_settings(FEED_FANOUT_LIMIT=1)
+    def test_author_back_under_limit_fanned_out(self):
+        """Автор, у которого подписчиков снова не больше лимита,
+        раскладывает посты, написанные без раскладки."""
+        other = User.objects.create_user(username='other')
+        Follow.objects.create(user=self.reader, author=self.author)
+        Follow.objects.create(user=other, author=self.author)
+        post = Post.objects.create(author=self.author, text='pulled')
+        self.assertFalse(FeedItem.objects.filter(post=post).exists())
+        Follow.objects.filter(user=other).delete()
+        self.assertTrue(
+            FeedItem.objects.filter(user=self.reader, post=post).exists()
+        )
+        self.assertEqual(self.feed(), [post, self.old_post])
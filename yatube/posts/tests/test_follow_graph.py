@@ -0,0 +1,116 @@
+from array import array
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection
+from django.test import Client, TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from posts import follow_graph
+from posts.models import Follow
+
+User = get_user_model()
+
+
+class FollowGraphTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='author')
+        cls.reader = User.objects.create_user(username='reader')
+        cls.other = User.objects.create_user(username='other')
+
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+        self.client.force_login(self.reader)
+
+    def test_answers_from_cache(self):
+        """После загрузки граф отвечает без запросов к базе."""
+        Follow.objects.create(user=self.reader, author=self.author)
+        Follow.objects.create(user=self.other, author=self.author)
+        cache.clear()
+        follow_graph.follows(self.reader.pk, self.author.pk)
+        follow_graph.counts(self.author.pk)
+        with CaptureQueriesContext(connection) as queries:
+            self.assertTrue(
+                follow_graph.follows(self.reader.pk, self.author.pk)
+            )
+            self.assertFalse(
+                follow_graph.follows(self.author.pk, self.reader.pk)
+            )
+            self.assertEqual(follow_graph.counts(self.author.pk), (2, 0))
+        self.assertEqual(len(queries), 0)
+
+    def test_follow_and_unfollow_update_graph(self):
+        """Подписка и отписка через страницы меняют граф."""
+        self.assertFalse(follow_graph.follows(self.reader.pk, self.author.pk))
+        self.client.get(
+            reverse('posts:profile_follow', args=[self.author.username])
+        )
+        self.assertTrue(follow_graph.follows(self.reader.pk, self.author.pk))
+        self.assertEqual(follow_graph.counts(self.author.pk), (1, 0))
+        self.assertEqual(follow_graph.counts(self.reader.pk), (0, 1))
+        self.client.get(
+            reverse('posts:profile_unfollow', args=[self.author.username])
+        )
+        self.assertFalse(follow_graph.follows(self.reader.pk, self.author.pk))
+        self.assertEqual(follow_graph.counts(self.author.pk), (0, 0))
+
+    def test_mutual(self):
+        Follow.objects.create(user=self.reader, author=self.author)
+        self.assertFalse(follow_graph.mutual(self.reader.pk, self.author.pk))
+        Follow.objects.create(user=self.author, author=self.reader)
+        self.assertTrue(follow_graph.mutual(self.reader.pk, self.author.pk))
+        self.assertTrue(follow_graph.mutual(self.author.pk, self.reader.pk))
+
+    def test_profile_shows_counts(self):
+        """Профиль показывает счётчики и обновляется после подписки
+        третьего пользователя."""
+        url = reverse('posts:profile', args=[self.author.username])
+        response = self.client.get(url)
+        self.assertContains(response, 'Подписчиков: 0, подписок: 0')
+        Follow.objects.create(user=self.other, author=self.author)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Подписчиков: 1, подписок: 0')
+
+    def test_profile_changes_with_author_follows(self):
+        """Подписки самого автора меняют счётчик и отметку «подписан
+        на вас» на его профиле."""
+        Follow.objects.create(user=self.reader, author=self.author)
+        url = reverse('posts:profile', args=[self.author.username])
+        response = self.client.get(url)
+        self.assertContains(response, 'подписок: 0')
+        self.assertNotContains(response, 'подписан на вас')
+        Follow.objects.create(user=self.author, author=self.reader)
+        Follow.objects.create(user=self.author, author=self.other)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'подписок: 2')
+        self.assertContains(response, 'подписан на вас')
+
+    def test_stale_load_does_not_hide_follow(self):
+        """Граф, прочитанный из базы до подписки и записанный в кеш
+        после неё, не прячет подписку."""
+        versions = follow_graph._versions([self.reader.pk])
+        Follow.objects.create(user=self.reader, author=self.author)
+        keys, _ = follow_graph._keys(self.reader.pk, versions)
+        cache.set(keys[follow_graph.FOLLOWING], array('q').tobytes())
+        self.assertTrue(follow_graph.follows(self.reader.pk, self.author.pk))
+
+    def test_profile_skips_followers_array(self):
+        """Профиль берёт счётчики автора, не читая его подписчиков."""
+        Follow.objects.create(user=self.other, author=self.author)
+        url = reverse('posts:profile', args=[self.author.username])
+        with mock.patch.object(
+            cache, 'get_many', wraps=cache.get_many
+        ) as get_many:
+            response = self.client.get(url)
+        self.assertContains(response, 'Подписчиков: 1, подписок: 0')
+        keys = [key for call in get_many.call_args_list for key in call[0][0]]
+        self.assertFalse(
+            [key for key in keys if key.startswith('follow_graph:followers')]
+        )
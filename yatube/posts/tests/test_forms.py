@@ -1,6 +1,9 @@
+import io
 import shutil
 import tempfile
 
+from PIL import Image
+
 from django.test import TestCase, Client, override_settings
 from django.conf import settings
 from django.contrib.auth import get_user_model
@@ -19,7 +22,7 @@ UPLOADED_NAME = 'small.gif'
 TEST = 'test'
 
 
-@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT, IMAGE_WORKERS=0)
 class PostCreateFormTests(TestCase):
     @classmethod
     def setUpClass(cls):
@@ -92,6 +95,52 @@ class PostCreateFormTests(TestCase):
         self.assertRedirects(response, self.PROFILE_REV)
         self.assertEqual(Post.objects.count(), post_count + 1)
 
+    @override_settings(IMAGE_WORKERS=0, IMAGE_MAX_SIZE=100)
+    def test_create_post_normalizes_image(self):
+        """Картинка поворачивается по EXIF, уменьшается и сохраняется
+        без метаданных."""
+        exif = Image.Exif()
+        exif[0x0112] = 6  # Orientation: повернуть на 90° по часовой
+        photo = io.BytesIO()
+        Image.new('RGB', (400, 200), 'red').save(
+            photo, 'JPEG', exif=exif.tobytes()
+        )
+        uploaded = SimpleUploadedFile(
+            name='photo.jpg',
+            content=photo.getvalue(),
+            content_type='image/jpeg'
+        )
+        self.authorized_client.post(
+            self.POST_CREATE_REV,
+            data={'text': 'photo', 'image': uploaded},
+        )
+        post = Post.objects.get(text='photo')
+        with Image.open(post.image.path) as image:
+            self.assertEqual(image.size, (50, 100))
+            self.assertEqual(len(image.getexif()), 0)
+
+    @override_settings(IMAGE_WORKERS=0)
+    def test_truncated_image_rejected(self):
+        """Обрезанная картинка даёт ошибку формы, а не 500."""
+        photo = io.BytesIO()
+        Image.effect_noise((400, 200), 64).convert('RGB').save(photo, 'JPEG')
+        data = photo.getvalue()
+        uploaded = SimpleUploadedFile(
+            name='broken.jpg',
+            content=data[:len(data) // 2],
+            content_type='image/jpeg'
+        )
+        response = self.authorized_client.post(
+            self.POST_CREATE_REV,
+            data={'text': 'broken', 'image': uploaded},
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertFormError(
+            response, 'form', 'image',
+            'Не удалось обработать изображение. Загрузите другой файл.'
+        )
+        self.assertFalse(Post.objects.filter(text='broken').exists())
+
     def test_edit_post(self):
         """Проверка редактирования постов."""
         post_count = Post.objects.filter(group=self.group.id).count()
@@ -0,0 +1,113 @@
+import datetime
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test import Client, TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from posts.models import Group, GroupStats, Post
+
+User = get_user_model()
+
+
+class GroupStatsTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.leo = User.objects.create_user(
+            username='leo', first_name='Лев', last_name='Толстой'
+        )
+        cls.anna = User.objects.create_user(username='anna')
+        cls.group = Group.objects.create(
+            title='Классика', slug='classic', description='test'
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+
+    def refresh(self, *args):
+        call_command('refresh_group_stats', *args, stdout=StringIO())
+        return GroupStats.objects.get(group=self.group)
+
+    def test_new_group_has_stats(self):
+        stats = GroupStats.objects.get(group=self.group)
+        self.assertIsNone(stats.last_post_at)
+        self.assertEqual(stats.top_authors, [])
+
+    def test_post_updates_last_post_and_marks_dirty(self):
+        """Публикация сразу сдвигает время последнего поста, а состав
+        авторов пересчитывается периодическим заданием."""
+        post = Post.objects.create(author=self.leo, text='a',
+                                   group=self.group)
+        stats = GroupStats.objects.get(group=self.group)
+        self.assertEqual(stats.last_post_at, post.pub_date)
+        self.assertTrue(stats.dirty)
+        stats = self.refresh()
+        self.assertFalse(stats.dirty)
+        self.assertEqual(stats.top_authors, [
+            {'username': 'leo', 'name': 'Лев Толстой', 'posts': 1}
+        ])
+
+    def test_top_authors_order(self):
+        for author, count in ((self.anna, 1), (self.leo, 3)):
+            for _ in range(count):
+                Post.objects.create(author=author, text='a',
+                                    group=self.group)
+        stats = self.refresh()
+        self.assertEqual(
+            [(a['username'], a['posts']) for a in stats.top_authors],
+            [('leo', 3), ('anna', 1)]
+        )
+
+    def test_delete_and_move_mark_dirty(self):
+        post = Post.objects.create(author=self.leo, text='a',
+                                   group=self.group)
+        self.refresh()
+        post.group = None
+        post.save()
+        self.assertTrue(GroupStats.objects.get(group=self.group).dirty)
+        stats = self.refresh()
+        self.assertIsNone(stats.last_post_at)
+        self.assertEqual(stats.top_authors, [])
+
+    def test_refresh_all_fills_missing_rows(self):
+        """--all создаёт строки для групп, загруженных bulk_create."""
+        Group.objects.bulk_create([
+            Group(title='bulk', slug='bulk', description='')
+        ])
+        bulk = Group.objects.get(slug='bulk')
+        Post.objects.bulk_create([
+            Post(author=self.anna, text='a', group=bulk,
+                 pub_date=datetime.datetime(2020, 1, 1,
+                                            tzinfo=datetime.timezone.utc))
+        ])
+        self.refresh('--all')
+        self.assertEqual(bulk.stats.top_authors[0]['username'], 'anna')
+
+    def test_directory_single_query(self):
+        """Каталог групп собирается одним запросом."""
+        for i in range(3):
+            group = Group.objects.create(
+                title=f'g{i}', slug=f'g{i}', description=''
+            )
+            Post.objects.create(author=self.leo, text='a', group=group)
+        self.refresh()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('posts:group_index'))
+        self.assertEqual(len(queries), 1)
+        self.assertEqual(len(response.context['groups']), 4)
+        self.assertContains(response, 'Лев Толстой')
+
+    def test_group_page_shows_stats(self):
+        Post.objects.create(author=self.leo, text='a', group=self.group)
+        self.refresh()
+        response = self.client.get(
+            reverse('posts:group_post', args=[self.group.slug])
+        )
+        self.assertContains(response, 'Самые активные авторы')
+        self.assertContains(response, 'Лев Толстой')
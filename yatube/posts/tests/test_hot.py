@@ -0,0 +1,92 @@
+import datetime
+import math
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.db import connection
+from django.test import Client, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from posts import hot
+from posts.models import Comment, HotPost, Post
+
+User = get_user_model()
+HOUR = datetime.timedelta(hours=1)
+
+
+@override_settings(HOT_DECAY_SECONDS=3600, HOT_MIN_SCORE=0.05)
+class HotPostsTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='auth')
+
+    def setUp(self):
+        self.client = Client()
+        self.posts = [
+            Post.objects.create(author=self.user, text=f'post {i}')
+            for i in range(3)
+        ]
+
+    def comment(self, post, count=1):
+        for _ in range(count):
+            Comment.objects.create(post=post, author=self.user, text='c')
+
+    def test_comments_update_rank(self):
+        """Каждый комментарий добавляет посту единицу счёта."""
+        self.comment(self.posts[0], 3)
+        rank = HotPost.objects.get(post=self.posts[0]).rank
+        self.assertAlmostEqual(hot.score(rank), 3, places=2)
+
+    def test_score_decays(self):
+        now = timezone.now()
+        rank = hot.logaddexp(hot.point(now - HOUR), hot.point(now))
+        self.assertAlmostEqual(hot.score(rank, now), 1 + math.exp(-1))
+
+    def test_feed_order_and_single_query(self):
+        """Лента упорядочена по счёту и читается одним запросом."""
+        self.comment(self.posts[1], 2)
+        self.comment(self.posts[2], 1)
+        with CaptureQueriesContext(connection) as queries:
+            posts = list(hot.top())
+        self.assertEqual(len(queries), 1)
+        self.assertEqual(posts, [self.posts[1], self.posts[2]])
+        response = self.client.get(reverse('posts:hot_index'))
+        self.assertContains(response, 'post 1')
+        self.assertNotContains(response, 'post 0')
+
+    def test_decay_removes_faded(self):
+        """Посты, счёт которых затух ниже HOT_MIN_SCORE, удаляются."""
+        self.comment(self.posts[0])
+        self.comment(self.posts[1], 2)
+        self.comment(self.posts[2], 3)
+        # Через три часа счёт 1 падает до 0.0498, через четыре
+        # счёт 2 — до 0.0366, а счёт 3 держится на 0.055.
+        self.assertEqual(hot.decay(1, now=timezone.now() + 3 * HOUR), 1)
+        self.assertEqual(hot.decay(1, now=timezone.now() + 4 * HOUR), 1)
+        self.assertEqual(list(HotPost.objects.values_list('post', flat=True)),
+                         [self.posts[2].pk])
+
+    @override_settings(HOT_TABLE_SIZE=2)
+    def test_decay_keeps_table_small(self):
+        for count, post in enumerate(self.posts, 1):
+            self.comment(post, count)
+        call_command('decay_hot_posts', stdout=StringIO())
+        self.assertEqual(
+            set(HotPost.objects.values_list('post', flat=True)),
+            {self.posts[1].pk, self.posts[2].pk}
+        )
+
+    def test_rebuild_matches_incremental(self):
+        """Пересборка по комментариям даёт те же ранги."""
+        self.comment(self.posts[0], 2)
+        self.comment(self.posts[1])
+        before = dict(HotPost.objects.values_list('post', 'rank'))
+        call_command('decay_hot_posts', '--rebuild', stdout=StringIO())
+        after = dict(HotPost.objects.values_list('post', 'rank'))
+        self.assertEqual(set(after), set(before))
+        for post_id, rank in before.items():
+            self.assertAlmostEqual(after[post_id], rank)
@@ -0,0 +1,118 @@
+import shutil
+import tempfile
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, Client, override_settings
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from posts import thumbnails
+from posts.models import Comment, Follow, Group, Post
+
+User = get_user_model()
+
+POSTS_ON_PAGE = 10
+SMALL_GIF = (
+    b'\x47\x49\x46\x38\x39\x61\x02\x00'
+    b'\x01\x00\x80\x00\x00\x00\x00\x00'
+    b'\xFF\xFF\xFF\x21\xF9\x04\x00\x00'
+    b'\x00\x00\x00\x2C\x00\x00\x00\x00'
+    b'\x02\x00\x01\x00\x00\x02\x02\x0C'
+    b'\x0A\x00\x3B'
+)
+
+
+@override_settings(QUERY_BUDGET_MODE='raise')
+class FeedQueriesTest(TestCase):
+    """Число запросов лент не зависит от количества постов на странице."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='author')
+        cls.reader = User.objects.create_user(username='reader')
+        cls.group = Group.objects.create(
+            title='test',
+            slug='test',
+            description='test',
+        )
+        Follow.objects.create(user=cls.reader, author=cls.author)
+        cls.post = Post.objects.create(
+            author=cls.author, text='test', group=cls.group
+        )
+        Comment.objects.create(post=cls.post, author=cls.reader, text='test')
+
+    def setUp(self):
+        self.reader_client = Client()
+        self.reader_client.force_login(self.reader)
+        self.pages = [
+            reverse('posts:index'),
+            reverse('posts:group_post', kwargs={'slug': self.group.slug}),
+            reverse('posts:profile', kwargs={'username': self.author}),
+            reverse('posts:follow_index'),
+            reverse('posts:post_detail', kwargs={'post_id': self.post.id}),
+        ]
+
+    def count_queries(self, page):
+        cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            self.reader_client.get(page)
+        return len(queries)
+
+    def test_constant_queries(self):
+        few = {page: self.count_queries(page) for page in self.pages}
+        for i in range(POSTS_ON_PAGE):
+            Post.objects.create(
+                author=self.author, text='test', group=self.group
+            )
+            Comment.objects.create(
+                post=self.post, author=self.author, text='test'
+            )
+        for page in self.pages:
+            with self.subTest(page=page):
+                self.assertEqual(self.count_queries(page), few[page])
+
+    @override_settings(FEED_FANOUT_LIMIT=0)
+    def test_pull_author_feed(self):
+        """Посты pull-автора подмешиваются в ленту подписок в пределах
+        её бюджета и без запросов на каждый пост."""
+        page = reverse('posts:follow_index')
+        few = self.count_queries(page)
+        for i in range(POSTS_ON_PAGE):
+            Post.objects.create(author=self.author, text='test')
+        response = self.reader_client.get(page)
+        self.assertEqual(len(response.context['page_obj']), POSTS_ON_PAGE)
+        self.assertEqual(self.count_queries(page), few)
+
+    def test_image_posts(self):
+        """Миниатюры карточек страницы проверяются одним запросом."""
+        media_root = tempfile.mkdtemp(dir=settings.BASE_DIR)
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        pages = [
+            reverse('posts:index'),
+            reverse('posts:group_post', kwargs={'slug': self.group.slug}),
+        ]
+
+        def image_posts(count):
+            posts = [
+                Post.objects.create(
+                    author=self.author, text='test', group=self.group,
+                    image=SimpleUploadedFile(
+                        f'small{i}.gif', SMALL_GIF, content_type='image/gif'
+                    ),
+                )
+                for i in range(count)
+            ]
+            thumbnails.generate([post.image.name for post in posts])
+
+        with self.settings(MEDIA_ROOT=media_root, IMAGE_WORKERS=0):
+            image_posts(1)
+            few = {page: self.count_queries(page) for page in pages}
+            image_posts(POSTS_ON_PAGE)
+            for page in pages:
+                with self.subTest(page=page):
+                    self.assertEqual(self.count_queries(page), few[page])
@@ -0,0 +1,196 @@
+import re
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection
+from django.test import Client, TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from posts.models import Comment, FeedItem, Follow, Group, Post
+
+User = get_user_model()
+
+FEED_TABLES = ('posts_post', 'posts_comment', 'posts_feeditem')
+# На PostgreSQL планировщик читает маленькие таблицы целиком, даже
+# если индекс есть: проверка имеет смысл только на заполненной базе.
+FILLER = 20000
+
+
+def explain(sql):
+    """План запроса одной строкой на узел."""
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute('EXPLAIN ' + sql)
+            return [row[0] for row in cursor.fetchall()]
+        cursor.execute('EXPLAIN QUERY PLAN ' + sql)
+        return [row[-1] for row in cursor.fetchall()]
+
+
+def aliases(sql):
+    """Таблицы под псевдонимами подзапросов и соединений: U0, T3."""
+    return dict(
+        (alias, table)
+        for table, alias in re.findall(r'"(\w+)" ([A-Z]\d+)\b', sql)
+    )
+
+
+def full_scans(plan, sql):
+    """Узлы плана, которые читают таблицу лент целиком или сортируют
+    всё, что прочитали."""
+    names = aliases(sql)
+    scans = []
+    for line in plan:
+        if connection.vendor == 'postgresql':
+            match = re.search(r'Seq Scan on (\w+)', line)
+            # Sort, но не Incremental Sort и не строка «Sort Key».
+            if re.search(r'(?:^|->)\s*Sort\b(?! Key)', line):
+                scans.append(line)
+        else:
+            # SQLite: «SCAN t» без USING INDEX — проход по всей таблице;
+            # проход по индексу в порядке ленты обрывается LIMIT.
+            match = re.search(r'\bSCAN (?:TABLE )?(\w+)$', line)
+            if 'USE TEMP B-TREE FOR ORDER BY' in line:
+                scans.append(line)
+        if match and names.get(match.group(1), match.group(1)) in FEED_TABLES:
+            scans.append(line)
+    return scans
+
+
+def uses_index(plan):
+    """План читает хотя бы один индекс."""
+    pattern = (r'Index (?:Only )?Scan' if connection.vendor == 'postgresql'
+               else r'USING (?:COVERING )?(?:INDEX|INTEGER PRIMARY KEY)')
+    return any(re.search(pattern, line) for line in plan)
+
+
+class FeedQueryPlansTest(TestCase):
+    """Запросы лент идут по индексам, а не полным проходом таблиц.
+
+    Проверяются планы всех SELECT, которые страницы лент выполняют
+    на самом деле, вместе с переходами по курсорам.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='author')
+        cls.reader = User.objects.create_user(username='reader')
+        cls.group = Group.objects.create(
+            title='test', slug='test', description='test'
+        )
+        Follow.objects.create(user=cls.reader, author=cls.author)
+        cls.posts = [
+            Post.objects.create(author=cls.author, text=f'post {i}',
+                                group=cls.group)
+            for i in range(25)
+        ]
+        for i in range(25):
+            Comment.objects.create(
+                post=cls.posts[-1], author=cls.reader, text=f'c {i}'
+            )
+        if connection.vendor == 'postgresql':
+            cls.fill()
+
+    @classmethod
+    def fill(cls):
+        """Чужие строки во всех таблицах лент и свежая статистика."""
+        other = User.objects.create_user(username='other')
+        group = Group.objects.create(
+            title='other', slug='other', description='other'
+        )
+        now = timezone.now()
+        posts = Post.objects.bulk_create(
+            Post(author=other, group=group, text='filler', pub_date=now,
+                 updated_at=now)
+            for _ in range(FILLER)
+        )
+        Comment.objects.bulk_create(
+            Comment(post=posts[0], author=other, text='filler')
+            for _ in range(FILLER)
+        )
+        FeedItem.objects.bulk_create(
+            FeedItem(user=other, post=post, author=other, pub_date=now)
+            for post in posts
+        )
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+        self.client.force_login(self.reader)
+
+    def feed_queries(self, url):
+        """SELECT-ы к таблицам лент при открытии страницы и соседних."""
+        selects = []
+        urls = [url]
+        while urls:
+            current = urls.pop()
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(current)
+            self.assertEqual(response.status_code, 200)
+            selects += [
+                query['sql'] for query in queries.captured_queries
+                if query['sql'].startswith('SELECT')
+                and any(table in query['sql'] for table in FEED_TABLES)
+            ]
+            page = response.context.get('page_obj')
+            paginator = getattr(page, 'paginator', None)
+            cursor = getattr(paginator, 'next_cursor', None)
+            # Переходы по курсорам — только с первой страницы.
+            if cursor and current == url and '?' not in url:
+                urls.append(f'{url}?before={cursor}')
+                urls.append(f'{url}?after={cursor}')
+        return selects
+
+    def assertIndexed(self, url):
+        selects = self.feed_queries(url)
+        self.assertTrue(selects)
+        for sql in selects:
+            with self.subTest(url=url, sql=sql):
+                plan = explain(sql)
+                self.assertEqual(full_scans(plan, sql), [], '\n'.join(plan))
+                self.assertTrue(uses_index(plan), '\n'.join(plan))
+
+    def test_index(self):
+        self.assertIndexed(reverse('posts:index'))
+
+    def test_group(self):
+        self.assertIndexed(reverse('posts:group_post', args=[self.group.slug]))
+
+    def test_profile(self):
+        self.assertIndexed(reverse('posts:profile', args=[self.author]))
+
+    def test_follow(self):
+        self.assertIndexed(reverse('posts:follow_index'))
+
+    def test_post_comments(self):
+        self.assertIndexed(
+            reverse('posts:post_detail', args=[self.posts[-1].pk])
+        )
+
+    def test_legacy_pages(self):
+        self.assertIndexed(reverse('posts:index') + '?page=2')
+        self.assertIndexed(reverse('posts:profile', args=[self.author])
+                           + '?page=2')
+
+
+class DeterministicOrderingTest(TestCase):
+    def test_same_date_posts_ordered_by_id(self):
+        """Посты с одной датой идут по убыванию id, и страницы не
+        теряют и не повторяют их."""
+        author = User.objects.create_user(username='author')
+        for i in range(15):
+            Post.objects.create(author=author, text=str(i))
+        Post.objects.update(pub_date=timezone.now())
+        ids = list(Post.objects.values_list('pk', flat=True))
+        self.assertEqual(ids, sorted(ids, reverse=True))
+        cache.clear()
+        first = self.client.get(reverse('posts:index'))
+        cursor = first.context['page_obj'].paginator.next_cursor
+        second = self.client.get(reverse('posts:index') + f'?before={cursor}')
+        seen = [post.pk for post in first.context['page_obj']]
+        seen += [post.pk for post in second.context['page_obj']]
+        self.assertEqual(seen, ids)
@@ -0,0 +1,98 @@
+from django.contrib.auth import get_user_model
+from django.test import TestCase, Client
+from django.urls import reverse
+
+from posts import search
+from posts.models import Comment, Post
+
+User = get_user_model()
+
+
+class SearchTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='auth')
+        cls.admin = User.objects.create_superuser(
+            username='admin', email='admin@example.com', password='admin'
+        )
+        cls.post = Post.objects.create(
+            author=cls.user,
+            text='Рыжий кот спит на подоконнике',
+        )
+        cls.post_2 = Post.objects.create(
+            author=cls.user,
+            text='Кот, ещё кот и снова кот',
+        )
+        cls.other = Post.objects.create(
+            author=cls.user,
+            text='Собака лает <b>громко</b>',
+        )
+        cls.comment = Comment.objects.create(
+            post=cls.other,
+            author=cls.user,
+            text='А кот молчит',
+        )
+
+    def setUp(self):
+        self.guest_client = Client()
+
+    def search(self, query, **params):
+        response = self.guest_client.get(
+            reverse('posts:post_search'), {'q': query, **params}
+        )
+        return [(hit.kind, hit.object_id)
+                for hit, post in response.context['results']]
+
+    def test_ranked_results(self):
+        """Находятся посты и комментарии, более релевантные — выше."""
+        self.assertEqual(self.search('кот'), [
+            (search.POST, self.post_2.pk),
+            (search.COMMENT, self.comment.pk),
+            (search.POST, self.post.pk),
+        ])
+        self.assertEqual(self.search('кот', kind='comment'),
+                         [(search.COMMENT, self.comment.pk)])
+        self.assertEqual(self.search('"OR'), [])
+
+    def test_snippet_highlighted_and_escaped(self):
+        """Совпадения подсвечены, а HTML из текста экранирован."""
+        response = self.guest_client.get(
+            reverse('posts:post_search'), {'q': 'громко'}
+        )
+        self.assertContains(
+            response, '&lt;b&gt;<mark>громко</mark>&lt;/b&gt;', html=False
+        )
+
+    def test_index_follows_changes(self):
+        """Индекс обновляется при правке и удалении."""
+        self.post.text = 'Рыжая лиса'
+        self.post.save()
+        self.assertEqual(self.search('лиса'), [(search.POST, self.post.pk)])
+        self.assertNotIn((search.POST, self.post.pk), self.search('кот'))
+        self.other.delete()
+        self.assertEqual(self.search('молчит'), [])
+        self.assertEqual(self.search('собака'), [])
+
+    def test_paginated(self):
+        """Результаты листаются по страницам с сохранением запроса."""
+        for i in range(12):
+            Post.objects.create(author=self.user, text=f'Пост про сыр {i}')
+        response = self.guest_client.get(
+            reverse('posts:post_search'), {'q': 'сыр'}
+        )
+        self.assertEqual(len(response.context['results']), 10)
+        self.assertContains(
+            response, '?q=%D1%81%D1%8B%D1%80&amp;kind=&amp;page=2'
+        )
+
+    def test_admin_search_uses_index(self):
+        """Поиск в админке идёт по индексу."""
+        client = Client()
+        client.force_login(self.admin)
+        response = client.get(
+            reverse('admin:posts_post_changelist'), {'q': 'подоконнике'}
+        )
+        self.assertEqual(
+            list(response.context['cl'].result_list), [self.post]
+        )
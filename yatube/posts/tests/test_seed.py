@@ -0,0 +1,53 @@
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.management import CommandError, call_command
+from django.db.models import Count, F
+from django.test import TestCase
+
+from posts.models import Comment, Follow, Group, Post
+
+User = get_user_model()
+
+
+class SeedTest(TestCase):
+    def test_seed(self):
+        """Данные создаются в заданных объёмах и с перекосом."""
+        out = StringIO()
+        call_command(
+            'seed', users=30, groups=3, posts=300, comments=200, follows=150,
+            batch_size=50, seed=1, stdout=out,
+        )
+        self.assertEqual(User.objects.count(), 30)
+        self.assertEqual(Group.objects.count(), 3)
+        self.assertEqual(Post.objects.count(), 300)
+        self.assertEqual(Comment.objects.count(), 200)
+        self.assertFalse(Follow.objects.filter(user=F('author')).exists())
+        per_author = sorted(
+            Post.objects.order_by().values('author').annotate(n=Count('pk'))
+            .values_list('n', flat=True),
+            reverse=True,
+        )
+        self.assertGreater(per_author[0], 3 * per_author[len(per_author) // 2])
+        # Даты постов идут вместе с id, комментарии — после поста.
+        dates = list(Post.objects.order_by('pk').values_list(
+            'pub_date', flat=True
+        ))
+        self.assertEqual(dates, sorted(dates))
+        self.assertFalse(
+            Comment.objects.filter(created__lt=F('post__pub_date')).exists()
+        )
+        self.assertEqual(
+            sum(Group.objects.values_list('posts_count', flat=True)),
+            Post.objects.exclude(group=None).count(),
+        )
+        self.assertIn('Готово.', out.getvalue())
+
+    def test_seed_checks_options(self):
+        """Посты без авторов и отрицательные объёмы — ошибка команды."""
+        for options in ({'users': 0, 'posts': 10}, {'comments': -1},
+                        {'batch_size': 0}):
+            with self.subTest(options=options):
+                with self.assertRaises(CommandError):
+                    call_command('seed', stdout=StringIO(), **options)
+        self.assertFalse(User.objects.exists())
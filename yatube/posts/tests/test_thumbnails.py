@@ -0,0 +1,89 @@
+import shutil
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from io import StringIO
+from unittest import mock
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import Client, TestCase, override_settings
+from django.urls import reverse
+
+from posts import thumbnails
+from posts.models import Post
+
+User = get_user_model()
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+SMALL_GIF = (
+    b'\x47\x49\x46\x38\x39\x61\x02\x00'
+    b'\x01\x00\x80\x00\x00\x00\x00\x00'
+    b'\xFF\xFF\xFF\x21\xF9\x04\x00\x00'
+    b'\x00\x00\x00\x2C\x00\x00\x00\x00'
+    b'\x02\x00\x01\x00\x00\x02\x02\x0C'
+    b'\x0A\x00\x3B'
+)
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT, IMAGE_WORKERS=0)
+class ThumbnailsTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='auth')
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+        self.post = Post.objects.create(
+            author=self.user,
+            text='test',
+            image=SimpleUploadedFile('small.gif', SMALL_GIF, 'image/gif'),
+        )
+
+    def test_original_until_thumbnail_ready(self):
+        """Пока миниатюры нет, показывается оригинал, а миниатюра
+        ставится в очередь и попадает в ленту после готовности."""
+        self.assertIsNone(thumbnails.ready_thumbnail(self.post.image, 'card'))
+        response = self.client.get(reverse('posts:index'))
+        self.assertContains(response, self.post.image.url)
+        thumbnail = thumbnails.ready_thumbnail(self.post.image, 'card')
+        self.assertIsNotNone(thumbnail)
+        response = self.client.get(reverse('posts:index'))
+        self.assertContains(response, thumbnail.url)
+        self.assertNotContains(response, self.post.image.url)
+        webp = thumbnails.ready_thumbnail(self.post.image, 'card_webp')
+        self.assertContains(response, f'srcset="{webp.url}"')
+
+    @override_settings(IMAGE_WORKERS=1)
+    def test_pool_result_registered_by_request(self):
+        """Дорисованную пулом миниатюру регистрирует следующий запрос,
+        а не поток обратных вызовов пула; пул пишет в текущий
+        MEDIA_ROOT."""
+        with ThreadPoolExecutor(1) as executor, mock.patch.object(
+            thumbnails, 'get_executor', return_value=executor
+        ):
+            thumbnails.schedule(self.post.image.name).result()
+        self.assertTrue(thumbnails.missing(self.post.image.name))
+        self.client.get(reverse('posts:index'))
+        self.assertFalse(thumbnails.missing(self.post.image.name))
+
+    def test_generate_thumbnails_command(self):
+        """Команда создаёт недостающие миниатюры."""
+        out = StringIO()
+        call_command('generate_thumbnails', stdout=out)
+        self.assertFalse(thumbnails.missing(self.post.image.name))
+        self.assertIn('созданы миниатюры: 1', out.getvalue())
+
+    def test_broken_image_is_not_fatal(self):
+        """Битая картинка не ломает страницу: остаётся оригинал."""
+        Post.objects.filter(pk=self.post.pk).update(image='posts/none.gif')
+        response = self.client.get(reverse('posts:index'))
+        self.assertContains(response, '/media/posts/none.gif')
@@ -0,0 +1,114 @@
+import json
+import os
+import tempfile
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.test import TestCase
+
+from core import ratelimit, routers
+from posts import cards, feed_cache
+from posts.models import Comment, FeedItem, Follow, Group, Post
+
+User = get_user_model()
+
+
+class TransferTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='auth')
+        cls.reader = User.objects.create_user(username='reader')
+        cls.group = Group.objects.create(
+            title='test',
+            slug='test',
+            description='test',
+        )
+        for i in range(5):
+            Post.objects.create(
+                author=cls.user,
+                text=f'post {i}',
+                group=cls.group if i % 2 else None,
+            )
+        cls.post = Post.objects.first()
+        Comment.objects.create(post=cls.post, author=cls.reader, text='c')
+        Follow.objects.create(user=cls.reader, author=cls.user)
+
+    def setUp(self):
+        handle, self.path = tempfile.mkstemp(suffix='.ndjson')
+        os.close(handle)
+
+    def tearDown(self):
+        os.remove(self.path)
+
+    def snapshot(self):
+        return {
+            'posts': list(Post.objects.order_by('pk').values_list(
+                'pk', 'text', 'pub_date', 'author__username', 'group__slug'
+            )),
+            'comments': list(Comment.objects.values_list(
+                'pk', 'post', 'author__username', 'text', 'created'
+            )),
+            'follows': list(Follow.objects.values_list(
+                'user__username', 'author__username'
+            )),
+        }
+
+    def test_export_import_round_trip(self):
+        """Выгрузка и загрузка восстанавливают данные с датами."""
+        call_command('export_ndjson', self.path, stderr=StringIO())
+        with open(self.path, encoding='utf-8') as lines:
+            models = [json.loads(line)['model'] for line in lines]
+        self.assertEqual(models, ['group'] + ['post'] * 5 + ['comment',
+                                                             'follow'])
+        before = self.snapshot()
+        Post.objects.all().delete()
+        Group.objects.all().delete()
+        User.objects.filter(username='reader').delete()
+        out = StringIO()
+        call_command('import_ndjson', self.path, batch_size=2, stdout=out)
+        self.assertEqual(self.snapshot(), before)
+        self.assertIn('Загрузка завершена.', out.getvalue())
+        # Счётчики и ленты пересобраны после bulk_create.
+        self.assertEqual(Group.objects.get().posts_count, 2)
+        self.assertEqual(Post.objects.get(pk=self.post.pk).comments_count, 1)
+        self.assertEqual(FeedItem.objects.count(), 5)
+
+    def test_import_is_repeatable(self):
+        """Повторная загрузка не создаёт дубликатов."""
+        call_command('export_ndjson', self.path, stderr=StringIO())
+        before = self.snapshot()
+        call_command('import_ndjson', self.path, stdout=StringIO())
+        self.assertEqual(self.snapshot(), before)
+
+    def test_import_keeps_unrelated_cache(self):
+        """После загрузки устаревают ленты и карточки, а корзины лимитов
+        и отметки реплик остаются."""
+        call_command('export_ndjson', self.path, stderr=StringIO())
+        bucket = ratelimit.BUCKET_KEY.format('add_comment', 'user', 1)
+        cache.set(bucket, 1)
+        routers.pin(self.user.pk)
+        versions = feed_cache.get_versions(['index'])
+        card = cards.card_key(self.post)
+        call_command('import_ndjson', self.path, stdout=StringIO())
+        self.assertEqual(cache.get(bucket), 1)
+        self.assertTrue(routers.is_pinned(self.user.pk))
+        self.assertNotEqual(feed_cache.get_versions(['index']), versions)
+        self.assertNotEqual(
+            cards.card_key(Post.objects.get(pk=self.post.pk)), card
+        )
+
+    def test_import_stops_on_foreign_id(self):
+        """Пост файла с id чужого поста останавливает загрузку, а не
+        пропускается с переездом его комментариев на чужой пост."""
+        call_command('export_ndjson', self.path, stderr=StringIO())
+        Comment.objects.all().delete()
+        Post.objects.filter(pk=self.post.pk).delete()
+        other = Post.objects.create(author=self.reader, text='other')
+        Post.objects.filter(pk=other.pk).update(id=self.post.pk)
+        with self.assertRaisesMessage(CommandError, str(self.post.pk)):
+            call_command('import_ndjson', self.path, stdout=StringIO())
+        self.assertFalse(Comment.objects.exists())
+        self.assertEqual(Post.objects.get(pk=self.post.pk).text, 'other')
@@ -1,15 +1,23 @@
 import shutil
 import tempfile
+import time
+from unittest import mock
 
 from django.contrib.auth import get_user_model
-from django.test import TestCase, Client, override_settings
+from django.db import transaction
+from django.test import (TestCase, TransactionTestCase, Client,
+                         override_settings)
 from django.urls import reverse
 from django import forms
 from django.core.cache import cache
 from django.conf import settings
 from django.core.files.uploadedfile import SimpleUploadedFile
+from django.utils.encoding import force_bytes
+from django.utils.http import urlsafe_base64_encode
 
-from posts.models import Group, Post, Follow
+from posts import feed_cache, thumbnails
+from posts.models import Comment, Group, Post, Follow
+from posts.views import COMMENTS_LIMIT
 
 User = get_user_model()
 TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
@@ -19,9 +27,10 @@ ALL_POST_PAG = 13
 FIRST_PAGE_PAG = 10
 SEC_PAGE_PAG = 3
 NAME_IMAGE = 'posts/small.gif'
+ALL_COMMENTS = COMMENTS_LIMIT + 5
 
 
-@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT, IMAGE_WORKERS=0)
 class PostViewTest(TestCase):
     @classmethod
     def setUpClass(cls):
@@ -52,6 +61,9 @@ class PostViewTest(TestCase):
             image=uploaded,
             group=cls.group
         )
+        # Миниатюры готовы заранее: иначе их генерация после первого
+        # запроса теста сбрасывает карточки поста.
+        thumbnails.generate([cls.post.image.name])
 
     @classmethod
     def tearDownClass(cls):
@@ -59,6 +71,7 @@ class PostViewTest(TestCase):
         shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
 
     def setUp(self):
+        cache.clear()
         # Создаем неавторизованный клиент
         self.guest_client = Client()
         # Создаем авторизованый клиент
@@ -187,6 +200,7 @@ class PostViewTest(TestCase):
         """Тест для проверки кеширования главной страницы."""
         response = self.authorized_client.get(self.INDEX_REV)
         first_cache = response.content
+        Post.objects.filter(pk=self.post.pk).update(text='changed')
         response = self.authorized_client.get(self.INDEX_REV)
         second_cache = response.content
         cache.clear()
@@ -195,6 +209,33 @@ class PostViewTest(TestCase):
         self.assertEqual(first_cache, second_cache)
         self.assertNotEqual(first_cache, third_cache)
 
+    def test_cache_invalidated_on_write(self):
+        """Новый пост сразу сбрасывает кеш затронутых лент."""
+        pages = [
+            self.INDEX_REV,
+            self.GROUP_POST_REV,
+            self.PROFILE_REV,
+        ]
+        for page in pages:
+            self.authorized_client.get(page)
+        Post.objects.create(author=self.user, text='fresh', group=self.group)
+        for page in pages:
+            with self.subTest(page=page):
+                response = self.authorized_client.get(page)
+                self.assertContains(response, 'fresh')
+
+    def test_cache_is_page_aware(self):
+        """Разные страницы ленты кешируются под разными ключами."""
+        Post.objects.bulk_create([
+            Post(author=self.user, text=f'post {i}') for i in range(10)
+        ])
+        first_page = self.authorized_client.get(self.INDEX_REV)
+        second_page = self.authorized_client.get(self.INDEX_REV, {
+            'before': first_page.context[PAGE_OBJ].paginator.next_cursor
+        })
+        self.assertContains(second_page, f'/posts/{self.post.id}/')
+        self.assertNotContains(first_page, f'/posts/{self.post.id}/')
+
     # Проверка подписки/отписки
     def test_follow(self):
         """Авторизованный пользователь может подписываться на других
@@ -288,3 +329,254 @@ class PaginatorViewsTest(TestCase):
             with self.subTest(page=page):
                 response = self.client.get(page + '?page=2')
         self.assertEqual(len(response.context[PAGE_OBJ]), SEC_PAGE_PAG)
+
+
+# Проверка курсорной пагинации
+class CursorPaginatorViewsTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='auth3')
+        Post.objects.bulk_create([Post(
+            author=cls.user,
+            text='test',
+        ) for i in range(ALL_POST_PAG)
+        ])
+
+    def setUp(self):
+        self.INDEX_REV = reverse('posts:index')
+
+    def test_cursor_pages(self):
+        """Курсоры листают ленту вперёд и назад без пропусков."""
+        first_page = self.client.get(self.INDEX_REV).context[PAGE_OBJ]
+        self.assertEqual(len(first_page), FIRST_PAGE_PAG)
+        self.assertFalse(first_page.has_previous())
+        second_page = self.client.get(
+            self.INDEX_REV, {'before': first_page.paginator.next_cursor}
+        ).context[PAGE_OBJ]
+        self.assertEqual(len(second_page), SEC_PAGE_PAG)
+        self.assertFalse(second_page.has_next())
+        self.assertTrue(second_page.has_previous())
+        back_page = self.client.get(
+            self.INDEX_REV, {'after': second_page.paginator.previous_cursor}
+        ).context[PAGE_OBJ]
+        self.assertEqual(list(back_page), list(first_page))
+
+    def test_cursor_stable_with_new_posts(self):
+        """Новые посты не сдвигают границу уже открытой страницы."""
+        first_page = self.client.get(self.INDEX_REV).context[PAGE_OBJ]
+        Post.objects.create(author=self.user, text='new')
+        second_page = self.client.get(
+            self.INDEX_REV, {'before': first_page.paginator.next_cursor}
+        ).context[PAGE_OBJ]
+        self.assertEqual(len(second_page), SEC_PAGE_PAG)
+        self.assertFalse(set(first_page) & set(second_page))
+
+    def test_cursor_jump_to_date(self):
+        """Переход к дате показывает посты не позже этой даты."""
+        response = self.client.get(self.INDEX_REV, {'date': '2000-01-01'})
+        self.assertEqual(len(response.context[PAGE_OBJ]), FIRST_PAGE_PAG)
+        post = Post.objects.first()
+        Post.objects.filter(pk=post.pk).update(
+            pub_date=post.pub_date.replace(year=2000, month=1, day=1)
+        )
+        response = self.client.get(self.INDEX_REV, {'date': '2000-01-01'})
+        self.assertEqual(list(response.context[PAGE_OBJ]), [post])
+
+    def test_jump_to_last_date(self):
+        """Последний день календаря не ломает страницу."""
+        response = self.client.get(self.INDEX_REV, {'date': '9999-12-31'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.context[PAGE_OBJ]), FIRST_PAGE_PAG)
+
+    def test_broken_cursor(self):
+        """Битый курсор отдаёт первую страницу."""
+        response = self.client.get(self.INDEX_REV, {'before': 'broken'})
+        self.assertEqual(len(response.context[PAGE_OBJ]), FIRST_PAGE_PAG)
+
+    def test_cursor_id_out_of_range(self):
+        """id больше, чем влезает в колонку, — тоже битый курсор."""
+        cursor = urlsafe_base64_encode(
+            force_bytes('2022-01-01T00:00:00+00:00|' + '9' * 30)
+        )
+        for param in ('before', 'after'):
+            with self.subTest(param=param):
+                response = self.client.get(self.INDEX_REV, {param: cursor})
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(
+                    len(response.context[PAGE_OBJ]), FIRST_PAGE_PAG
+                )
+
+
+# Проверка постраничной загрузки комментариев
+class CommentsPaginationTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='auth4')
+        cls.post = Post.objects.create(author=cls.user, text='test')
+        Comment.objects.bulk_create([
+            Comment(post=cls.post, author=cls.user, text=f'comment {i}')
+            for i in range(ALL_COMMENTS)
+        ])
+
+    def setUp(self):
+        self.POST_DETAIL_REV = reverse('posts:post_detail',
+                                       kwargs={'post_id': self.post.id})
+        self.COMMENTS_REV = reverse('posts:post_comments',
+                                    kwargs={'post_id': self.post.id})
+
+    def test_post_detail_first_comments(self):
+        """На странице поста только первая пачка комментариев."""
+        response = self.client.get(self.POST_DETAIL_REV)
+        comments = response.context['comments']
+        self.assertEqual(len(comments), COMMENTS_LIMIT)
+        self.assertEqual(comments[0].text, 'comment 0')
+        self.assertIsNotNone(response.context['comments_next'])
+
+    def test_next_comments_fragment(self):
+        """Следующая пачка отдаётся HTML-фрагментом и в JSON."""
+        response = self.client.get(self.POST_DETAIL_REV)
+        cursor = response.context['comments_next']
+        response = self.client.get(self.COMMENTS_REV, {'after': cursor})
+        self.assertTemplateUsed(response, 'includes/comments.html')
+        self.assertEqual(
+            len(response.context['comments']), ALL_COMMENTS - COMMENTS_LIMIT
+        )
+        self.assertIsNone(response.context['comments_next'])
+        response = self.client.get(
+            self.COMMENTS_REV, {'after': cursor, 'format': 'json'}
+        )
+        data = response.json()
+        self.assertEqual(data['comments'][0]['text'],
+                         f'comment {COMMENTS_LIMIT}')
+        self.assertIsNone(data['next'])
+
+    def test_cursor_id_out_of_range(self):
+        cursor = urlsafe_base64_encode(
+            force_bytes('2022-01-01T00:00:00+00:00|' + '9' * 30)
+        )
+        response = self.client.get(self.COMMENTS_REV, {'after': cursor})
+        self.assertEqual(len(response.context['comments']), COMMENTS_LIMIT)
+
+
+class ConditionalGetTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='auth')
+        cls.reader = User.objects.create_user(username='reader')
+        cls.group = Group.objects.create(
+            title='test',
+            slug='test',
+            description='test',
+        )
+        cls.post = Post.objects.create(
+            author=cls.user,
+            text='test',
+            group=cls.group,
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.guest_client = Client()
+        self.authorized_client = Client()
+        self.authorized_client.force_login(self.reader)
+        self.urls = (
+            reverse('posts:index'),
+            reverse('posts:group_post', kwargs={'slug': self.group.slug}),
+            reverse('posts:profile', kwargs={'username': self.user}),
+            reverse('posts:post_detail', kwargs={'post_id': self.post.id}),
+        )
+
+    def assertNotModified(self, client, url, etag):
+        response = client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304, url)
+
+    def test_unchanged_pages_not_modified(self):
+        """Неизменившиеся страницы отдаются ответом 304."""
+        for url in self.urls:
+            with self.subTest(url=url):
+                response = self.guest_client.get(url)
+                self.assertIn('Cookie', response['Vary'])
+                self.assertNotModified(
+                    self.guest_client, url, response['ETag']
+                )
+
+    def test_new_comment_changes_pages(self):
+        """Новый комментарий меняет валидаторы всех страниц поста."""
+        etags = {url: self.guest_client.get(url)['ETag'] for url in self.urls}
+        Comment.objects.create(post=self.post, author=self.user, text='c')
+        for url, etag in etags.items():
+            with self.subTest(url=url):
+                response = self.guest_client.get(url, HTTP_IF_NONE_MATCH=etag)
+                self.assertEqual(response.status_code, 200)
+
+    def test_group_edit_changes_group_page(self):
+        """Правка описания группы меняет валидатор её страницы."""
+        url = reverse('posts:group_post', kwargs={'slug': self.group.slug})
+        etag = self.guest_client.get(url)['ETag']
+        self.group.description = 'new description'
+        self.group.save()
+        response = self.guest_client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertContains(response, 'new description')
+
+    @override_settings(DATABASE_REPLICAS=['replica1'],
+                       REPLICA_PIN_SECONDS=10)
+    def test_versions_change_after_replica_lag(self):
+        """С репликами версия после записи сменяется ещё раз, когда
+        реплики её догнали, и дальше не меняется."""
+        feed_cache.bump(['index'])
+        written = feed_cache.get_versions(['index'])
+        now = time.time()
+        with mock.patch.object(feed_cache.time, 'time',
+                               return_value=now + 11):
+            settled = feed_cache.get_versions(['index'])
+            self.assertEqual(feed_cache.get_versions(['index']), settled)
+        self.assertNotEqual(settled, written)
+
+    def test_validator_depends_on_user(self):
+        """У вошедшего пользователя свой валидатор и приватный кеш."""
+        url = reverse('posts:index')
+        anonymous = self.guest_client.get(url)
+        response = self.authorized_client.get(
+            url, HTTP_IF_NONE_MATCH=anonymous['ETag']
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('private', response['Cache-Control'])
+
+    def test_follow_changes_profile(self):
+        """Подписка меняет страницу профиля для подписчика."""
+        url = reverse('posts:profile', kwargs={'username': self.user})
+        etag = self.authorized_client.get(url)['ETag']
+        self.authorized_client.get(
+            reverse('posts:profile_follow', kwargs={'username': self.user})
+        )
+        response = self.authorized_client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.context['following'])
+
+
+class VersionsOnCommitTest(TransactionTestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='auth')
+
+    def test_versions_change_after_commit(self):
+        """Версия, прочитанная до фиксации записи, после неё уже
+        не действует: иначе ETag остался бы при старой странице."""
+        post = Post.objects.create(author=self.user, text='test')
+        feeds = ['index', f'profile:{self.user.pk}']
+        for write in (
+            lambda: Comment.objects.create(
+                post=post, author=self.user, text='c'
+            ),
+            lambda: Post.objects.create(author=self.user, text='new'),
+        ):
+            with transaction.atomic():
+                write()
+                before_commit = feed_cache.get_versions(feeds)
+            self.assertFalse(
+                set(feed_cache.get_versions(feeds).items())
+                & set(before_commit.items())
+            )
@@ -0,0 +1,223 @@
+"""Фоновая генерация миниатюр картинок постов.
+
+Миниатюры всех пресетов из THUMBNAIL_PRESETS рисуются в пуле процессов
+(работа Pillow упирается в CPU) сразу после сохранения картинки.
+Процессы пула только пишут файлы миниатюр, а регистрирует их в
+хранилище sorl-thumbnail основной процесс, поэтому воркерам пула не
+нужна база данных. Регистрация идёт в потоке запроса или команды, а не
+в потоке обратных вызовов пула: готовые картинки копятся в очереди, и
+её разбирает следующий запрос воркера (register_finished). Пока
+миниатюра не готова, шаблоны показывают оригинал картинки.
+
+Готовность миниатюр страницы проверяется одним обращением к кешу и
+одним запросом к базе (prefetch), а не запросом на картинку и пресет.
+"""
+import logging
+import queue
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.storage import FileSystemStorage
+from sorl.thumbnail import default, get_thumbnail
+from sorl.thumbnail.conf import defaults as sorl_defaults
+from sorl.thumbnail.conf import settings as sorl_settings
+from sorl.thumbnail.images import ImageFile, deserialize_image_file
+from sorl.thumbnail.kvstores.base import add_prefix
+from sorl.thumbnail.kvstores.cached_db_kvstore import (
+    EMPTY_VALUE, KVStore as CachedDBKVStore)
+from sorl.thumbnail.models import KVStore
+
+from .images import get_executor
+
+logger = logging.getLogger(__name__)
+
+PENDING_KEY = 'thumbnail_pending:{}'
+PENDING_TIMEOUT = 60 * 5
+
+# Картинки, дорисованные пулом, но ещё не зарегистрированные.
+_finished = queue.SimpleQueue()
+
+
+def thumbnail_options(source, options):
+    """Параметры миниатюры с учётом умолчаний, как в get_thumbnail()."""
+    backend = default.backend
+    options = dict(options)
+    if sorl_settings.THUMBNAIL_PRESERVE_FORMAT:
+        options.setdefault('format', backend._get_format(source))
+    for key, value in backend.default_options.items():
+        options.setdefault(key, value)
+    for key, attr in backend.extra_options:
+        value = getattr(sorl_settings, attr)
+        if value != getattr(sorl_defaults, attr):
+            options.setdefault(key, value)
+    return options
+
+
+def thumbnail_file(source, preset, storage=None):
+    geometry, options = settings.THUMBNAIL_PRESETS[preset]
+    options = thumbnail_options(source, options)
+    name = default.backend._get_thumbnail_filename(source, geometry, options)
+    return ImageFile(name, storage or default.storage), geometry, options
+
+
+def ready_thumbnail(image, preset):
+    """Готовая миниатюра или None; без генерации на время запроса."""
+    prefetched = getattr(image, '_ready_thumbnails', {})
+    if preset in prefetched:
+        return prefetched[preset]
+    thumbnail, geometry, options = thumbnail_file(ImageFile(image), preset)
+    return default.kvstore.get(thumbnail)
+
+
+def prefetch(images):
+    """Загружает готовность миниатюр всех пресетов для пачки картинок.
+
+    Ответ запоминается на самих картинках и берётся ready_thumbnail().
+    Промахи кешируются так же, как в kvstore sorl-thumbnail: до
+    register() картинка без миниатюр не стоит запроса к базе.
+    """
+    kvstore = default.kvstore
+    if not isinstance(kvstore, CachedDBKVStore):
+        return
+    wanted = {}
+    for image in images:
+        if not image:
+            continue
+        source = ImageFile(image)
+        for preset in settings.THUMBNAIL_PRESETS:
+            thumbnail = thumbnail_file(source, preset)[0]
+            wanted[add_prefix(thumbnail.key)] = (image, preset)
+    if not wanted:
+        return
+    values = kvstore.cache.get_many(wanted)
+    missing = [key for key in wanted if key not in values]
+    if missing:
+        found = dict(
+            KVStore.objects.filter(key__in=missing)
+            .values_list('key', 'value')
+        )
+        fetched = {key: found.get(key, EMPTY_VALUE) for key in missing}
+        kvstore.cache.set_many(
+            fetched, sorl_settings.THUMBNAIL_CACHE_TIMEOUT
+        )
+        values.update(fetched)
+    for key, (image, preset) in wanted.items():
+        value = values[key]
+        if not hasattr(image, '_ready_thumbnails'):
+            image._ready_thumbnails = {}
+        image._ready_thumbnails[preset] = (
+            None if value == EMPTY_VALUE or not value
+            else deserialize_image_file(value)
+        )
+
+
+def render(name, media_root=None):
+    """Рисует файлы миниатюр картинки. Выполняется в процессе пула.
+
+    MEDIA_ROOT передаётся из основного процесса: пул запускается один
+    раз, и переопределения настроек после этого (например, в тестах)
+    до его процессов не доходят.
+    """
+    storage = None
+    if media_root is not None and media_root != settings.MEDIA_ROOT:
+        storage = FileSystemStorage(location=media_root)
+    source = ImageFile(name, storage or default.storage)
+    for preset in settings.THUMBNAIL_PRESETS:
+        thumbnail, geometry, options = thumbnail_file(source, preset, storage)
+        if thumbnail.exists():
+            continue
+        image = default.engine.get_image(source)
+        try:
+            options['image_info'] = default.engine.get_image_info(image)
+            default.backend._create_thumbnail(
+                image, geometry, options, thumbnail
+            )
+        finally:
+            default.engine.cleanup(image)
+
+
+def register(name):
+    """Записывает готовые файлы в хранилище sorl-thumbnail и сбрасывает
+    карточки и ленты, в которых картинка пока показана оригиналом."""
+    from . import cards, feed_cache
+    from .models import Post
+
+    for geometry, options in settings.THUMBNAIL_PRESETS.values():
+        get_thumbnail(name, geometry, **options)
+    cache.delete(PENDING_KEY.format(name))
+    posts = Post.objects.filter(image=name)
+    cards.touch(posts)
+    feed_cache.bump(
+        [f'post:{pk}' for pk in posts.values_list('pk', flat=True)]
+    )
+
+
+def missing(name):
+    """True, если хотя бы одной миниатюры картинки ещё нет."""
+    return any(
+        ready_thumbnail(name, preset) is None
+        for preset in settings.THUMBNAIL_PRESETS
+    )
+
+
+def generate(names):
+    """Создаёт миниатюры пачки картинок и ждёт окончания работы.
+
+    Возвращает число картинок, для которых это не удалось.
+    """
+    if settings.IMAGE_WORKERS:
+        futures = [
+            get_executor().submit(render, name, settings.MEDIA_ROOT)
+            for name in names
+        ]
+    else:
+        futures = [None] * len(names)
+    failed = 0
+    for name, future in zip(names, futures):
+        failed += not _finish(name, future)
+    return failed
+
+
+def _finish(name, future=None):
+    try:
+        if future is None:
+            render(name)
+        else:
+            future.result()
+        register(name)
+    except Exception:
+        logger.exception('Не удалось создать миниатюры для %s', name)
+        cache.delete(PENDING_KEY.format(name))
+        return False
+    return True
+
+
+def schedule(name):
+    """Ставит генерацию миниатюр картинки в очередь пула.
+
+    Повторные вызовы для той же картинки, пока задача в работе,
+    ничего не делают. При IMAGE_WORKERS = 0 миниатюры создаются
+    сразу, в текущем процессе.
+    """
+    if not cache.add(PENDING_KEY.format(name), True, PENDING_TIMEOUT):
+        return None
+    if not settings.IMAGE_WORKERS:
+        _finish(name)
+        return None
+    future = get_executor().submit(render, name, settings.MEDIA_ROOT)
+    future.add_done_callback(lambda future: _finished.put((name, future)))
+    return future
+
+
+def register_finished():
+    """Регистрирует картинки, дорисованные пулом с прошлого вызова.
+
+    Вызывается в начале каждого запроса (сигнал request_started), то
+    есть в потоке, которому принадлежат соединение с базой и кеши.
+    """
+    while True:
+        try:
+            name, future = _finished.get_nowait()
+        except queue.Empty:
+            return
+        _finish(name, future)
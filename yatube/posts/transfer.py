@@ -0,0 +1,325 @@
+"""Перенос групп, постов, комментариев и подписок в формате NDJSON.
+
+Каждая строка — один объект: {"model": "post", ...}. Пользователи и
+группы записываются по username и slug, посты и комментарии — со своими
+id, чтобы комментарии ссылались на посты без таблицы соответствия.
+Поэтому загрузка рассчитана на пустую базу или на повтор той же
+выгрузки: пост или комментарий с тем же id, но другим автором или датой
+останавливает её с ImportConflict, а не пропускается молча. Выгрузка
+идёт по порядку зависимостей (группы, посты, комментарии, подписки),
+поэтому загрузка проходит файл один раз.
+
+Чтение и запись идут пачками, в памяти держится только текущая пачка
+и словари пользователей и групп.
+"""
+import datetime
+import json
+import time
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.management import call_command
+from django.core.management.color import no_style
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connection
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from . import feed_cache
+from .models import Comment, Follow, Group, Post
+
+User = get_user_model()
+
+MODELS = ('group', 'post', 'comment', 'follow')
+
+EXPORT_FIELDS = {
+    'group': (Group, {
+        'slug': 'slug',
+        'title': 'title',
+        'description': 'description',
+    }),
+    'post': (Post, {
+        'id': 'id',
+        'text': 'text',
+        'pub_date': 'pub_date',
+        'author': 'author__username',
+        'group': 'group__slug',
+        'image': 'image',
+    }),
+    'comment': (Comment, {
+        'id': 'id',
+        'post': 'post_id',
+        'author': 'author__username',
+        'text': 'text',
+        'created': 'created',
+    }),
+    'follow': (Follow, {
+        'user': 'user__username',
+        'author': 'author__username',
+    }),
+}
+
+
+class Encoder(DjangoJSONEncoder):
+    """Даты с микросекундами: DjangoJSONEncoder обрезает их до
+    миллисекунд, и повторная загрузка сдвинула бы курсоры лент."""
+
+    def default(self, o):
+        if isinstance(o, datetime.datetime):
+            return o.isoformat()
+        return super().default(o)
+
+
+class Progress:
+    """Счётчик строк со скоростью для вывода по ходу работы."""
+
+    def __init__(self, write, every):
+        self.write = write
+        self.every = every
+        self.started = time.monotonic()
+        self.counts = {}
+
+    def add(self, model, count=1):
+        before = self.counts.get(model, 0)
+        self.counts[model] = before + count
+        if before // self.every != self.counts[model] // self.every:
+            self.report(model)
+
+    def report(self, model):
+        elapsed = time.monotonic() - self.started
+        total = sum(self.counts.values())
+        self.write(
+            f'{model}: {self.counts[model]}, '
+            f'всего {total} за {elapsed:.1f} с '
+            f'({total / max(elapsed, 1e-6):.0f} строк/с)'
+        )
+
+
+def export(out, models, chunk_size, progress):
+    """Пишет объекты моделей в out построчно."""
+    encoder = Encoder(ensure_ascii=False)
+    for model in MODELS:
+        if model not in models:
+            continue
+        model_class, fields = EXPORT_FIELDS[model]
+        names = list(fields)
+        rows = (
+            model_class.objects.order_by('pk')
+            .values_list(*fields.values())
+            .iterator(chunk_size=chunk_size)
+        )
+        for row in rows:
+            record = {'model': model, **dict(zip(names, row))}
+            out.write(encoder.encode(record))
+            out.write('\n')
+            progress.add(model)
+
+
+class ImportConflict(Exception):
+    """Объект из файла занял бы id другого объекта базы."""
+
+
+def insert(model, objs):
+    """Вставляет объекты пачками с датами из файла.
+
+    Как loaddata (save_base(raw=True)), поля не вызывают pre_save, и
+    auto_now_add не подменяет даты. Сами поля модели не меняются, так что
+    сохранения в других потоках процесса работают как обычно.
+    """
+    fields = model._meta.concrete_fields
+    if objs and objs[0].pk is None:
+        # Без id, как в bulk_create: их выдаёт база.
+        fields = [f for f in fields if f is not model._meta.auto_field]
+    size = max(connection.ops.bulk_batch_size(fields, objs), 1)
+    for start in range(0, len(objs), size):
+        model.objects._insert(objs[start:start + size], fields, raw=True)
+
+
+def new_records(model, batch, fields, identity):
+    """Записи пачки, которых ещё нет в базе.
+
+    Объект с тем же id уже загружен, если его поля fields совпадают с
+    identity(record); иначе id занят чужим объектом, и загрузка
+    останавливается.
+    """
+    existing = {
+        row[0]: row[1:] for row in model.objects.filter(
+            pk__in=[record['id'] for record in batch]
+        ).values_list('pk', *fields)
+    }
+    for record in batch:
+        if record['id'] not in existing:
+            continue
+        if existing[record['id']] != identity(record):
+            raise ImportConflict(
+                f'{model._meta.verbose_name} с id {record["id"]} уже есть '
+                f'в базе и не совпадает с файлом'
+            )
+    return [record for record in batch if record['id'] not in existing]
+
+
+class Importer:
+    """Загружает записи пачками.
+
+    Уже загруженные объекты (тот же id с теми же автором и датой, slug
+    или пара подписки) пропускаются, поэтому загрузку можно повторить
+    после сбоя.
+    """
+
+    def __init__(self, batch_size, progress):
+        self.batch_size = batch_size
+        self.progress = progress
+        self.users = dict(User.objects.values_list('username', 'pk'))
+        self.groups = dict(Group.objects.values_list('slug', 'pk'))
+        self.model = None
+        self.batch = []
+        self.skipped = 0
+
+    def add(self, record):
+        model = record.pop('model')
+        if model not in EXPORT_FIELDS:
+            raise ValueError(f'Неизвестная модель: {model}')
+        if model != self.model or len(self.batch) >= self.batch_size:
+            self.flush()
+            self.model = model
+        self.batch.append(record)
+
+    def flush(self):
+        if not self.batch:
+            return
+        getattr(self, f'_load_{self.model}')(self.batch)
+        self.progress.add(self.model, len(self.batch))
+        self.batch = []
+
+    def finish(self):
+        self.flush()
+        self._reset_sequences()
+
+    def _user_ids(self, usernames):
+        """id пользователей; отсутствующие создаются без пароля."""
+        missing = set(usernames) - set(self.users)
+        if missing:
+            password = make_password(None)
+            User.objects.bulk_create(
+                [User(username=name, password=password) for name in missing],
+                ignore_conflicts=True,
+            )
+            self.users.update(
+                User.objects.filter(username__in=missing)
+                .values_list('username', 'pk')
+            )
+        return self.users
+
+    def _load_group(self, batch):
+        Group.objects.bulk_create(
+            [
+                Group(slug=record['slug'], title=record['title'],
+                      description=record['description'])
+                for record in batch if record['slug'] not in self.groups
+            ],
+            ignore_conflicts=True,
+        )
+        self.groups.update(
+            Group.objects.filter(slug__in=[r['slug'] for r in batch])
+            .values_list('slug', 'pk')
+        )
+
+    def _load_post(self, batch):
+        users = self._user_ids(record['author'] for record in batch)
+        for record in batch:
+            record['author_id'] = users[record['author']]
+            record['pub_date'] = parse_datetime(record['pub_date'])
+        batch = new_records(
+            Post, batch, ('author_id', 'pub_date'),
+            lambda record: (record['author_id'], record['pub_date'])
+        )
+        now = timezone.now()
+        insert(Post, [
+            Post(
+                pk=record['id'],
+                text=record['text'],
+                pub_date=record['pub_date'],
+                # Версия карточки: время загрузки, как у auto_now.
+                updated_at=now,
+                author_id=record['author_id'],
+                group_id=self.groups.get(record['group']),
+                image=record['image'] or '',
+            )
+            for record in batch
+        ])
+
+    def _load_comment(self, batch):
+        users = self._user_ids(record['author'] for record in batch)
+        posts = set(
+            Post.objects.filter(pk__in={r['post'] for r in batch})
+            .values_list('pk', flat=True)
+        )
+        comments = [record for record in batch if record['post'] in posts]
+        self.skipped += len(batch) - len(comments)
+        for record in comments:
+            record['author_id'] = users[record['author']]
+            record['created'] = parse_datetime(record['created'])
+        comments = new_records(
+            Comment, comments, ('post_id', 'author_id', 'created'),
+            lambda record: (
+                record['post'], record['author_id'], record['created']
+            )
+        )
+        insert(Comment, [
+            Comment(
+                pk=record['id'],
+                post_id=record['post'],
+                author_id=record['author_id'],
+                text=record['text'],
+                created=record['created'],
+            )
+            for record in comments
+        ])
+
+    def _load_follow(self, batch):
+        users = self._user_ids(
+            name for record in batch
+            for name in (record['user'], record['author'])
+        )
+        Follow.objects.bulk_create(
+            [
+                Follow(user_id=users[record['user']],
+                       author_id=users[record['author']])
+                for record in batch if record['user'] != record['author']
+            ],
+            ignore_conflicts=True,
+        )
+
+    def _reset_sequences(self):
+        """Явные id не двигают последовательности PostgreSQL."""
+        sql = connection.ops.sequence_reset_sql(no_style(), [Post, Comment])
+        if sql:
+            with connection.cursor() as cursor:
+                for statement in sql:
+                    cursor.execute(statement)
+
+
+def load(lines, batch_size, progress):
+    importer = Importer(batch_size, progress)
+    for line in lines:
+        line = line.strip()
+        if line:
+            importer.add(json.loads(line))
+    importer.finish()
+    return importer
+
+
+def rebuild_derived(stdout):
+    """Пересобирает то, что обычно поддерживают сигналы: bulk_create
+    их не посылает."""
+    call_command('reconcile_counters', stdout=stdout)
+    call_command('rebuild_feeds', stdout=stdout)
+    call_command('rebuild_search_index', stdout=stdout)
+    call_command('refresh_group_stats', all=True, stdout=stdout)
+    call_command('decay_hot_posts', rebuild=True, stdout=stdout)
+    # Не cache.clear(): в кеше и сессии с ещё не записанными изменениями,
+    # корзины лимитов и отметки реплик. Карточки устаревают по updated_at
+    # постов (см. cards), ленты и граф подписок — со сменой поколения
+    # версий.
+    Post.objects.update(updated_at=timezone.now())
+    feed_cache.bump_all()
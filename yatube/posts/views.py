@@ -1,71 +1,228 @@
+from functools import partial
+
 from django.core.paginator import Paginator
+from django.http import Http404, JsonResponse, QueryDict
 from django.shortcuts import render, get_object_or_404, redirect
 from django.contrib.auth import get_user_model
 from django.contrib.auth.decorators import login_required
 
-from .models import Post, Group, Follow
+from core.queries import query_budget
+from core.ratelimit import rate_limit
+from core.routers import primary_reads
+
+from . import cards, feed_cache, follow_graph, hot, search, thumbnails
+from .models import Comment, Post, Group, Follow
 from .forms import PostForm, CommentForm
+from .feeds import FollowPaginator, follow_feed, pulled_authors
+from .paginators import CursorPaginator, next_batch
 
 LIMIT = 10
+COMMENTS_LIMIT = 20
 User = get_user_model()
 
 
-def get_paginator(post_list, request):
-    paginator = Paginator(post_list, LIMIT)
+def get_paginator(post_list, request, paginator_class=CursorPaginator):
+    """По умолчанию лента листается курсорами (before/after/date),
+    старые ссылки вида ?page=N обслуживает обычный Paginator."""
     page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    if page_number is not None:
+        page_obj = Paginator(post_list, LIMIT).get_page(page_number)
+    else:
+        page_obj = paginator_class(post_list, LIMIT).get_page(
+            before=request.GET.get('before'),
+            after=request.GET.get('after'),
+            date=request.GET.get('date'),
+        )
     return {
         'page_obj': page_obj
     }
 
 
+def get_comments(post_id, request):
+    """Очередная пачка комментариев поста после курсора ?after=."""
+    comments = Comment.objects.filter(post=post_id).select_related('author')
+    comments, next_cursor = next_batch(
+        comments, 'created', request.GET.get('after'), COMMENTS_LIMIT
+    )
+    return {
+        'comments': comments,
+        'comments_next': next_cursor,
+    }
+
+
+def group_feeds(request, slug):
+    # Группа со сводкой нужна и валидатору, и самой странице: она
+    # запоминается в запросе, чтобы не читать её дважды.
+    request.feed_group = Group.objects.select_related('stats').filter(
+        slug=slug
+    ).first()
+    return [f'group:{getattr(request.feed_group, "pk", None)}']
+
+
+def profile_feeds(request, username):
+    author_id = User.objects.filter(username=username).values_list(
+        'pk', flat=True
+    ).first()
+    # Подписчики и подписки автора — в счётчиках, его подписки —
+    # ещё и в отметке «подписан на вас».
+    feeds = [
+        f'profile:{author_id}', f'followers:{author_id}',
+        f'follows:{author_id}',
+    ]
+    if request.user.is_authenticated:
+        # Кнопка подписки на странице зависит от подписок зрителя.
+        feeds.append(f'follows:{request.user.pk}')
+    return feeds
+
+
+def post_detail_feeds(request, post_id):
+    # Имя автора, число его постов и название группы на странице
+    # меняются вместе с лентами профиля и группы.
+    post = Post.objects.filter(pk=post_id).values(
+        'author_id', 'group_id'
+    ).first() or {}
+    return [
+        f'post:{post_id}',
+        f'profile:{post.get("author_id")}',
+        f'group:{post.get("group_id")}',
+    ]
+
+
+@query_budget(4)
+@feed_cache.conditional(lambda request: ['index'])
 def index(request) -> str:
-    context = get_paginator(Post.objects.select_related('group'), request)
+    posts = Post.objects.select_related('author', 'group')
+    context = get_paginator(posts, request)
+    context['fragment'] = cards.fragment('index', context['page_obj'])
     return render(request, 'posts/index.html', context)
 
 
+@query_budget(5)
+@feed_cache.conditional(group_feeds)
 def group_post(request, slug) -> str:
-    group = get_object_or_404(Group, slug=slug)
+    group = request.feed_group
+    if group is None:
+        raise Http404
     template = 'posts/group_list.html'
-    context = {
-        'group': group,
-    }
-    context.update(get_paginator(group.posts.all(), request))
+    context = {'group': group}
+    posts = group.posts.select_related('author')
+    context.update(get_paginator(posts, request))
+    context['fragment'] = cards.fragment('group', context['page_obj'])
     return render(request, template, context)
 
 
+@query_budget(1)
+def hot_index(request) -> str:
+    """Популярное: первые посты рейтинга по свежим комментариям."""
+    return render(request, 'posts/hot.html', {'posts': hot.top()})
+
+
+@query_budget(1)
+def group_index(request) -> str:
+    """Каталог групп со сводками: один запрос на любое число постов."""
+    groups = Group.objects.select_related('stats').order_by(
+        '-posts_count', 'title'
+    )
+    return render(request, 'posts/group_index.html', {'groups': groups})
+
+
+@query_budget(7)
+@feed_cache.conditional(profile_feeds)
 def profile(request, username) -> str:
-    author = get_object_or_404(User, username=username)
-    follow_check = Follow.objects.filter(
-        user=request.user.id,
-        author=author,
+    author = get_object_or_404(
+        User.objects.select_related('author_stats'), username=username
+    )
+    # Массив подписчиков автора не нужен: хватает его счётчиков.
+    graph = follow_graph.Graph.load(
+        [request.user.pk, author.pk], sides=(follow_graph.FOLLOWING,),
+        counts=[author.pk]
     )
     following = (
         request.user.is_authenticated
         and request.user != author
-        and follow_check.exists()
+        and graph.follows(request.user.pk, author.pk)
     )
+    followers_count, following_count = graph.counts(author.pk)
     context = {
         'author': author,
-        'following': following
+        'following': following,
+        'mutual': following and graph.follows(author.pk, request.user.pk),
+        'followers_count': followers_count,
+        'following_count': following_count,
     }
-    context.update(get_paginator(author.posts.all(), request))
+    posts = author.posts.select_related('group')
+    context.update(get_paginator(posts, request))
+    context['fragment'] = cards.fragment('profile', context['page_obj'])
     return render(request, 'posts/profile.html', context)
 
 
+@query_budget(6)
+@feed_cache.conditional(post_detail_feeds)
 def post_detail(request, post_id) -> str:
-    post = get_object_or_404(Post, pk=post_id)
+    post = get_object_or_404(
+        Post.objects.select_related('author__author_stats', 'group'),
+        pk=post_id
+    )
+    thumbnails.prefetch([post.image])
     form = CommentForm()
-    comments = post.comments.all()
     context = {
         'post': post,
         'form': form,
-        'comments': comments,
     }
+    context.update(get_comments(post.pk, request))
     return render(request, 'posts/post_detail.html', context)
 
 
+@query_budget(4)
+def post_comments(request, post_id):
+    post = get_object_or_404(Post.objects.only('pk'), pk=post_id)
+    context = get_comments(post.pk, request)
+    if request.GET.get('format') == 'json':
+        return JsonResponse({
+            'comments': [
+                {
+                    'id': comment.pk,
+                    'author': comment.author.username,
+                    'text': comment.text,
+                    'created': comment.created,
+                }
+                for comment in context['comments']
+            ],
+            'next': context['comments_next'],
+        })
+    context['post'] = post
+    return render(request, 'includes/comments.html', context)
+
+
+@query_budget(5)
+def post_search(request):
+    query = request.GET.get('q', '').strip()
+    kind = request.GET.get('kind')
+    if kind not in search.KINDS:
+        kind = None
+    page_obj = Paginator(search.Results(query, kind), LIMIT).get_page(
+        request.GET.get('page')
+    )
+    posts = Post.objects.select_related('author', 'group').in_bulk(
+        {hit.post_id for hit in page_obj}
+    )
+    params = QueryDict(mutable=True)
+    params.update({'q': query, 'kind': kind or ''})
+    context = {
+        'query': query,
+        'kind': kind,
+        'page_obj': page_obj,
+        'results': [
+            (hit, posts[hit.post_id])
+            for hit in page_obj if hit.post_id in posts
+        ],
+        'page_query': params.urlencode() + '&',
+    }
+    return render(request, 'posts/search.html', context)
+
+
 @login_required
+@rate_limit('post_create')
 def post_create(request) -> str:
     form = PostForm(request.POST or None, files=request.FILES or None)
     if request.method == 'POST':
@@ -103,6 +260,7 @@ def post_edit(request, post_id) -> str:
 
 
 @login_required
+@rate_limit('add_comment')
 def add_comment(request, post_id):
     post = get_object_or_404(Post, id=post_id)
     form = CommentForm(request.POST or None)
@@ -115,14 +273,24 @@ def add_comment(request, post_id):
 
 
 @login_required
+@query_budget(7)
 def follow_index(request):
-    authors_posts = Follow.objects.values("author").filter(user=request.user)
-    context = get_paginator(Post.objects.filter(author__in=authors_posts),
-                            request)
+    # С pull-авторами: их список (раз в PULL_AUTHORS_TIMEOUT), подписки
+    # на них и диапазон их постов рядом с диапазоном FeedItem.
+    pulled = pulled_authors(request.user)
+    posts = follow_feed(request.user, pulled).select_related(
+        'author', 'group'
+    )
+    context = get_paginator(posts, request, partial(
+        FollowPaginator, user=request.user, pulled=pulled
+    ))
+    context['fragment'] = cards.fragment('follow', context['page_obj'])
     return render(request, 'posts/follow.html', context)
 
 
 @login_required
+@rate_limit('profile_follow', methods=None)
+@primary_reads
 def profile_follow(request, username):
     author = get_object_or_404(User, username=username)
     if request.user != author:
@@ -134,6 +302,7 @@ def profile_follow(request, username):
 
 
 @login_required
+@primary_reads
 def profile_unfollow(request, username):
     author = get_object_or_404(User, username=username)
     Follow.objects.get(
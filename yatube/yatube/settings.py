@@ -11,6 +11,7 @@ https://docs.djangoproject.com/en/2.2/ref/settings/
 """
 from dotenv import load_dotenv
 import os
+import tempfile
 import sentry_sdk
 from sentry_sdk.integrations.django import DjangoIntegration
 
@@ -43,6 +44,7 @@ INSTALLED_APPS = [
     'core.apps.CoreConfig',
     'users.apps.UsersConfig',
     'posts.apps.PostsConfig',
+    'api.apps.ApiConfig',
     'django.contrib.admin',
     'django.contrib.auth',
     'django.contrib.contenttypes',
@@ -53,11 +55,14 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'core.queries.QueryBudgetMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'core.timing.ServerTimingMiddleware',
+    'core.routers.ReplicaMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -98,10 +103,47 @@ DATABASES = {
     }
 }
 
+# Реплики только для чтения (см. core/routers.py): в DB_REPLICAS через
+# запятую хосты PostgreSQL, для SQLite — пути к файлам. В тестах
+# реплики — зеркала тестовой основной базы.
+DATABASE_REPLICAS = []
+REPLICA_KEY = (
+    'NAME' if DATABASES['default']['ENGINE'].endswith('sqlite3') else 'HOST'
+)
+for number, value in enumerate(
+    filter(None, os.getenv('DB_REPLICAS', '').split(',')), 1
+):
+    alias = f'replica{number}'
+    DATABASES[alias] = {
+        **DATABASES['default'],
+        REPLICA_KEY: value.strip(),
+        'TEST': {'MIRROR': 'default'},
+    }
+    DATABASE_REPLICAS.append(alias)
+DATABASE_ROUTERS = ['core.routers.ReplicaRouter']
+# Приложения, чьи модели в GET-запросах читаются с реплик.
+REPLICA_APPS = ['posts', 'auth']
+# Сколько секунд после записи пользователь читает с основной базы и
+# через сколько версии лент сменяются ещё раз (posts/feed_cache.py);
+# должно быть больше обычного отставания реплик.
+REPLICA_PIN_SECONDS = int(os.getenv('REPLICA_PIN_SECONDS', 10))
+
 
 # Password validation
 # https://docs.djangoproject.com/en/2.2/ref/settings/#auth-password-validators
 
+# Сессии и пользователь читаются из кеша (см. core/sessions.py и
+# core/auth.py); в базу сессия пишется не чаще раза в
+# SESSION_WRITE_BEHIND секунд. ModelBackend оставлен для сессий,
+# созданных до включения кеша.
+SESSION_ENGINE = 'core.sessions'
+SESSION_WRITE_BEHIND = 60 * 5
+AUTHENTICATION_BACKENDS = [
+    'core.auth.CachedModelBackend',
+    'django.contrib.auth.backends.ModelBackend',
+]
+AUTH_USER_CACHE_TIMEOUT = 60 * 60
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator',
@@ -156,12 +198,123 @@ CSRF_FAILURE_VIEW = 'core.views.csrf_failure'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Бюджеты SQL-запросов view: 'off', 'warn' (в лог) или 'raise'.
+QUERY_BUDGET_MODE = os.getenv('QUERY_BUDGET_MODE', 'warn')
+# Сколько одинаковых по форме запросов считать признаком N+1.
+QUERY_REPEAT_THRESHOLD = 5
+
+# L1 в памяти воркера поверх общего для всех воркеров файлового L2.
+# MAX_ENTRIES — предел живых ключей L2 (см. core/cache.py): версии
+# лент, карточки постов, графы подписок и пользователи. Состояние,
+# потеря которого заметна пользователям (сессии, корзины ограничения
+# частоты, закрепление за основной базой), перечислено в KEEP_PREFIXES:
+# оно не вытесняется, удаляются только истёкшие ключи.
+CACHE_LOCATION = os.getenv(
+    'CACHE_LOCATION', os.path.join(tempfile.gettempdir(), 'yatube_cache')
+)
 CACHES = {
     'default': {
-        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
-    }
+        'BACKEND': 'core.cache.TieredCache',
+        'LOCATION': CACHE_LOCATION,
+        'OPTIONS': {
+            'L1_MAX_ENTRIES': 1000,
+            'L1_TIMEOUT': 60,
+            'MAX_ENTRIES': int(os.getenv('CACHE_MAX_ENTRIES', 200000)),
+            'CULL_FREQUENCY': 10,
+            'CULL_EVERY': 1000,
+            'KEEP_PREFIXES': [
+                'django.contrib.sessions.cached_db', 'core.sessions.',
+                'ratelimit:', 'db_pin:',
+            ],
+        },
+    },
+}
+
+# Фрагменты лент сбрасываются сменой версии при записи, поэтому могут
+# жить долго.
+FEED_CACHE_TIMEOUT = 60 * 60 * 24
+# Карточки постов кешируются под ключом с updated_at поста.
+POST_CARD_TIMEOUT = 60 * 60 * 24 * 7
+
+# Картинки постов: число процессов, которые обрабатывают загрузки и
+# рисуют миниатюры (0 — всё делается в текущем процессе), предельный
+# размер большей стороны и качество перекодирования.
+IMAGE_WORKERS = int(os.getenv('IMAGE_WORKERS', 2))
+IMAGE_MAX_SIZE = 2048
+IMAGE_QUALITY = 85
+IMAGE_PROCESS_TIMEOUT = 30
+
+# Пресеты миниатюр для шаблонов; WebP отдаётся браузерам, которые его
+# понимают.
+THUMBNAIL_PRESETS = {
+    'card': ('960x339', {'crop': 'center', 'upscale': True}),
+    'card_webp': (
+        '960x339', {'crop': 'center', 'upscale': True, 'format': 'WEBP'}
+    ),
 }
 
+# Полнотекстовый поиск: конфигурация морфологии PostgreSQL и сколько
+# лучших совпадений учитывает поиск в админке.
+SEARCH_CONFIG = 'russian'
+SEARCH_ADMIN_LIMIT = 1000
+
+# JSON API: размер страницы по умолчанию и наибольший ?limit=.
+API_PAGE_SIZE = 20
+API_MAX_PAGE_SIZE = 100
+
+# Журнал изменений лент: сколько секунд ждать, пока изменение
+# устоится, и сколько дней хранить записи (см. posts/changes.py).
+CHANGES_SETTLE_SECONDS = 2
+CHANGES_RETENTION_DAYS = 30
+
+# Поток событий (команда run_events): как часто читать журнал и сколько
+# изменений за раз, раз во сколько секунд слать клиенту пустое событие,
+# длина очереди медленного клиента и сколько пропущенных изменений
+# досылать при переподключении.
+EVENTS_POLL_INTERVAL = 1
+EVENTS_POLL_LIMIT = 1000
+EVENTS_HEARTBEAT = 15
+EVENTS_QUEUE_SIZE = 100
+EVENTS_REPLAY_LIMIT = 500
+
+# Сколько самых медленных запросов процесса показывать сотрудникам.
+SLOW_REQUESTS_SIZE = 50
+
+# Граф подписок в кеше хранится под версиями, которые меняют подписка и
+# отписка; срок жизни лишь ограничивает память под неактивных
+# пользователей и старые версии.
+FOLLOW_GRAPH_TIMEOUT = 60 * 60 * 24
+
+# Сколько самых активных авторов показывать в каталоге групп.
+GROUP_TOP_AUTHORS = 3
+
+# Популярное: за сколько секунд вес комментария падает в e раз, ниже
+# какого счёта пост выпадает из рейтинга, сколько постов хранить в
+# таблице рейтинга и сколько показывать в ленте.
+HOT_DECAY_SECONDS = 60 * 60 * 6
+HOT_MIN_SCORE = 0.05
+HOT_TABLE_SIZE = 1000
+HOT_FEED_SIZE = 30
+
+# Ограничение частоты записей (см. core/ratelimit.py): по имени view —
+# корзины на пользователя и на IP, (ёмкость, секунд до полного
+# наполнения). IP берётся из REMOTE_ADDR; за прокси в RATE_LIMIT_IP_META
+# задаётся заголовок, который он выставляет (nginx: proxy_set_header
+# X-Real-IP $remote_addr -> HTTP_X_REAL_IP). Без прокси заголовок
+# подделывается клиентом, поэтому по умолчанию не читается.
+RATE_LIMITS = {
+    'post_create': {'user': (10, 60 * 60), 'ip': (30, 60 * 60)},
+    'add_comment': {'user': (20, 60 * 10), 'ip': (60, 60 * 10)},
+    'profile_follow': {'user': (30, 60 * 60), 'ip': (100, 60 * 60)},
+}
+RATE_LIMIT_IP_META = os.getenv('RATE_LIMIT_IP_META', '')
+
+# Лента подписок: посты авторов, у которых подписчиков больше
+# FEED_FANOUT_LIMIT, не раскладываются по лентам, а подмешиваются при чтении.
+FEED_FANOUT_LIMIT = 1000
+# Сколько последних постов автора попадает в ленту при подписке.
+FEED_BACKFILL_SIZE = 100
+
 sentry_sdk.init(
     dsn="https://ca9f400aa21148fb85a6020572e3b16b@o4504803503308800.ingest.sentry.io/4504803505537024", 
     integrations=[DjangoIntegration()],
@@ -18,11 +18,15 @@ from django.urls import include, path
 from django.conf import settings
 from django.conf.urls.static import static
 
+from core.views import slow_requests
+
 urlpatterns = [
     path('about/', include('about.urls', namespace='about')),
     path('auth/', include('users.urls', namespace='users')),
     path('auth/', include('django.contrib.auth.urls')),
+    path('api/', include('api.urls', namespace='api')),
     path('', include('posts.urls')),
+    path('admin/slow-requests/', slow_requests, name='slow_requests'),
     path('admin/', admin.site.urls),
 ]
 